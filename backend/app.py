@@ -1,5 +1,6 @@
-import os, io, time, base64, json
-from flask import Flask, request, jsonify, send_from_directory
+import os, io, re, time, base64, json, functools, threading, zlib
+from collections import OrderedDict
+from flask import Flask, Response, request, jsonify, send_from_directory, stream_with_context
 from flask_cors import CORS
 from PIL import Image
 import requests
@@ -7,7 +8,9 @@ import secrets
 import hashlib
 
 # Import database and blockchain sync
-from database import CapsuleDatabase
+from database import CapsuleDatabase, normalize_address
+from serialization import format_capsule, dumps
+from event_stream import EventHub, EventServer
 from blockchain_sync import BlockchainSyncService
 
 # Import private config
@@ -39,12 +42,21 @@ except ImportError:
 SHUTTER_API_BASE   = "https://shutter-api.chiado.staging.shutter.network/api"
 SHUTTER_REGISTRY   = os.getenv("SHUTTER_REGISTRY_ADDRESS", "0x2693a4Fb363AdD4356e6b80Ac5A27fF05FeA6D9F")
 ONE_YEAR_SECONDS   = 365 * 24 * 60 * 60
+FRONTEND_ORIGIN    = os.getenv("FRONTEND_ORIGIN", "http://localhost:8080")
+EVENTS_HOST        = os.getenv("EVENTS_HOST", "127.0.0.1")
+EVENTS_PORT        = int(os.getenv("EVENTS_PORT", "5002"))
+# Where browsers reach the stream; set it when a proxy serves /api/events on the app's own origin
+EVENTS_URL         = os.getenv("EVENTS_URL", f"http://localhost:{EVENTS_PORT}/api/events")
 
 app = Flask(__name__, static_folder="../frontend", static_url_path="/")
-CORS(app, origins=["http://localhost:8080"])                               # allow the JS frontend (http://localhost:8080)
+CORS(app, origins=[FRONTEND_ORIGIN])                                       # allow the JS frontend (http://localhost:8080 by default)
 
 # Initialize database
 db = CapsuleDatabase("capsules.db")
+# Live capsule_created / capsule_revealed / capsule_removed feed, woken by the database writer's commits
+event_hub = EventHub(db)
+# Open /api/events streams are served by their own asyncio server rather than Flask threads
+event_server = EventServer(event_hub, host=EVENTS_HOST, port=EVENTS_PORT, allowed_origin=FRONTEND_ORIGIN)
 
 # Initialize blockchain sync service
 # Load contract configuration
@@ -61,10 +73,15 @@ try:
     
     # Initialize blockchain sync service
     sync_service = BlockchainSyncService(
-        rpc_url=network_config["rpc_url"],
+        rpc_url=network_config.get("rpc_urls") or network_config["rpc_url"],
         contract_address=network_config["contract_address"],
         contract_abi=contract_abi,
-        db=db
+        db=db,
+        start_block=network_config.get("start_block", 0),
+        batch_size=network_config.get("rpc_batch_size", 200),
+        ws_url=network_config.get("ws_url"),
+        hedge_after=network_config.get("rpc_hedge_after"),
+        confirmations=network_config.get("confirmations", 5)
     )
     
     print(f"📊 Database initialized, blockchain sync ready for {network_config['contract_address']}")
@@ -194,6 +211,104 @@ def get_pinata_gateway_url(cid):
     else:
         return f"https://gateway.pinata.cloud/ipfs/{cid}"
 
+def encode_cursor(last_id, filters):
+    """Opaque keyset cursor: the last capsule id served plus the filters it was served under"""
+    payload = json.dumps({"id": last_id, "filters": filters}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor):
+    """Inverse of encode_cursor, returning (last_id, filters); raises ValueError on anything it didn't produce"""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        if not isinstance(payload["filters"], dict):
+            raise ValueError
+        return int(payload["id"]), payload["filters"]
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+def json_response(payload, status=200):
+    """JSON response encoded by serialization.dumps (orjson when installed) instead of jsonify"""
+    return app.response_class(dumps(payload), status=status, mimetype="application/json")
+
+# ---------- response cache ----------
+# Rendered JSON of read endpoints, keyed on (path, the query args the view reads,
+# db.data_generation). The sync writer bumps the generation on every commit that
+# changes rows, so entries of older generations are simply never hit again and
+# age out. The cache is bounded by the total size of the cached bodies.
+RESPONSE_CACHE_MAX_BYTES = 64 * 1024 * 1024
+# Bodies larger than this are served but not cached
+RESPONSE_CACHE_MAX_ENTRY_BYTES = 4 * 1024 * 1024
+response_cache = OrderedDict()
+response_cache_bytes = 0
+response_cache_lock = threading.Lock()
+
+def cached_response(*arg_names):
+    """
+    Serve a GET view from the response cache, with an ETag so clients can revalidate with If-None-Match
+    
+    ``arg_names`` are the query args the view reads; any other args don't
+    create new cache entries.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            global response_cache_bytes
+            if request.method != "GET":
+                return view(*args, **kwargs)
+            start_time = time.perf_counter()
+            key = (request.path, tuple(request.args.get(name) for name in arg_names), db.data_generation)
+            with response_cache_lock:
+                entry = response_cache.get(key)
+                if entry is not None:
+                    response_cache.move_to_end(key)
+            
+            if entry is None:
+                response = app.make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+                body = response.get_data()
+                entry = {
+                    "body": body,
+                    "mimetype": response.mimetype,
+                    "etag": hashlib.sha1(body).hexdigest()[:20],
+                    # Views mark immutable responses themselves; the rest must be revalidated
+                    "cache_control": response.headers.get("Cache-Control", "no-cache")
+                }
+                if len(body) <= RESPONSE_CACHE_MAX_ENTRY_BYTES:
+                    with response_cache_lock:
+                        replaced = response_cache.pop(key, None)
+                        if replaced is not None:
+                            response_cache_bytes -= len(replaced["body"])
+                        response_cache[key] = entry
+                        response_cache_bytes += len(body)
+                        while response_cache_bytes > RESPONSE_CACHE_MAX_BYTES:
+                            _, evicted = response_cache.popitem(last=False)
+                            response_cache_bytes -= len(evicted["body"])
+            
+            response = app.response_class(entry["body"], mimetype=entry["mimetype"])
+            response.set_etag(entry["etag"])
+            response.headers["Cache-Control"] = entry["cache_control"]
+            # Timing of this request, cache hit or not (cached bodies can't carry it)
+            response.headers["Server-Timing"] = f"app;dur={(time.perf_counter() - start_time) * 1000:.2f}"
+            return response.make_conditional(request)
+        
+        return wrapper
+    
+    return decorator
+
+# Most capsules one list page may return
+MAX_PAGE_LIMIT = 100
+
+def page_limit(default=10):
+    """The ``limit`` query arg, clamped to 1..MAX_PAGE_LIMIT"""
+    return max(1, min(int(request.args.get("limit", default)), MAX_PAGE_LIMIT))
+
+# Revealed capsules and ciphertexts don't change once their blocks are confirmed
+# (capsule ids are sequential, so before that a reorg can give an id to another
+# capsule). A day rather than forever, since a reorg deeper than the sync
+# confirmation depth could still undo a reveal.
+IMMUTABLE_CACHE_CONTROL = "public, max-age=86400"
+
 # ---------- routes ----------
 @app.route("/health")
 def health():
@@ -207,6 +322,7 @@ def system_info():
         "pinata_version": PINATA_VERSION,
         "pinata_gateway": PINATA_GATEWAY or "https://gateway.pinata.cloud",
         "local_server": "http://localhost:5000",
+        "events_url": EVENTS_URL,
         "timestamp": int(time.time())
     })
 
@@ -418,46 +534,152 @@ def save_pixelated():
 
 # ---------- DATABASE API ENDPOINTS ----------
 @app.route("/api/capsules", methods=["GET"])
+@cached_response("offset", "limit", "fields", "cursor", "revealed_only", "from_block", "to_block")
 def get_capsules():
-    """Get capsules from database with pagination"""
+    """
+    Get capsules from database, newest first
+    
+    Pages either by ``offset`` or, for stable deep scrolling, by the opaque
+    ``cursor`` returned as ``next_cursor`` (the cursor carries its filters).
+    """
     try:
         offset = int(request.args.get("offset", 0))
-        limit = int(request.args.get("limit", 10))
-        revealed_only = request.args.get("revealed_only", "false").lower() == "true"
-        
-        capsules = db.get_capsules(offset=offset, limit=limit, revealed_only=revealed_only)
-        total_count = db.get_capsule_count()
-          # Format capsules for frontend compatibility
-        formatted_capsules = []
-        for capsule in capsules:
-            formatted_capsule = {
-                "id": capsule["id"],
-                "creator": capsule["creator"],
-                "title": capsule["title"],
-                "tags": capsule["tags"],
-                "encryptedStory": capsule["encrypted_story"].hex() if isinstance(capsule["encrypted_story"], bytes) else capsule["encrypted_story"],
-                "decryptedStory": capsule["decrypted_story"],
-                "isRevealed": bool(capsule["is_revealed"]),
-                "revealTime": capsule["reveal_time"],
-                "shutterIdentity": capsule["shutter_identity"],
-                "imageCID": capsule["image_cid"]
-            }
-            formatted_capsules.append(formatted_capsule)
-        
-        return jsonify({
+        limit = page_limit()
+        # fields=summary leaves the ciphertext out (fetch it from /api/capsules/<id>/ciphertext)
+        summary = request.args.get("fields", "full") == "summary"
+        cursor = request.args.get("cursor")
+        if cursor:
+            try:
+                before_id, filters = decode_cursor(cursor)
+                revealed_only = bool(filters["revealed_only"])
+                from_block, to_block = filters["from_block"], filters["to_block"]
+            except (ValueError, KeyError):
+                return {"error": "Invalid cursor"}, 400
+            offset = 0
+        else:
+            before_id = None
+            revealed_only = request.args.get("revealed_only", "false").lower() == "true"
+            # Optional creation block range, for timeline views
+            from_block = request.args.get("from_block", type=int)
+            to_block = request.args.get("to_block", type=int)
+        
+        # One extra row tells whether another page follows
+        capsules = db.get_capsules(offset=offset, limit=limit + 1, revealed_only=revealed_only,
+                                   from_block=from_block, to_block=to_block, before_id=before_id,
+                                   summary=summary)
+        next_cursor = None
+        if len(capsules) > limit:
+            capsules = capsules[:limit]
+            next_cursor = encode_cursor(capsules[-1]["id"], {
+                "revealed_only": revealed_only, "from_block": from_block, "to_block": to_block
+            })
+        total_count = db.get_capsule_count(revealed_only=revealed_only, from_block=from_block, to_block=to_block)
+        formatted_capsules = [format_capsule(capsule, summary) for capsule in capsules]
+        
+        return json_response({
             "success": True,
             "capsules": formatted_capsules,
             "total_count": total_count,
             "offset": offset,
             "limit": limit,
-            "has_more": (offset + limit) < total_count
+            "has_more": next_cursor is not None,
+            "next_cursor": next_cursor
         })
         
     except Exception as e:
         print("Error in /api/capsules:", e)
         return {"error": str(e)}, 500
 
+# Most ids one /api/capsules/batch request may ask for
+MAX_BATCH_IDS = 100
+
+@app.route("/api/capsules/batch", methods=["GET", "POST"])
+@cached_response("ids", "fields")
+def get_capsules_batch():
+    """
+    Get several capsules by ID in one request
+    
+    Ids come from ``?ids=1,2,3`` or a JSON body ``{"ids": [1, 2, 3]}``. Capsules are
+    returned in request order, ids without a capsule are listed in ``missing``.
+    """
+    try:
+        if request.method == "POST":
+            body = request.get_json(silent=True) or {}
+            raw_ids = body.get("ids", [])
+            summary = body.get("fields", "full") == "summary"
+        else:
+            raw_ids = [part for part in request.args.get("ids", "").split(",") if part.strip()]
+            summary = request.args.get("fields", "full") == "summary"
+        try:
+            if not isinstance(raw_ids, list):
+                raise ValueError
+            capsule_ids = list(dict.fromkeys(int(capsule_id) for capsule_id in raw_ids))
+        except (TypeError, ValueError):
+            return {"error": "ids must be a list of capsule ids"}, 400
+        if not capsule_ids:
+            return {"error": "At least one capsule id is required"}, 400
+        if len(capsule_ids) > MAX_BATCH_IDS:
+            return {"error": f"At most {MAX_BATCH_IDS} ids per request"}, 400
+        
+        capsules = db.get_capsules_by_ids(capsule_ids, summary=summary)
+        found = {capsule["id"] for capsule in capsules}
+        
+        return json_response({
+            "success": True,
+            "capsules": [format_capsule(capsule, summary) for capsule in capsules],
+            "missing": [capsule_id for capsule_id in capsule_ids if capsule_id not in found]
+        })
+        
+    except Exception as e:
+        print("Error in /api/capsules/batch:", e)
+        return {"error": str(e)}, 500
+
+@app.route("/api/capsules/export", methods=["GET"])
+def export_capsules():
+    """
+    Stream every capsule as NDJSON (one JSON object per line), oldest first
+    
+    ``since_id`` resumes after the last id a previous export ended with and
+    ``since_block`` limits the export to capsules created in that block or later.
+    The body is gzip-compressed on the fly when the client accepts it.
+    """
+    try:
+        since_id = request.args.get("since_id", type=int)
+        since_block = request.args.get("since_block", type=int)
+        # fields=summary leaves the ciphertext out (fetch it from /api/capsules/<id>/ciphertext)
+        summary = request.args.get("fields", "full") == "summary"
+        use_gzip = "gzip" in request.headers.get("Accept-Encoding", "")
+        
+        def generate():
+            compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if use_gzip else None  # wbits 31: gzip framing
+            lines = []
+            for capsule in db.iter_capsules(since_id=since_id, since_block=since_block, summary=summary):
+                lines.append(dumps(format_capsule(capsule, summary)))
+                if len(lines) == 500:
+                    chunk = b"\n".join(lines) + b"\n"
+                    lines = []
+                    chunk = compressor.compress(chunk) if compressor else chunk
+                    if chunk:
+                        yield chunk
+            chunk = b"\n".join(lines) + b"\n" if lines else b""
+            if compressor:
+                chunk = compressor.compress(chunk) + compressor.flush()
+            if chunk:
+                yield chunk
+        
+        response = Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+        response.headers["Vary"] = "Accept-Encoding"
+        response.headers["Cache-Control"] = "no-store"
+        if use_gzip:
+            response.headers["Content-Encoding"] = "gzip"
+        return response
+        
+    except Exception as e:
+        print("Error in /api/capsules/export:", e)
+        return {"error": str(e)}, 500
+
 @app.route("/api/capsules/<int:capsule_id>", methods=["GET"])
+@cached_response()
 def get_capsule(capsule_id):
     """Get a single capsule by ID"""
     try:
@@ -465,99 +687,174 @@ def get_capsule(capsule_id):
         
         if not capsule:
             return {"error": "Capsule not found"}, 404
-          # Format for frontend compatibility
-        formatted_capsule = {
-            "id": capsule["id"],
-            "creator": capsule["creator"],
-            "title": capsule["title"],
-            "tags": capsule["tags"],
-            "encryptedStory": capsule["encrypted_story"].hex() if isinstance(capsule["encrypted_story"], bytes) else capsule["encrypted_story"],
-            "decryptedStory": capsule["decrypted_story"],
-            "isRevealed": bool(capsule["is_revealed"]),
-            "revealTime": capsule["reveal_time"],
-            "shutterIdentity": capsule["shutter_identity"],
-            "imageCID": capsule["image_cid"]
-        }
+        formatted_capsule = format_capsule(capsule)
         
-        return jsonify({
+        response = json_response({
             "success": True,
             "capsule": formatted_capsule
         })
+        if formatted_capsule["isRevealed"] and db.is_capsule_confirmed(capsule_id):
+            response.headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL
+        return response
         
     except Exception as e:
         print(f"Error in /api/capsules/{capsule_id}:", e)
         return {"error": str(e)}, 500
 
+@app.route("/api/capsules/<int:capsule_id>/ciphertext", methods=["GET"])
+@cached_response()
+def get_capsule_ciphertext(capsule_id):
+    """Get only a capsule's encrypted story, for clients that listed it with fields=summary"""
+    try:
+        encrypted_story = db.get_capsule_ciphertext(capsule_id, as_hex=True)
+        
+        if encrypted_story is None:
+            return {"error": "Capsule not found"}, 404
+        
+        response = json_response({
+            "success": True,
+            "id": capsule_id,
+            "encryptedStory": encrypted_story
+        })
+        if db.is_capsule_confirmed(capsule_id):
+            response.headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL
+        return response
+        
+    except Exception as e:
+        print(f"Error in /api/capsules/{capsule_id}/ciphertext:", e)
+        return {"error": str(e)}, 500
+
 @app.route("/api/capsules/search", methods=["GET"])
+@cached_response("q", "limit", "offset", "fields")
 def search_capsules():
-    """Search capsules by title, tags, or creator"""
+    """Full-text search over title, tags and revealed story (or creator address), best matches first"""
     try:
         query = request.args.get("q", "").strip()
-        limit = int(request.args.get("limit", 10))
+        limit = page_limit()
+        offset = int(request.args.get("offset", 0))
+        # fields=summary leaves the ciphertext out (fetch it from /api/capsules/<id>/ciphertext)
+        summary = request.args.get("fields", "full") == "summary"
         
         if not query:
             return {"error": "Search query is required"}, 400
         
-        capsules = db.search_capsules(query, limit=limit)
-        
-        # Format capsules for frontend
-        formatted_capsules = []
-        for capsule in capsules:
-            formatted_capsule = {
-                "id": capsule["id"],
-                "creator": capsule["creator"],
-                "title": capsule["title"],
-                "tags": capsule["tags"],
-                "encryptedStory": capsule["encrypted_story"].hex() if isinstance(capsule["encrypted_story"], bytes) else capsule["encrypted_story"],
-                "decryptedStory": capsule["decrypted_story"],
-                "isRevealed": bool(capsule["is_revealed"]),
-                "revealTime": capsule["reveal_time"],
-                "shutterIdentity": capsule["shutter_identity"],
-                "imageCID": capsule["image_cid"]
-            }
-            formatted_capsules.append(formatted_capsule)
+        capsules = db.search_capsules(query, limit=limit, offset=offset, summary=summary)
+        total_count = db.count_search_results(query)
         
-        return jsonify({
+        formatted_capsules = [format_capsule(capsule, summary) for capsule in capsules]
+        
+        return json_response({
             "success": True,
             "capsules": formatted_capsules,
             "query": query,
-            "count": len(formatted_capsules)
+            "count": len(formatted_capsules),
+            "total_count": total_count,
+            "has_more": offset + len(formatted_capsules) < total_count
         })
         
     except Exception as e:
         print("Error in /api/capsules/search:", e)
         return {"error": str(e)}, 500
 
+@app.route("/api/capsules/tag/<tag>", methods=["GET"])
+@cached_response("limit", "fields", "cursor")
+def get_capsules_by_tag(tag):
+    """Capsules with exactly this tag, newest first, paged by ``cursor``/``next_cursor``"""
+    try:
+        limit = page_limit()
+        # fields=summary leaves the ciphertext out (fetch it from /api/capsules/<id>/ciphertext)
+        summary = request.args.get("fields", "full") == "summary"
+        before_id = None
+        cursor = request.args.get("cursor")
+        if cursor:
+            try:
+                before_id, filters = decode_cursor(cursor)
+            except ValueError as e:
+                return {"error": str(e)}, 400
+            if filters.get("tag") != tag:
+                return {"error": "Cursor belongs to a different tag"}, 400
+        
+        capsules = db.get_capsules_by_tag(tag, limit=limit + 1, before_id=before_id, summary=summary)
+        next_cursor = None
+        if len(capsules) > limit:
+            capsules = capsules[:limit]
+            next_cursor = encode_cursor(capsules[-1]["id"], {"tag": tag})
+        tag_counts = db.get_tag_counts(tags=[tag])
+        
+        formatted_capsules = [format_capsule(capsule, summary) for capsule in capsules]
+        
+        return json_response({
+            "success": True,
+            "capsules": formatted_capsules,
+            "tag": tag,
+            "total_count": tag_counts[0]["capsule_count"] if tag_counts else 0,
+            "has_more": next_cursor is not None,
+            "next_cursor": next_cursor
+        })
+        
+    except Exception as e:
+        print(f"Error in /api/capsules/tag/{tag}:", e)
+        return {"error": str(e)}, 500
+
+@app.route("/api/tags", methods=["GET"])
+@cached_response("limit")
+def get_tags():
+    """Top-N tag facets with capsule counts, for tag clouds and filters"""
+    try:
+        limit = max(1, min(int(request.args.get("limit", 20)), 500))
+        return json_response({
+            "success": True,
+            "tags": [{"tag": row["tag"], "count": row["capsule_count"]} for row in db.get_tag_counts(limit=limit)]
+        })
+        
+    except Exception as e:
+        print("Error in /api/tags:", e)
+        return {"error": str(e)}, 500
+
 @app.route("/api/capsules/creator/<creator_address>", methods=["GET"])
+@cached_response("limit", "fields", "cursor")
 def get_capsules_by_creator(creator_address):
-    """Get capsules created by a specific address"""
+    """
+    Get capsules created by a specific address, newest first
+    
+    The address is matched case-insensitively; pages by ``cursor``/``next_cursor``.
+    """
     try:
-        limit = int(request.args.get("limit", 10))
-        
-        capsules = db.get_capsules_by_creator(creator_address, limit=limit)
-        
-        # Format capsules for frontend
-        formatted_capsules = []
-        for capsule in capsules:
-            formatted_capsule = {
-                "id": capsule["id"],
-                "creator": capsule["creator"],
-                "title": capsule["title"],
-                "tags": capsule["tags"],
-                "encryptedStory": capsule["encrypted_story"],
-                "decryptedStory": capsule["decrypted_story"],
-                "isRevealed": bool(capsule["is_revealed"]),
-                "revealTime": capsule["reveal_time"],
-                "shutterIdentity": capsule["shutter_identity"],
-                "imageCID": capsule["image_cid"]
-            }
-            formatted_capsules.append(formatted_capsule)
-        
-        return jsonify({
+        limit = page_limit()
+        # fields=summary leaves the ciphertext out (fetch it from /api/capsules/<id>/ciphertext)
+        summary = request.args.get("fields", "full") == "summary"
+        creator = normalize_address(creator_address)
+        if not re.fullmatch(r"0x[0-9a-f]{40}", creator):
+            return {"error": "Invalid creator address"}, 400
+        
+        before_id = None
+        cursor = request.args.get("cursor")
+        if cursor:
+            try:
+                before_id, filters = decode_cursor(cursor)
+            except ValueError as e:
+                return {"error": str(e)}, 400
+            if filters.get("creator") != creator:
+                return {"error": "Cursor belongs to a different creator"}, 400
+        
+        capsules = db.get_capsules_by_creator(creator, limit=limit + 1, summary=summary, before_id=before_id)
+        next_cursor = None
+        if len(capsules) > limit:
+            capsules = capsules[:limit]
+            next_cursor = encode_cursor(capsules[-1]["id"], {"creator": creator})
+        creator_stats = db.get_creator_stats(creator)
+        
+        formatted_capsules = [format_capsule(capsule, summary) for capsule in capsules]
+        
+        return json_response({
             "success": True,
             "capsules": formatted_capsules,
-            "creator": creator_address,
-            "count": len(formatted_capsules)
+            "creator": creator,
+            "count": len(formatted_capsules),
+            "total_count": creator_stats["capsule_count"],
+            "revealed_count": creator_stats["revealed_count"],
+            "has_more": next_cursor is not None,
+            "next_cursor": next_cursor
         })
         
     except Exception as e:
@@ -606,27 +903,23 @@ def force_sync():
 def get_stats():
     """Get general statistics"""
     try:
-        total_capsules = db.get_capsule_count()
-        recent_capsules = len(db.get_recent_capsules(hours=24, limit=100))
-        revealed_capsules = len(db.get_capsules(limit=1000, revealed_only=True))
+        capsule_stats = db.get_capsule_stats(recent_hours=24)
         
-        # Get sync health if available
-        sync_health = None
-        if sync_service:
-            try:
-                sync_health = sync_service.get_sync_health()
-            except:
-                pass
+        # Sync freshness comes from the sync_status row, not the chain, so this
+        # endpoint never waits on an RPC round trip; a database that has never synced is unhealthy
+        last_sync = db.get_sync_status().get("last_sync_time")
+        subscribed = sync_service is not None and sync_service.subscription_connected
+        database_healthy = last_sync is not None and (subscribed or int(time.time()) - last_sync < 60)
         
         return jsonify({
             "success": True,
             "statistics": {
-                "total_capsules": total_capsules,
-                "revealed_capsules": revealed_capsules,
-                "unrevealed_capsules": total_capsules - revealed_capsules,
-                "recent_capsules_24h": recent_capsules,
-                "database_healthy": sync_health is not None and sync_health.get("is_healthy", False),
-                "last_sync": sync_health.get("last_sync_time") if sync_health else None
+                "total_capsules": capsule_stats["total_capsules"],
+                "revealed_capsules": capsule_stats["revealed_capsules"],
+                "unrevealed_capsules": capsule_stats["unrevealed_capsules"],
+                "recent_capsules_24h": capsule_stats["recent_capsules"],
+                "database_healthy": database_healthy,
+                "last_sync": last_sync
             }
         })
         
@@ -653,9 +946,8 @@ def test_speed_comparison():
             try:
                 blockchain_start = time.time()
                 total_on_chain = sync_service.contract.functions.capsuleCount().call()
-                # Fetch first 5 capsules from blockchain
-                for i in range(min(5, total_on_chain)):
-                    sync_service.contract.functions.getCapsule(i).call()
+                # Fetch first 5 capsules from blockchain in one batched request
+                sync_service.fetch_capsules_batch(range(min(5, total_on_chain)))
                 blockchain_time = time.time() - blockchain_start
                 blockchain_capsules = list(range(min(5, total_on_chain)))
             except Exception as e:
@@ -680,19 +972,50 @@ def test_speed_comparison():
         print("Error in /api/test/speed-comparison:", e)
         return {"error": str(e)}, 500
 
+@app.route("/api/internal/metrics", methods=["GET"])
+def get_internal_metrics():
+    """Database latency histograms, slow-query log and RPC endpoint stats (local requests only)"""
+    if request.remote_addr not in ("127.0.0.1", "::1"):
+        return {"error": "Forbidden"}, 403
+    try:
+        if request.args.get("reset", "false").lower() == "true":
+            db.metrics.reset()
+        
+        return jsonify({
+            "success": True,
+            "database": db.get_metrics(),
+            "rpc_endpoints": sync_service.provider.stats() if sync_service else None,
+            "event_subscribers": event_server.subscribers
+        })
+        
+    except Exception as e:
+        print("Error in /api/internal/metrics:", e)
+        return {"error": str(e)}, 500
+
 # ---------- static SPA ----------
 @app.route("/")
 def index():
     return send_from_directory(app.static_folder, "index.html")
 
 if __name__ == "__main__":
+    # app.run(debug=True) re-runs this script in a child process that does the serving;
+    # only that process syncs and serves the event stream
+    serving = os.environ.get("WERKZEUG_RUN_MAIN") == "true"
+    
     # Start blockchain sync service
-    if sync_service:
+    if sync_service and serving:
         print("🔄 Starting blockchain sync service...")
         sync_service.start_sync()
         print("✅ Blockchain sync service started")
-    else:
+    elif not sync_service:
         print("⚠️  Running without blockchain sync")
     
+    if serving:
+        try:
+            event_server.start()
+            print(f"📡  capsule events on {event_server.url}")
+        except OSError as e:
+            print(f"⚠️  Could not start the capsule event stream on {EVENTS_HOST}:{EVENTS_PORT}: {e}")
+    
     print("🚀  backend on http://127.0.0.1:5000")
     app.run(debug=True)
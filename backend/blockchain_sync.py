@@ -1,38 +1,167 @@
 # blockchain_sync.py - Blockchain synchronization service for Time Capsule
 import asyncio
+import heapq
 import time
 import threading
 import logging
-from typing import Optional, Dict, Any
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Optional, Dict, Any, List, Union
 from web3 import Web3
 from web3.contract import Contract
+from eth_utils import event_abi_to_log_topic
+from eth_utils.abi import collapse_if_tuple
+from web3._utils.method_formatters import log_entry_formatter
 from database import CapsuleDatabase
+from rpc_pool import PooledHTTPProvider
 import json
 
+try:
+    from websockets.sync.client import connect as ws_connect
+except ImportError:
+    ws_connect = None
+
 # Setup logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Multicall3 is deployed at the same address on Gnosis Chain and most EVM networks
+MULTICALL3_ADDRESS = "0xcA11bde05977b3631167028862bE2a173976CA11"
+MULTICALL3_ABI = [
+    {
+        "inputs": [
+            {
+                "components": [
+                    {"internalType": "address", "name": "target", "type": "address"},
+                    {"internalType": "bool", "name": "allowFailure", "type": "bool"},
+                    {"internalType": "bytes", "name": "callData", "type": "bytes"}
+                ],
+                "internalType": "struct Multicall3.Call3[]",
+                "name": "calls",
+                "type": "tuple[]"
+            }
+        ],
+        "name": "aggregate3",
+        "outputs": [
+            {
+                "components": [
+                    {"internalType": "bool", "name": "success", "type": "bool"},
+                    {"internalType": "bytes", "name": "returnData", "type": "bytes"}
+                ],
+                "internalType": "struct Multicall3.Result[]",
+                "name": "returnData",
+                "type": "tuple[]"
+            }
+        ],
+        "stateMutability": "payable",
+        "type": "function"
+    }
+]
+
+class RevealScheduler:
+    """
+    Min-heap of locked capsules keyed by the time they should next be re-checked
+    
+    A capsule becomes due at its reveal_time. If it is still locked when checked,
+    it is re-queued with an exponential backoff (min_interval doubling up to
+    max_interval). Revealed capsules are immutable on-chain and are dropped for good.
+    """
+    
+    def __init__(self, min_interval: int = 30, max_interval: int = 3600):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self._heap = []  # (due_time, capsule_id)
+        self._entries = {}  # capsule_id -> (due_time, backoff interval)
+        self._lock = threading.Lock()
+    
+    def schedule(self, capsule_id: int, reveal_time: int, checked_at: Optional[float] = None):
+        """
+        Track a locked capsule; no-op if it is already tracked
+        
+        Args:
+            capsule_id: Capsule to track
+            reveal_time: Capsule reveal timestamp (the earliest it can change)
+            checked_at: When the capsule was last read, if just now (delays the first re-check)
+        """
+        due_time = reveal_time
+        if checked_at is not None:
+            due_time = max(reveal_time, int(checked_at) + self.min_interval)
+        with self._lock:
+            if capsule_id not in self._entries:
+                self._push(capsule_id, due_time, self.min_interval)
+    
+    def discard(self, capsule_id: int):
+        """Stop tracking a capsule (its stale heap entry is skipped lazily)"""
+        with self._lock:
+            self._entries.pop(capsule_id, None)
+    
+    def pop_due(self, now: float, limit: Optional[int] = None) -> List[int]:
+        """Remove and return the capsules whose check time has passed, earliest first"""
+        due = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now and (limit is None or len(due) < limit):
+                due_time, capsule_id = heapq.heappop(self._heap)
+                entry = self._entries.get(capsule_id)
+                if entry is None or entry[0] != due_time:
+                    continue  # discarded or rescheduled
+                due.append(capsule_id)
+        return due
+    
+    def reschedule(self, capsule_id: int, now: float):
+        """Re-queue a capsule that was due but is still locked, backing off"""
+        with self._lock:
+            entry = self._entries.get(capsule_id)
+            if entry is None:
+                return
+            interval = entry[1]
+            self._push(capsule_id, int(now) + interval, min(interval * 2, self.max_interval))
+    
+    def _push(self, capsule_id: int, due_time: int, interval: int):
+        self._entries[capsule_id] = (due_time, interval)
+        heapq.heappush(self._heap, (due_time, capsule_id))
+    
+    def __len__(self):
+        return len(self._entries)
+    
+    def next_due(self) -> Optional[int]:
+        """Earliest check time among tracked capsules"""
+        with self._lock:
+            return min((entry[0] for entry in self._entries.values()), default=None)
+
 class BlockchainSyncService:
-    def __init__(self, rpc_url: str, contract_address: str, contract_abi: list, db: CapsuleDatabase):
+    def __init__(self, rpc_url: Union[str, List[str]], contract_address: str, contract_abi: list, db: CapsuleDatabase,
+                 start_block: int = 0, log_chunk_size: int = 5000, batch_size: int = 200,
+                 multicall_address: str = MULTICALL3_ADDRESS, backfill_workers: int = 4,
+                 ws_url: Optional[str] = None, hedge_after: Optional[float] = None,
+                 confirmations: int = 0, journal_depth: int = 1000):
         """
         Initialize blockchain sync service
         
         Args:
-            rpc_url: Ethereum RPC endpoint URL
+            rpc_url: Ethereum RPC endpoint URL, or a list of equivalent endpoint URLs
             contract_address: TimeCapsule contract address  
-            contract_abi: Contract ABI definition
+            contract_abi: Contract ABI definition (must include the capsule events)
             db: Database instance for storing capsule data
+            start_block: Block the contract was deployed at (lower bound for log queries)
+            log_chunk_size: Maximum number of blocks per eth_getLogs request
+            batch_size: Maximum number of getCapsule calls aggregated into one Multicall3 request
+            multicall_address: Multicall3 contract address (None disables batched reads)
+            backfill_workers: Maximum number of concurrent RPC requests during a backfill
+            ws_url: Optional WebSocket RPC endpoint; enables push-mode sync via eth_subscribe
+            hedge_after: Seconds before a slow read is also sent to a second endpoint (None disables)
+            confirmations: Blocks behind the head that polling sync stays, to avoid reorged data
+            journal_depth: How many blocks of applied changes are kept for reorg rollback
         """
-        self.rpc_url = rpc_url
+        self.rpc_urls = [rpc_url] if isinstance(rpc_url, str) else list(rpc_url)
+        self.rpc_url = self.rpc_urls[0]
         self.contract_address = contract_address
         self.contract_abi = contract_abi
         self.db = db
         
-        # Initialize Web3 connection
-        self.w3 = Web3(Web3.HTTPProvider(rpc_url))
+        # Initialize Web3 connection through a pool routing to the fastest healthy endpoint
+        self.provider = PooledHTTPProvider(self.rpc_urls, hedge_after=hedge_after)
+        self.w3 = Web3(self.provider)
         if not self.w3.is_connected():
-            raise Exception(f"Failed to connect to blockchain at {rpc_url}")
+            raise Exception(f"Failed to connect to blockchain at {', '.join(self.rpc_urls)}")
         
         # Initialize contract
         self.contract = self.w3.eth.contract(
@@ -40,11 +169,50 @@ class BlockchainSyncService:
             abi=contract_abi
         )
         
-        # Sync control
+        # Batched reads through Multicall3
+        self.batch_size = batch_size
+        self.multicall = None
+        if multicall_address:
+            self.multicall = self.w3.eth.contract(
+                address=Web3.to_checksum_address(multicall_address),
+                abi=MULTICALL3_ABI
+            )
+        self._capsule_output_types = [
+            collapse_if_tuple(output) for output in self.contract.get_function_by_name('getCapsule').abi['outputs']
+        ]
+        
+        self.backfill_workers = backfill_workers
+        
+        # Reorg safety
+        self.confirmations = confirmations
+        self.journal_depth = journal_depth
+        
+        # Locked capsules to re-check once their reveal time has passed
+        self.reveal_scheduler = RevealScheduler()
+        self._reveal_scheduler_loaded = False
+        
+        # Event log tracking
+        self.start_block = start_block
+        self._log_chunk_size = log_chunk_size
+        self._event_topics = {
+            event_abi_to_log_topic(self.contract.events.CapsuleCreated().abi): self.contract.events.CapsuleCreated(),
+            event_abi_to_log_topic(self.contract.events.CapsuleRevealed().abi): self.contract.events.CapsuleRevealed(),
+        }
+        
+        # Sync control; the lock keeps a forced pass from interleaving with the loop's pass or a rollback
+        self._sync_lock = threading.RLock()
         self._stop_sync = False
         self._sync_thread = None
         self._sync_interval = 10  # seconds
         
+        # Push-mode sync
+        self.ws_url = ws_url
+        self._subscription_connected = False
+        self._pending_logs = []  # pushed logs not applied yet, oldest first
+        self._pending_retry_interval = 1.0  # seconds
+        if ws_url and ws_connect is None:
+            logger.warning("websockets package not available, falling back to polling sync")
+        
         logger.info(f"Blockchain sync service initialized for contract {contract_address}")
     
     def start_sync(self):
@@ -54,9 +222,10 @@ class BlockchainSyncService:
             return
         
         self._stop_sync = False
-        self._sync_thread = threading.Thread(target=self._sync_loop, daemon=True)
+        target = self._subscription_loop if self._subscription_enabled() else self._sync_loop
+        self._sync_thread = threading.Thread(target=target, daemon=True)
         self._sync_thread.start()
-        logger.info("Blockchain sync service started")
+        logger.info(f"Blockchain sync service started ({'subscription' if self._subscription_enabled() else 'polling'} mode)")
     
     def stop_sync(self):
         """Stop the periodic synchronization"""
@@ -76,15 +245,149 @@ class BlockchainSyncService:
                 # Continue running despite errors
                 time.sleep(self._sync_interval)
     
-    def sync_capsules(self) -> Dict[str, Any]:
+    @property
+    def subscription_connected(self) -> bool:
+        """Whether a log subscription is currently delivering pushed events"""
+        return self._subscription_connected
+    
+    def _subscription_enabled(self) -> bool:
+        return bool(self.ws_url) and ws_connect is not None
+    
+    def _subscription_loop(self):
         """
-        Synchronize capsules from blockchain to database
+        Push-mode synchronization loop
         
-        Returns:
-            Dictionary with sync results and statistics
+        Capsule events are applied as the node pushes them. Whenever the
+        subscription drops, the loop falls back to log-range polling until it
+        manages to resubscribe; every (re)subscription is followed by a gap-fill
+        sync from the persisted checkpoint, so no event is lost in between.
+        While subscribed, the confirmed polling pass still runs every
+        ``_sync_interval``: the gap-fill stops ``confirmations`` blocks behind the
+        head, and logs from those blocks were emitted before we subscribed.
         """
-        start_time = time.time()
-        sync_result = {
+        while not self._stop_sync:
+            try:
+                self._run_subscription()
+            except Exception as e:
+                logger.warning(f"Log subscription lost, polling until reconnected: {e}")
+            finally:
+                self._subscription_connected = False
+            
+            if self._stop_sync:
+                break
+            try:
+                self.sync_capsules()
+            except Exception as e:
+                logger.error(f"Error in sync loop: {e}")
+            time.sleep(self._sync_interval)
+    
+    def _run_subscription(self):
+        """Subscribe to the contract's capsule logs and apply them until disconnected or stopped"""
+        with ws_connect(self.ws_url, open_timeout=10) as ws:
+            ws.send(json.dumps({
+                "jsonrpc": "2.0",
+                "id": 1,
+                "method": "eth_subscribe",
+                "params": ["logs", {
+                    "address": self.contract.address,
+                    "topics": [[Web3.to_hex(topic) for topic in self._event_topics.keys()]]
+                }]
+            }))
+            response = json.loads(ws.recv(timeout=10))
+            if "result" not in response:
+                raise Exception(f"eth_subscribe failed: {response.get('error')}")
+            self._subscription_connected = True
+            logger.info(f"Subscribed to capsule logs at {self.ws_url}")
+            
+            # Gap-fill: anything emitted while we weren't subscribed comes from the logs.
+            # Events pushed meanwhile are buffered and re-applying them is harmless.
+            self.sync_capsules()
+            next_sync = time.time() + self._sync_interval
+            
+            self._apply_pending_logs()
+            
+            while not self._stop_sync:
+                timeout = max(0, next_sync - time.time())
+                if self._pending_logs:
+                    timeout = min(timeout, self._pending_retry_interval)
+                try:
+                    message = ws.recv(timeout=timeout)
+                except TimeoutError:
+                    message = None
+                
+                if message is not None:
+                    notification = json.loads(message)
+                    if notification.get("method") == "eth_subscription":
+                        self._apply_log_notification(notification["params"]["result"])
+                elif self._pending_logs:
+                    self._apply_pending_logs()
+                
+                if time.time() >= next_sync:
+                    # Confirmed pass: catches up on the unconfirmed blocks before the subscription,
+                    # moves the checkpoint and re-checks capsules that became due
+                    self.sync_capsules()
+                    self._apply_pending_logs()
+                    next_sync = time.time() + self._sync_interval
+    
+    def _apply_log_notification(self, raw_log: Dict[str, Any]):
+        """
+        Apply one pushed capsule log
+        
+        Pushed logs come straight from the chain tip, so they are applied right
+        away but only journaled: the checkpoint keeps following confirmed blocks.
+        """
+        with self._sync_lock:
+            self._pending_logs.append(raw_log)
+            self._apply_pending_logs()
+    
+    def _apply_pending_logs(self):
+        """
+        Apply queued pushed logs in order
+        
+        The WebSocket node can be ahead of the HTTP endpoints the capsules are
+        read from. A log that fails to apply stays queued with everything pushed
+        after it, so events are never applied out of order, and is retried
+        shortly and after each confirmed pass instead of dropping the
+        subscription. Logs the confirmed pass has reached are dropped, since it
+        applied them from eth_getLogs.
+        """
+        with self._sync_lock:
+            if not self._pending_logs:
+                return
+            checkpoint = self.db.get_sync_status().get('last_synced_block', 0)
+            while self._pending_logs:
+                raw_log = self._pending_logs[0]
+                if raw_log.get("removed") or int(raw_log['blockNumber'], 16) > checkpoint:
+                    try:
+                        self._apply_log(raw_log)
+                    except Exception as e:
+                        logger.warning(f"Could not apply pushed log from block {int(raw_log['blockNumber'], 16)} yet, "
+                                       f"{len(self._pending_logs)} queued: {e}")
+                        return
+                self._pending_logs.pop(0)
+    
+    def _apply_log(self, raw_log: Dict[str, Any]):
+        if raw_log.get("removed"):
+            # Dropped by a reorg: undo that block and re-read the canonical logs
+            removed_block = int(raw_log['blockNumber'], 16)
+            logger.warning(f"Log in block {removed_block} removed by a reorg, rolling back")
+            self._rollback_to(removed_block - 1, self._new_sync_result())
+            self.sync_capsules()
+            return
+        
+        log = log_entry_formatter(raw_log)
+        event_type = self._event_topics.get(bytes(log['topics'][0]))
+        if event_type is None:
+            return
+        event = event_type.process_log(log)
+        
+        sync_result = self._new_sync_result()
+        self._apply_events([event], event['blockNumber'], sync_result)
+        logger.info(f"Applied pushed {event['event']} for capsule #{event['args']['id']}")
+    
+    def _new_sync_result(self) -> Dict[str, Any]:
+        """Empty sync result dictionary, filled in by the sync steps"""
+        return {
             "success": False,
             "capsules_synced": 0,
             "new_capsules": 0,
@@ -92,61 +395,80 @@ class BlockchainSyncService:
             "errors": [],
             "sync_time": 0,
             "blockchain_total": 0,
-            "database_total": 0
+            "database_total": 0,
+            "rechecked_capsules": 0,
+            "reorg": None
         }
+    
+    def sync_capsules(self) -> Dict[str, Any]:
+        """
+        Synchronize capsules from blockchain to database
+        
+        Passes never overlap: a forced sync waits for the running one.
+        
+        Returns:
+            Dictionary with sync results and statistics
+        """
+        with self._sync_lock:
+            return self._sync_capsules()
+    
+    def _sync_capsules(self) -> Dict[str, Any]:
+        start_time = time.time()
+        sync_result = self._new_sync_result()
         
         try:
-            # Get current blockchain state
-            current_block = self.w3.eth.block_number
-            total_capsules_on_chain = self.contract.functions.capsuleCount().call()
+            # Get current blockchain state. The head is read once and every call in
+            # this pass is pinned to the confirmed block behind it, so the stored rows
+            # are one consistent snapshot that is unlikely to be reorged.
+            head_block = self.w3.eth.block_number
+            current_block = max(0, head_block - self.confirmations)
+            total_capsules_on_chain = self.contract.functions.capsuleCount().call(block_identifier=current_block)
             
             sync_result["blockchain_total"] = total_capsules_on_chain
-            logger.info(f"Starting sync: Block #{current_block}, {total_capsules_on_chain} capsules on-chain")
+            logger.info(f"Starting sync: Block #{current_block} (head #{head_block}), "
+                       f"{total_capsules_on_chain} capsules on-chain")
+            
+            # Re-check locked capsules whose reveal time has passed, in case a reveal was missed
+            self._recheck_due_capsules(current_block, sync_result)
             
             # Get last synced state
             sync_status = self.db.get_sync_status()
-            last_synced_count = sync_status.get('total_capsules', 0)
+            last_synced_block = sync_status.get('last_synced_block', 0)
             
-            # Sync all capsules (for simplicity, we'll fetch all each time)
-            # In production, you might want to optimize this by tracking events
-            for capsule_id in range(total_capsules_on_chain):
-                try:
-                    # Fetch capsule data from blockchain
-                    capsule_data = self._fetch_capsule_from_blockchain(capsule_id)
-                    
-                    if capsule_data:
-                        # Check if this is new or updated
-                        existing_capsule = self.db.get_capsule(capsule_id)
-                        
-                        if existing_capsule is None:
-                            # New capsule
-                            if self.db.insert_capsule(capsule_data):
-                                sync_result["new_capsules"] += 1
-                                logger.info(f"Added new capsule #{capsule_id}: {capsule_data['title']}")
-                        else:
-                            # Check if capsule was updated (revealed status changed)
-                            if (existing_capsule['is_revealed'] != capsule_data['is_revealed'] or
-                                existing_capsule['decrypted_story'] != capsule_data['decrypted_story']):
-                                if self.db.insert_capsule(capsule_data):
-                                    sync_result["updated_capsules"] += 1
-                                    logger.info(f"Updated capsule #{capsule_id} (revealed: {capsule_data['is_revealed']})")
-                        
-                        sync_result["capsules_synced"] += 1
-                        
-                except Exception as e:
-                    error_msg = f"Error syncing capsule #{capsule_id}: {e}"
-                    logger.error(error_msg)
-                    sync_result["errors"].append(error_msg)
+            if last_synced_block > 0:
+                # Undo whatever a reorg orphaned before moving forward
+                ancestor_block = self._detect_reorg()
+                if ancestor_block is not None:
+                    self._rollback_to(ancestor_block, sync_result)
+                    last_synced_block = ancestor_block
+            
+            if last_synced_block > 0:
+                # Incremental sync: only apply the events emitted since the last sync
+                synced_block = self._sync_from_logs(last_synced_block + 1, current_block, sync_result)
+            else:
+                # First sync: no checkpoint yet, so read every capsule once.
+                # Only checkpoint a clean backfill, otherwise missed capsules would never be retried.
+                backfill_result = self.backfill(total_capsules_on_chain, current_block, sync_result)
+                synced_block = current_block if backfill_result["complete"] else 0
+            
+            if synced_block > 0:
+                # Backfilled rows, and rows stored before provenance was tracked, lack their mint location
+                self._backfill_provenance(synced_block, sync_result)
             
             # Update sync status
             sync_result["database_total"] = self.db.get_capsule_count()
             error_summary = "; ".join(sync_result["errors"][-5:])  # Keep last 5 errors
             
             self.db.update_sync_status(
-                last_block=current_block,
+                last_block=synced_block,
                 total_capsules=total_capsules_on_chain,
                 errors=error_summary
             )
+            if synced_block > 0:
+                self._journal_checkpoint(synced_block)
+                if last_synced_block == 0:
+                    # The checkpoint now covers the backfill
+                    self.db.clear_backfill_chunks()
             
             sync_result["success"] = True
             sync_result["sync_time"] = time.time() - start_time
@@ -173,47 +495,379 @@ class BlockchainSyncService:
         
         return sync_result
     
-    def _fetch_capsule_from_blockchain(self, capsule_id: int) -> Optional[Dict[str, Any]]:
+    def backfill(self, total_capsules_on_chain: int, block_identifier: int,
+                 sync_result: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Read every capsule from the contract with a bounded pool of concurrent requests
+        
+        The id range is split into ``batch_size`` chunks whose progress is persisted
+        in the database, so an interrupted backfill resumes at the first unfinished chunk.
+        Fetching runs in up to ``backfill_workers`` threads; results are written by the
+        calling thread as chunks complete.
+        
+        Args:
+            total_capsules_on_chain: capsuleCount() of the contract at block_identifier
+            block_identifier: Block number all reads are pinned to
+            sync_result: Sync result dictionary to update in place
+            
+        Returns:
+            Backfill statistics, including throughput in capsules per second
+        """
+        start_time = time.time()
+        self.db.plan_backfill_chunks(total_capsules_on_chain, self.batch_size)
+        chunks = self.db.get_backfill_chunks()
+        pending = [chunk for chunk in chunks if chunk['status'] != 'done']
+        
+        backfill_result = {
+            "chunks_total": len(chunks),
+            "chunks_resumed": len(chunks) - len(pending),
+            "chunks_failed": 0,
+            "capsules_fetched": 0,
+            "capsules_per_second": 0,
+            "complete": False
+        }
+        logger.info(f"Backfilling {len(pending)} of {len(chunks)} chunks with {self.backfill_workers} workers")
+        
+        with ThreadPoolExecutor(max_workers=self.backfill_workers) as executor:
+            futures = {
+                executor.submit(self.fetch_capsules_batch, range(chunk['chunk_start'], chunk['chunk_end'] + 1),
+                                block_identifier): chunk
+                for chunk in pending
+            }
+            for future in as_completed(futures):
+                chunk = futures[future]
+                try:
+                    capsules = future.result()
+                except Exception as e:
+                    error_msg = f"Error fetching capsules #{chunk['chunk_start']}-#{chunk['chunk_end']}: {e}"
+                    logger.error(error_msg)
+                    sync_result["errors"].append(error_msg)
+                    backfill_result["chunks_failed"] += 1
+                    continue
+                
+                chunk_ok = True
+                fetched = []
+                for capsule_id in range(chunk['chunk_start'], chunk['chunk_end'] + 1):
+                    if capsules.get(capsule_id) is None:
+                        error_msg = f"Error syncing capsule #{capsule_id}: call failed"
+                        logger.error(error_msg)
+                        sync_result["errors"].append(error_msg)
+                        chunk_ok = False
+                    else:
+                        fetched.append(capsules[capsule_id])
+                
+                try:
+                    # One transaction per chunk
+                    self._store_capsules(fetched, sync_result)
+                    sync_result["capsules_synced"] += len(fetched)
+                    backfill_result["capsules_fetched"] += len(fetched)
+                except Exception as e:
+                    error_msg = f"Error storing capsules #{chunk['chunk_start']}-#{chunk['chunk_end']}: {e}"
+                    sync_result["errors"].append(error_msg)
+                    chunk_ok = False
+                
+                if chunk_ok:
+                    self.db.mark_backfill_chunk_done(chunk['chunk_start'], len(capsules))
+                else:
+                    backfill_result["chunks_failed"] += 1
+        
+        elapsed = time.time() - start_time
+        backfill_result["complete"] = backfill_result["chunks_failed"] == 0
+        backfill_result["capsules_per_second"] = round(backfill_result["capsules_fetched"] / elapsed, 2) if elapsed > 0 else 0
+        sync_result["backfill"] = backfill_result
+        
+        logger.info(f"Backfill fetched {backfill_result['capsules_fetched']} capsules "
+                   f"({backfill_result['chunks_resumed']} chunks already done) "
+                   f"at {backfill_result['capsules_per_second']} capsules/s")
+        return backfill_result
+    
+    def _backfill_provenance(self, to_block: int, sync_result: Dict[str, Any]):
+        """
+        Fill creation block and transaction hash of capsules that lack them from CapsuleCreated logs
+        
+        getCapsule() doesn't expose where a capsule was minted, so this walks the
+        creation logs from ``start_block``. The walk only runs while some capsule
+        has no provenance, and resumes after the last scanned block (persisted as
+        provenance_synced_block), so it is a no-op in the steady state. Without a
+        configured ``start_block`` the deployment block is looked up first, so the
+        walk never spans the whole chain.
+        """
+        if not self.db.has_capsules_without_provenance():
+            return
+        if self.start_block <= 0:
+            try:
+                self.start_block = self._find_deployment_block(to_block)
+                logger.info(f"start_block not configured, contract deployed at block {self.start_block}")
+            except Exception as e:
+                # Reported every pass until it works: rows stay without provenance meanwhile
+                error_msg = f"Could not find the contract deployment block for the provenance backfill: {e}"
+                logger.error(error_msg)
+                sync_result["errors"].append(error_msg)
+                return
+        
+        scanned_block = self.db.get_sync_status().get('provenance_synced_block') or 0
+        created_event = self.contract.events.CapsuleCreated()
+        created_topic = event_abi_to_log_topic(created_event.abi)
+        for chunk_start in range(max(self.start_block, scanned_block + 1), to_block + 1, self._log_chunk_size):
+            chunk_end = min(chunk_start + self._log_chunk_size - 1, to_block)
+            try:
+                logs = self.w3.eth.get_logs({
+                    'address': self.contract.address,
+                    'fromBlock': chunk_start,
+                    'toBlock': chunk_end,
+                    'topics': [Web3.to_hex(created_topic)]
+                })
+            except Exception as e:
+                error_msg = f"Error reading creation logs {chunk_start}-{chunk_end}: {e}"
+                logger.error(error_msg)
+                sync_result["errors"].append(error_msg)
+                # Stop here so the next sync resumes with this range
+                break
+            
+            provenance = []
+            for log in logs:
+                event = created_event.process_log(log)
+                provenance.append((event['args']['id'], event['blockNumber'], Web3.to_hex(event['transactionHash'])))
+            if provenance:
+                self.db.set_capsule_provenance(provenance)
+            self.db.update_provenance_block(chunk_end)
+    
+    def _find_deployment_block(self, to_block: int) -> int:
+        """
+        First block at which the contract has code, by binary search over eth_getCode
+        
+        About log2(to_block) calls; the node has to serve state at old blocks.
+        """
+        def has_code(block: int) -> bool:
+            return len(self.w3.eth.get_code(self.contract.address, block_identifier=block)) > 0
+        
+        if not has_code(to_block):
+            raise ValueError(f"no contract code at {self.contract.address} in block {to_block}")
+        low, high = 0, to_block
+        while low < high:
+            middle = (low + high) // 2
+            if has_code(middle):
+                high = middle
+            else:
+                low = middle + 1
+        return low
+    
+    def _store_capsules(self, capsules: List[Dict[str, Any]], sync_result: Dict[str, Any]):
+        """Upsert fetched capsules in one transaction and count the new / changed ones"""
+        if not capsules:
+            return
+        
+        now = time.time()
+        for capsule_data in capsules:
+            if capsule_data['is_revealed']:
+                self.reveal_scheduler.discard(capsule_data['id'])
+            else:
+                self.reveal_scheduler.schedule(capsule_data['id'], capsule_data['reveal_time'], checked_at=now)
+        
+        counts = self.db.upsert_capsules(capsules)
+        sync_result["new_capsules"] += counts["new"]
+        sync_result["updated_capsules"] += counts["updated"]
+        if counts["new"] or counts["updated"]:
+            logger.info(f"Stored capsules #{capsules[0]['id']}-#{capsules[-1]['id']}: "
+                       f"{counts['new']} new, {counts['updated']} updated")
+    
+    def _sync_from_logs(self, from_block: int, to_block: int, sync_result: Dict[str, Any]) -> int:
+        """
+        Apply CapsuleCreated / CapsuleRevealed events emitted in [from_block, to_block]
+        
+        The range is walked in chunks of at most ``_log_chunk_size`` blocks so that
+        public RPC endpoints don't reject the eth_getLogs request. Capsule reads are
+        pinned to ``to_block``.
+        
+        Args:
+            from_block: First block to scan (inclusive)
+            to_block: Last block to scan (inclusive), normally the pinned head
+            sync_result: Sync result dictionary to update in place
+            
+        Returns:
+            The last block whose events were fully applied
+        """
+        synced_block = from_block - 1
+        
+        for chunk_start in range(max(from_block, self.start_block), to_block + 1, self._log_chunk_size):
+            chunk_end = min(chunk_start + self._log_chunk_size - 1, to_block)
+            try:
+                events = self._get_capsule_events(chunk_start, chunk_end)
+                self._apply_events(events, to_block, sync_result)
+                synced_block = chunk_end
+            except Exception as e:
+                error_msg = f"Error syncing blocks {chunk_start}-{chunk_end}: {e}"
+                logger.error(error_msg)
+                sync_result["errors"].append(error_msg)
+                # Stop here so the next sync retries this range
+                break
+        else:
+            synced_block = max(synced_block, to_block)
+        
+        return synced_block
+    
+    def _get_capsule_events(self, from_block: int, to_block: int) -> List[Any]:
+        """
+        Fetch and decode all capsule events in a block range with a single eth_getLogs call
+        
+        Returns:
+            Decoded events ordered by block number and log index
+        """
+        logs = self.w3.eth.get_logs({
+            'address': self.contract.address,
+            'fromBlock': from_block,
+            'toBlock': to_block,
+            'topics': [list(self._event_topics.keys())]
+        })
+        
+        events = []
+        for log in logs:
+            event = self._event_topics.get(bytes(log['topics'][0]))
+            if event is not None:
+                events.append(event.process_log(log))
+        
+        events.sort(key=lambda e: (e['blockNumber'], e['logIndex']))
+        return events
+    
+    def _apply_events(self, events: List[Any], block_identifier: int, sync_result: Dict[str, Any]):
+        """Apply decoded capsule events to the database, reading capsules at block_identifier"""
+        # The created event doesn't carry the encrypted story, so read those capsules in one batch
+        created_ids = [event['args']['id'] for event in events if event['event'] == 'CapsuleCreated']
+        created_capsules = self.fetch_capsules_batch(created_ids, block_identifier) if created_ids else {}
+        missing_ids = [capsule_id for capsule_id in created_ids if created_capsules.get(capsule_id) is None]
+        if missing_ids:
+            raise Exception(f"Could not fetch created capsules {missing_ids}")
+        provenance = []
+        for event in events:
+            if event['event'] == 'CapsuleCreated':
+                capsule_data = created_capsules[event['args']['id']]
+                capsule_data['block_number'] = event['blockNumber']
+                capsule_data['transaction_hash'] = Web3.to_hex(event['transactionHash'])
+                provenance.append((event['args']['id'], event['blockNumber'], capsule_data['transaction_hash']))
+        self._store_capsules([created_capsules[capsule_id] for capsule_id in created_ids], sync_result)
+        if provenance:
+            # Rows that already existed keep their content but gain their mint location
+            self.db.set_capsule_provenance(provenance)
+        sync_result["capsules_synced"] += len(created_ids)
+        
+        journal_entries = []
+        for event in events:
+            capsule_id = event['args']['id']
+            action = 'created' if event['event'] == 'CapsuleCreated' else 'revealed'
+            journal_entries.append((event['blockNumber'], Web3.to_hex(event['blockHash']), capsule_id, action))
+            
+            if event['event'] == 'CapsuleRevealed':
+                if self.db.get_capsule(capsule_id) is None:
+                    # Created before our checkpoint but never stored; read it whole
+                    capsule_data = self._fetch_capsule_from_blockchain(capsule_id, block_identifier)
+                    if capsule_data is None:
+                        raise Exception(f"Could not fetch revealed capsule #{capsule_id}")
+                    self._store_capsules([capsule_data], sync_result)
+                else:
+                    self.reveal_scheduler.discard(capsule_id)
+                    if self.db.mark_capsule_revealed(capsule_id, event['args']['plaintextStory']):
+                        sync_result["updated_capsules"] += 1
+                        logger.info(f"Updated capsule #{capsule_id} (revealed: True)")
+                sync_result["capsules_synced"] += 1
+        
+        if journal_entries:
+            self.db.journal_blocks(journal_entries)
+    
+    def _journal_checkpoint(self, block_number: int):
+        """Record the checkpoint block's hash and drop journal entries too old to be reorged"""
+        block = self.w3.eth.get_block(block_number)
+        self.db.journal_blocks([(block_number, Web3.to_hex(block['hash']), None, 'checkpoint')])
+        self.db.prune_journal(block_number - self.journal_depth)
+    
+    def _detect_reorg(self) -> Optional[int]:
+        """
+        Compare journaled block hashes with the canonical chain, newest first
+        
+        In the normal case the newest journaled block still matches and this costs
+        a single eth_getBlockByNumber call. Only a hash mismatch counts as a reorg:
+        RPC errors (rate limits, a lagging node that doesn't have the block yet)
+        propagate, so the sync pass fails and is retried instead of rolling back.
+        
+        Returns:
+            None if there was no reorg, otherwise the newest journaled block that is
+            still canonical (0 if none is, meaning everything must be re-read)
+        """
+        journal = self.db.get_journal_blocks()
+        for index, entry in enumerate(journal):
+            canonical_hash = Web3.to_hex(self.w3.eth.get_block(entry['block_number'])['hash'])
+            if canonical_hash == entry['block_hash']:
+                return None if index == 0 else entry['block_number']
+        return 0 if journal else None
+    
+    def _rollback_to(self, ancestor_block: int, sync_result: Dict[str, Any]):
+        """Roll back every journaled change after ancestor_block so it can be re-applied"""
+        rolled_back = self.db.rollback_journal_after(ancestor_block)
+        logger.warning(f"Reorg detected: rolled back {len(rolled_back)} capsules to block #{ancestor_block}")
+        sync_result["reorg"] = {"ancestor_block": ancestor_block, "rolled_back_capsules": rolled_back}
+        
+        # Reverted reveals are locked again; deleted capsules are gone
+        for capsule_id in rolled_back:
+            capsule = self.db.get_capsule(capsule_id)
+            if capsule is None:
+                self.reveal_scheduler.discard(capsule_id)
+            elif not capsule['is_revealed']:
+                self.reveal_scheduler.schedule(capsule_id, capsule['reveal_time'])
+    
+    def _recheck_due_capsules(self, block_identifier: Optional[int], sync_result: Dict[str, Any]):
+        """
+        Re-fetch only the locked capsules whose reveal time has passed
+        
+        Capsules still locked in the future are never polled, and revealed
+        capsules are never re-fetched.
+        """
+        if not self._reveal_scheduler_loaded:
+            # Seed the scheduler once from the indexed (is_revealed, reveal_time) query
+            for capsule in self.db.get_unrevealed_capsules():
+                self.reveal_scheduler.schedule(capsule['id'], capsule['reveal_time'])
+            self._reveal_scheduler_loaded = True
+        
+        now = time.time()
+        due_ids = self.reveal_scheduler.pop_due(now, limit=self.batch_size)
+        if not due_ids:
+            return
+        
+        capsules = {}
+        stored = False
+        try:
+            capsules = self.fetch_capsules_batch(due_ids, block_identifier)
+            fetched = [capsules[capsule_id] for capsule_id in due_ids if capsules.get(capsule_id) is not None]
+            self._store_capsules(fetched, sync_result)
+            stored = True
+            sync_result["rechecked_capsules"] += len(fetched)
+        finally:
+            # pop_due took these off the heap; anything not stored as revealed goes back on,
+            # including the whole batch when the fetch or the write failed
+            for capsule_id in due_ids:
+                capsule_data = capsules.get(capsule_id)
+                if not stored or capsule_data is None or not capsule_data['is_revealed']:
+                    self.reveal_scheduler.reschedule(capsule_id, now)
+    
+    def _fetch_capsule_from_blockchain(self, capsule_id: int,
+                                       block_identifier: Optional[int] = None) -> Optional[Dict[str, Any]]:
         """
         Fetch a single capsule from the blockchain
         
         Args:
             capsule_id: The capsule ID to fetch
+            block_identifier: Block number to read at (defaults to the current head)
             
         Returns:
             Dictionary with capsule data or None if error
         """
         try:
+            if block_identifier is None:
+                block_identifier = self.w3.eth.block_number
+            
             # Call contract getCapsule function
-            capsule_tuple = self.contract.functions.getCapsule(capsule_id).call()
+            capsule_tuple = self.contract.functions.getCapsule(capsule_id).call(block_identifier=block_identifier)
             
             # Convert tuple to dictionary based on contract struct
-            # struct Capsule {
-            #     address creator;
-            #     string title;
-            #     string tags;
-            #     bytes encryptedStory;
-            #     string decryptedStory;
-            #     bool isRevealed;
-            #     uint256 revealTime;
-            #     string shutterIdentity;
-            #     string imageCID;
-            # }
-            
-            capsule_data = {
-                'id': capsule_id,
-                'creator': capsule_tuple[0],
-                'title': capsule_tuple[1],
-                'tags': capsule_tuple[2],
-                'encrypted_story': capsule_tuple[3],  # bytes
-                'decrypted_story': capsule_tuple[4],
-                'is_revealed': capsule_tuple[5],
-                'reveal_time': capsule_tuple[6],
-                'shutter_identity': capsule_tuple[7],
-                'image_cid': capsule_tuple[8],
-                'block_number': self.w3.eth.block_number,  # Current block for tracking
-                'transaction_hash': None  # We could fetch this from events if needed
-            }
+            capsule_data = self._capsule_from_tuple(capsule_id, capsule_tuple)
             
             return capsule_data
             
@@ -221,6 +875,87 @@ class BlockchainSyncService:
             logger.error(f"Error fetching capsule #{capsule_id} from blockchain: {e}")
             return None
     
+    def fetch_capsules_batch(self, capsule_ids,
+                             block_identifier: Optional[int] = None) -> Dict[int, Optional[Dict[str, Any]]]:
+        """
+        Fetch many capsules with one Multicall3 aggregate3 request per ``batch_size`` ids
+        
+        Falls back to one getCapsule call per capsule when Multicall3 is disabled
+        or unavailable on the connected network.
+        
+        Args:
+            capsule_ids: Iterable of capsule IDs to fetch
+            block_identifier: Block number every call is pinned to (defaults to the current head)
+            
+        Returns:
+            Dictionary mapping each capsule ID to its data, or None if its call failed
+        """
+        capsule_ids = list(capsule_ids)
+        if block_identifier is None:
+            block_identifier = self.w3.eth.block_number
+        if self.multicall is None:
+            return {
+                capsule_id: self._fetch_capsule_from_blockchain(capsule_id, block_identifier)
+                for capsule_id in capsule_ids
+            }
+        
+        capsules = {}
+        for batch_start in range(0, len(capsule_ids), self.batch_size):
+            batch_ids = capsule_ids[batch_start:batch_start + self.batch_size]
+            calls = [
+                (self.contract.address, True, self.contract.encodeABI(fn_name='getCapsule', args=[capsule_id]))
+                for capsule_id in batch_ids
+            ]
+            
+            try:
+                results = self.multicall.functions.aggregate3(calls).call(block_identifier=block_identifier)
+            except Exception as e:
+                logger.warning(f"Multicall3 batch failed, falling back to single calls: {e}")
+                for capsule_id in batch_ids:
+                    capsules[capsule_id] = self._fetch_capsule_from_blockchain(capsule_id, block_identifier)
+                continue
+            
+            for capsule_id, (success, return_data) in zip(batch_ids, results):
+                if not success:
+                    logger.error(f"Error fetching capsule #{capsule_id} from blockchain: call reverted")
+                    capsules[capsule_id] = None
+                    continue
+                capsule_tuple = self.w3.codec.decode(self._capsule_output_types, return_data)[0]
+                capsules[capsule_id] = self._capsule_from_tuple(capsule_id, capsule_tuple)
+        
+        return capsules
+    
+    def _capsule_from_tuple(self, capsule_id: int, capsule_tuple) -> Dict[str, Any]:
+        """
+        Convert a getCapsule() result tuple to a capsule dictionary
+        
+        struct Capsule {
+            address creator;
+            string title;
+            string tags;
+            bytes encryptedStory;
+            string decryptedStory;
+            bool isRevealed;
+            uint256 revealTime;
+            string shutterIdentity;
+            string imageCID;
+        }
+        """
+        return {
+            'id': capsule_id,
+            'creator': Web3.to_checksum_address(capsule_tuple[0]),
+            'title': capsule_tuple[1],
+            'tags': capsule_tuple[2],
+            'encrypted_story': capsule_tuple[3],  # bytes
+            'decrypted_story': capsule_tuple[4],
+            'is_revealed': capsule_tuple[5],
+            'reveal_time': capsule_tuple[6],
+            'shutter_identity': capsule_tuple[7],
+            'image_cid': capsule_tuple[8],
+            'block_number': None,  # Creation block and transaction come from the CapsuleCreated log
+            'transaction_hash': None
+        }
+    
     def force_sync(self) -> Dict[str, Any]:
         """
         Force an immediate synchronization (useful for API calls)
@@ -241,33 +976,41 @@ class BlockchainSyncService:
         try:
             sync_status = self.db.get_sync_status()
             current_time = int(time.time())
-            last_sync_time = sync_status.get('last_sync_time', 0)
+            last_sync_time = sync_status.get('last_sync_time')
+            seconds_since_sync = current_time - last_sync_time if last_sync_time is not None else None
             
-            # Check if sync is healthy (synced within last 60 seconds)
-            is_healthy = (current_time - last_sync_time) < 60
+            # Check if sync is healthy (has synced, and within last 60 seconds or receiving pushed logs)
+            is_healthy = seconds_since_sync is not None and (seconds_since_sync < 60 or self._subscription_connected)
             
             # Get current blockchain state
             current_block = self.w3.eth.block_number
-            blockchain_capsules = self.contract.functions.capsuleCount().call()
+            blockchain_capsules = self.contract.functions.capsuleCount().call(block_identifier=current_block)
             database_capsules = self.db.get_capsule_count()
             
             return {
                 "is_healthy": is_healthy,
                 "is_running": self._sync_thread is not None and self._sync_thread.is_alive(),
                 "last_sync_time": last_sync_time,
-                "seconds_since_sync": current_time - last_sync_time,
+                "seconds_since_sync": seconds_since_sync,
                 "current_block": current_block,
                 "last_synced_block": sync_status.get('last_synced_block', 0),
                 "blockchain_capsules": blockchain_capsules,
                 "database_capsules": database_capsules,
                 "sync_drift": blockchain_capsules - database_capsules,
                 "recent_errors": sync_status.get('sync_errors', ''),
-                "sync_interval": self._sync_interval
+                "sync_interval": self._sync_interval,
+                "confirmations": self.confirmations,
+                "sync_mode": "subscription" if self._subscription_enabled() else "polling",
+                "subscription_connected": self._subscription_connected,
+                "rpc_endpoints": self.provider.stats(),
+                "locked_capsules_tracked": len(self.reveal_scheduler),
+                "next_reveal_check": self.reveal_scheduler.next_due()
             }
             
         except Exception as e:
             logger.error(f"Error getting sync health: {e}")
             return {
                 "is_healthy": False,
-                "error": str(e)
+                "error": str(e),
+                "rpc_endpoints": self.provider.stats()
             }
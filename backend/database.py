@@ -1,102 +1,753 @@
 # database.py - SQLite database management for Ethereum Time Capsule
 import sqlite3
 import json
+import re
 import time
 import threading
-from typing import Dict, List, Optional, Any
+import queue
+from typing import Dict, List, Optional, Any, Iterator, Callable
+from concurrent.futures import Future
 from contextlib import contextmanager
 import logging
+from query_metrics import QueryMetrics, InstrumentedConnection, timed
+from serialization import story_hex
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Schema migrations, applied in order by init_database. Each entry moves the
+# database to ``version``, recorded in PRAGMA user_version, inside one
+# transaction; a step is SQL or a callable taking the connection. Databases created before versioning report version 0, which is
+# why the early statements use IF NOT EXISTS. Append new migrations; never edit
+# one that has shipped.
+MIGRATIONS = [
+    (1, "capsules and sync status", [
+        """
+        CREATE TABLE IF NOT EXISTS capsules (
+            id INTEGER PRIMARY KEY,
+            creator TEXT NOT NULL,
+            title TEXT NOT NULL,
+            tags TEXT NOT NULL,
+            encrypted_story BLOB NOT NULL,
+            decrypted_story TEXT DEFAULT '',
+            is_revealed BOOLEAN DEFAULT 0,
+            reveal_time INTEGER NOT NULL,
+            shutter_identity TEXT NOT NULL,
+            image_cid TEXT NOT NULL,
+            block_number INTEGER,
+            transaction_hash TEXT,
+            created_at INTEGER DEFAULT (strftime('%s', 'now')),
+            updated_at INTEGER DEFAULT (strftime('%s', 'now'))
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS sync_status (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            last_synced_block INTEGER DEFAULT 0,
+            last_sync_time INTEGER DEFAULT (strftime('%s', 'now')),
+            total_capsules INTEGER DEFAULT 0,
+            sync_errors TEXT DEFAULT ''
+        )
+        """,
+        """
+        INSERT OR IGNORE INTO sync_status (id, last_synced_block, total_capsules)
+        VALUES (1, 0, 0)
+        """,
+    ]),
+    (2, "backfill checkpoints and reorg journal", [
+        """
+        CREATE TABLE IF NOT EXISTS backfill_chunks (
+            chunk_start INTEGER PRIMARY KEY,
+            chunk_end INTEGER NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            capsules_synced INTEGER DEFAULT 0,
+            updated_at INTEGER DEFAULT (strftime('%s', 'now'))
+        )
+        """,
+        # Blocks the sync engine applied, with the capsule changes each one caused,
+        # so a reorg can be rolled back row by row
+        """
+        CREATE TABLE IF NOT EXISTS sync_journal (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            block_number INTEGER NOT NULL,
+            block_hash TEXT NOT NULL,
+            capsule_id INTEGER,
+            action TEXT NOT NULL
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_sync_journal_block ON sync_journal (block_number)",
+    ]),
+    (3, "indexes for gallery, creator, timeline and reveal queries", [
+        "CREATE INDEX IF NOT EXISTS idx_capsules_creator ON capsules (creator)",
+        "CREATE INDEX IF NOT EXISTS idx_capsules_created_at ON capsules (created_at)",
+        # revealed_only pages: filter and ORDER BY id DESC from one index
+        "CREATE INDEX IF NOT EXISTS idx_capsules_revealed_id ON capsules (is_revealed, id)",
+        "CREATE INDEX IF NOT EXISTS idx_capsules_reveal_time ON capsules (reveal_time)",
+        # Lets the reveal scheduler find locked capsules by reveal time
+        "CREATE INDEX IF NOT EXISTS idx_capsules_reveal_due ON capsules (is_revealed, reveal_time)",
+        # Timeline queries by creation block
+        "CREATE INDEX IF NOT EXISTS idx_capsules_block ON capsules (block_number)",
+    ]),
+    (4, "full-text search over title, tags and revealed story", [
+        # External-content FTS5 index: the text lives in capsules, triggers keep the index current
+        """
+        CREATE VIRTUAL TABLE IF NOT EXISTS capsules_fts USING fts5(
+            title, tags, decrypted_story,
+            content = 'capsules', content_rowid = 'id',
+            tokenize = 'unicode61 remove_diacritics 2',
+            prefix = '2 3'
+        )
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS capsules_fts_insert AFTER INSERT ON capsules BEGIN
+            INSERT INTO capsules_fts (rowid, title, tags, decrypted_story)
+            VALUES (new.id, new.title, new.tags, new.decrypted_story);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS capsules_fts_delete AFTER DELETE ON capsules BEGIN
+            INSERT INTO capsules_fts (capsules_fts, rowid, title, tags, decrypted_story)
+            VALUES ('delete', old.id, old.title, old.tags, old.decrypted_story);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS capsules_fts_update
+        AFTER UPDATE OF title, tags, decrypted_story ON capsules BEGIN
+            INSERT INTO capsules_fts (capsules_fts, rowid, title, tags, decrypted_story)
+            VALUES ('delete', old.id, old.title, old.tags, old.decrypted_story);
+            INSERT INTO capsules_fts (rowid, title, tags, decrypted_story)
+            VALUES (new.id, new.title, new.tags, new.decrypted_story);
+        END
+        """,
+        "INSERT INTO capsules_fts (capsules_fts) VALUES ('rebuild')",
+    ]),
+    (5, "trigger-maintained capsule counters", [
+        """
+        CREATE TABLE IF NOT EXISTS capsule_stats (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            total_capsules INTEGER NOT NULL DEFAULT 0,
+            revealed_capsules INTEGER NOT NULL DEFAULT 0
+        )
+        """,
+        """
+        INSERT OR REPLACE INTO capsule_stats (id, total_capsules, revealed_capsules)
+        SELECT 1, COUNT(*), COUNT(*) FILTER (WHERE is_revealed = 1) FROM capsules
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS capsule_stats_insert AFTER INSERT ON capsules BEGIN
+            UPDATE capsule_stats SET
+                total_capsules = total_capsules + 1,
+                revealed_capsules = revealed_capsules + (new.is_revealed = 1)
+            WHERE id = 1;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS capsule_stats_delete AFTER DELETE ON capsules BEGIN
+            UPDATE capsule_stats SET
+                total_capsules = total_capsules - 1,
+                revealed_capsules = revealed_capsules - (old.is_revealed = 1)
+            WHERE id = 1;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS capsule_stats_reveal AFTER UPDATE OF is_revealed ON capsules
+        WHEN (old.is_revealed = 1) IS NOT (new.is_revealed = 1) BEGIN
+            UPDATE capsule_stats SET
+                revealed_capsules = revealed_capsules + (new.is_revealed = 1) - (old.is_revealed = 1)
+            WHERE id = 1;
+        END
+        """,
+    ]),
+    (6, "normalized tag index and tag counts", [
+        """
+        CREATE TABLE IF NOT EXISTS capsule_tags (
+            tag TEXT NOT NULL,
+            capsule_id INTEGER NOT NULL,
+            PRIMARY KEY (tag, capsule_id)
+        ) WITHOUT ROWID
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_capsule_tags_capsule ON capsule_tags (capsule_id)",
+        """
+        CREATE TABLE IF NOT EXISTS tag_counts (
+            tag TEXT PRIMARY KEY,
+            capsule_count INTEGER NOT NULL
+        ) WITHOUT ROWID
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_tag_counts_count ON tag_counts (capsule_count DESC, tag)",
+        # Tags are split by the writer (split_tags); the triggers drop stale rows and keep counts
+        """
+        CREATE TRIGGER IF NOT EXISTS capsule_tags_delete AFTER DELETE ON capsules BEGIN
+            DELETE FROM capsule_tags WHERE capsule_id = old.id;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS capsule_tags_update AFTER UPDATE OF tags ON capsules
+        WHEN old.tags IS NOT new.tags BEGIN
+            DELETE FROM capsule_tags WHERE capsule_id = old.id;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS tag_counts_insert AFTER INSERT ON capsule_tags BEGIN
+            INSERT INTO tag_counts (tag, capsule_count) VALUES (new.tag, 1)
+            ON CONFLICT(tag) DO UPDATE SET capsule_count = capsule_count + 1;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS tag_counts_delete AFTER DELETE ON capsule_tags BEGIN
+            UPDATE tag_counts SET capsule_count = capsule_count - 1 WHERE tag = old.tag;
+            DELETE FROM tag_counts WHERE tag = old.tag AND capsule_count <= 0;
+        END
+        """,
+        lambda conn: _write_capsule_tags(conn, conn.execute("SELECT id, tags FROM capsules").fetchall()),
+    ]),
+    (7, "lower-case creator column and per-creator counters", [
+        # Written by the capsule writers; checksummed and lower-case addresses then share one index
+        "ALTER TABLE capsules ADD COLUMN creator_lower TEXT",
+        "UPDATE capsules SET creator_lower = lower(creator)",
+        "DROP INDEX IF EXISTS idx_capsules_creator",
+        "CREATE INDEX IF NOT EXISTS idx_capsules_creator_lower ON capsules (creator_lower, id)",
+        """
+        CREATE TABLE IF NOT EXISTS creator_stats (
+            creator_lower TEXT PRIMARY KEY,
+            capsule_count INTEGER NOT NULL DEFAULT 0,
+            revealed_count INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+        """,
+        """
+        INSERT INTO creator_stats (creator_lower, capsule_count, revealed_count)
+        SELECT creator_lower, COUNT(*), COUNT(*) FILTER (WHERE is_revealed = 1)
+        FROM capsules GROUP BY creator_lower
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS creator_stats_insert AFTER INSERT ON capsules BEGIN
+            INSERT INTO creator_stats (creator_lower, capsule_count, revealed_count)
+            VALUES (new.creator_lower, 1, new.is_revealed = 1)
+            ON CONFLICT(creator_lower) DO UPDATE SET
+                capsule_count = capsule_count + 1,
+                revealed_count = revealed_count + (new.is_revealed = 1);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS creator_stats_delete AFTER DELETE ON capsules BEGIN
+            UPDATE creator_stats SET
+                capsule_count = capsule_count - 1,
+                revealed_count = revealed_count - (old.is_revealed = 1)
+            WHERE creator_lower = old.creator_lower;
+            DELETE FROM creator_stats WHERE creator_lower = old.creator_lower AND capsule_count <= 0;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS creator_stats_update AFTER UPDATE OF creator_lower, is_revealed ON capsules
+        WHEN old.creator_lower IS NOT new.creator_lower OR (old.is_revealed = 1) IS NOT (new.is_revealed = 1) BEGIN
+            UPDATE creator_stats SET
+                capsule_count = capsule_count - 1,
+                revealed_count = revealed_count - (old.is_revealed = 1)
+            WHERE creator_lower = old.creator_lower;
+            DELETE FROM creator_stats WHERE creator_lower = old.creator_lower AND capsule_count <= 0;
+            INSERT INTO creator_stats (creator_lower, capsule_count, revealed_count)
+            VALUES (new.creator_lower, 1, new.is_revealed = 1)
+            ON CONFLICT(creator_lower) DO UPDATE SET
+                capsule_count = capsule_count + 1,
+                revealed_count = revealed_count + (new.is_revealed = 1);
+        END
+        """,
+    ]),
+    (8, "precomputed hex form of the encrypted story", [
+        # Written by the capsule writers so API responses don't hex-encode every row they serve
+        "ALTER TABLE capsules ADD COLUMN encrypted_story_hex TEXT",
+        """
+        UPDATE capsules SET encrypted_story_hex = CASE typeof(encrypted_story)
+            WHEN 'blob' THEN lower(hex(encrypted_story)) ELSE encrypted_story END
+        """,
+    ]),
+    (9, "capsule event sequence for the live feed", [
+        # seq is the Server-Sent Events id; AUTOINCREMENT so ids are never reused after a rollback
+        """
+        CREATE TABLE IF NOT EXISTS capsule_events (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            event TEXT NOT NULL,
+            capsule_id INTEGER NOT NULL,
+            created_at INTEGER DEFAULT (strftime('%s', 'now'))
+        )
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS capsule_events_created AFTER INSERT ON capsules BEGIN
+            INSERT INTO capsule_events (event, capsule_id) VALUES ('capsule_created', new.id);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS capsule_events_revealed AFTER UPDATE OF is_revealed ON capsules
+        WHEN new.is_revealed = 1 AND old.is_revealed IS NOT 1 BEGIN
+            INSERT INTO capsule_events (event, capsule_id) VALUES ('capsule_revealed', new.id);
+        END
+        """,
+    ]),
+    (10, "clear legacy creation blocks and track the provenance scan", [
+        # Before provenance was tracked, block_number held the chain head at fetch time
+        "UPDATE capsules SET block_number = NULL WHERE transaction_hash IS NULL",
+        "CREATE INDEX IF NOT EXISTS idx_capsules_missing_provenance ON capsules (id) WHERE transaction_hash IS NULL",
+        # Last block whose CapsuleCreated logs were scanned for missing provenance
+        "ALTER TABLE sync_status ADD COLUMN provenance_synced_block INTEGER DEFAULT 0",
+    ]),
+    (11, "capsule_removed events for capsules rolled back by a reorg", [
+        """
+        CREATE TRIGGER IF NOT EXISTS capsule_events_removed AFTER DELETE ON capsules BEGIN
+            INSERT INTO capsule_events (event, capsule_id) VALUES ('capsule_removed', old.id);
+        END
+        """,
+    ]),
+    (12, "no sync time until the first sync", [
+        # The status row is created with last_sync_time = now, which made a fresh database look freshly synced
+        "UPDATE sync_status SET last_sync_time = NULL WHERE last_synced_block = 0 AND total_capsules = 0",
+    ]),
+]
+
+
+def split_tags(tags: Optional[str]) -> List[str]:
+    """Normalize a comma-separated tags string: trimmed, lower-case, no '#', no duplicates"""
+    normalized = []
+    for tag in (tags or "").split(","):
+        tag = tag.strip().lstrip("#").strip().lower()
+        if tag and tag not in normalized:
+            normalized.append(tag)
+    return normalized
+
+
+def normalize_address(address: Optional[str]) -> str:
+    """Lower-case form of an address (or address prefix) as stored in capsules.creator_lower"""
+    address = (address or "").strip().lower()
+    if address and not address.startswith("0x"):
+        address = "0x" + address
+    return address
+
+
+def _prefix_range(prefix: str) -> tuple:
+    """[low, high) bounds matching every string that starts with ``prefix``, for index range scans"""
+    return prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def _write_capsule_tags(conn: sqlite3.Connection, capsules) -> None:
+    """Add the capsule_tags rows of each capsule; existing (tag, capsule) pairs are left alone"""
+    conn.executemany(
+        "INSERT OR IGNORE INTO capsule_tags (tag, capsule_id) VALUES (?, ?)",
+        [(tag, capsule['id']) for capsule in capsules for tag in split_tags(capsule['tags'])]
+    )
+
+
+# Insert a capsule, or update the existing row only when its on-chain content
+# changed. Unlike INSERT OR REPLACE it never deletes the row, so created_at,
+# the creation event and the counters kept by the delete triggers are left alone.
+UPSERT_CAPSULE_SQL = """
+    INSERT INTO capsules (
+        id, creator, title, tags, encrypted_story, decrypted_story,
+        is_revealed, reveal_time, shutter_identity, image_cid,
+        block_number, transaction_hash, creator_lower, encrypted_story_hex
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(id) DO UPDATE SET
+        creator = excluded.creator,
+        creator_lower = excluded.creator_lower,
+        title = excluded.title,
+        tags = excluded.tags,
+        encrypted_story = excluded.encrypted_story,
+        encrypted_story_hex = excluded.encrypted_story_hex,
+        decrypted_story = excluded.decrypted_story,
+        is_revealed = excluded.is_revealed,
+        reveal_time = excluded.reveal_time,
+        shutter_identity = excluded.shutter_identity,
+        image_cid = excluded.image_cid,
+        block_number = COALESCE(excluded.block_number, capsules.block_number),
+        transaction_hash = COALESCE(excluded.transaction_hash, capsules.transaction_hash),
+        updated_at = strftime('%s', 'now')
+    WHERE capsules.is_revealed IS NOT excluded.is_revealed
+       OR capsules.decrypted_story IS NOT excluded.decrypted_story
+       OR capsules.creator IS NOT excluded.creator
+       OR capsules.title IS NOT excluded.title
+       OR capsules.tags IS NOT excluded.tags
+       OR capsules.encrypted_story IS NOT excluded.encrypted_story
+       OR capsules.reveal_time IS NOT excluded.reveal_time
+       OR capsules.shutter_identity IS NOT excluded.shutter_identity
+       OR capsules.image_cid IS NOT excluded.image_cid
+"""
+
+
+def _capsule_row(capsule: Dict[str, Any]) -> tuple:
+    """Parameters of UPSERT_CAPSULE_SQL for one capsule"""
+    return (
+        capsule['id'],
+        capsule['creator'],
+        capsule['title'],
+        capsule['tags'],
+        capsule['encrypted_story'],
+        capsule['decrypted_story'],
+        capsule['is_revealed'],
+        capsule['reveal_time'],
+        capsule['shutter_identity'],
+        capsule['image_cid'],
+        capsule.get('block_number'),
+        capsule.get('transaction_hash'),
+        normalize_address(capsule['creator']),
+        story_hex(capsule['encrypted_story'])
+    )
+
+
+# List queries in summary mode select these instead of capsules.*, so the
+# encrypted_story BLOB and its hex form are never read; only the size is reported.
+SUMMARY_COLUMNS = ", ".join([
+    "capsules.id", "capsules.creator", "capsules.title", "capsules.tags", "capsules.decrypted_story",
+    "capsules.is_revealed", "capsules.reveal_time", "capsules.shutter_identity", "capsules.image_cid",
+    "capsules.block_number", "capsules.transaction_hash", "capsules.created_at", "capsules.updated_at",
+    "length(capsules.encrypted_story) AS encrypted_story_size",
+])
+
+# Column weights for bm25(): a hit in the title counts most, then tags, then the story
+SEARCH_WEIGHTS = (10.0, 5.0, 1.0)
+
+# Writes that only touch sync bookkeeping, never what the API serves
+BOOKKEEPING_WRITES = {
+    "update_sync_status",
+    "plan_backfill_chunks",
+    "mark_backfill_chunk_done",
+    "clear_backfill_chunks",
+    "journal_blocks",
+    "prune_journal",
+    "update_provenance_block",
+    "prune_capsule_events",
+}
+
+
 class CapsuleDatabase:
-    def __init__(self, db_path: str = "capsules.db"):
+    def __init__(self, db_path: str = "capsules.db", pool_size: int = 8, busy_timeout: float = 5.0,
+                 cache_size_kb: int = 16384, mmap_size: int = 64 * 1024 * 1024,
+                 commit_batch_size: int = 256, commit_window: float = 0.002, slow_query_ms: float = 100,
+                 synchronous: str = "NORMAL"):
+        """
+        Args:
+            db_path: SQLite database file
+            pool_size: Idle connections kept open for reuse
+            busy_timeout: Seconds a writer waits for a lock before failing
+            cache_size_kb: Page cache per connection, in KiB
+            mmap_size: Bytes of the database file memory-mapped for reads (0 disables)
+            commit_batch_size: Most write operations grouped into one commit
+            commit_window: Seconds the writer waits for more writes before committing a batch
+            slow_query_ms: Statements slower than this land in the slow-query log
+            synchronous: SQLite synchronous level. NORMAL (WAL) keeps every commit
+                across an application crash, but the last commits can be lost on
+                power failure or an OS crash; FULL fsyncs the WAL on every commit.
+        """
+        if synchronous.upper() not in ("NORMAL", "FULL", "EXTRA"):
+            raise ValueError(f"Unsupported synchronous level: {synchronous}")
         self.db_path = db_path
+        self.pool_size = pool_size
+        self.busy_timeout = busy_timeout
+        self.cache_size_kb = cache_size_kb
+        self.mmap_size = mmap_size
+        self.commit_batch_size = commit_batch_size
+        self.commit_window = commit_window
+        self._pool = queue.LifoQueue(maxsize=pool_size)
+        self.synchronous = synchronous.upper()
+        self._closed = False
+        # Held while checking _closed and enqueueing, so close() can't slip its
+        # stop sentinel in between and leave a write waiting forever
+        self._submit_lock = threading.Lock()
+        self.metrics = QueryMetrics(slow_query_ms=slow_query_ms)
         self.init_database()
         
+        # Every write goes through one writer thread, so writers never contend
+        # for the SQLite lock and concurrent writes share a commit
+        self._write_queue = queue.Queue()
+        self._write_stats = {"writes": 0, "batches": 0, "failed": 0}
+        # Bumped after every commit that changed capsule data; response caches key on it
+        self.data_generation = 0
+        self._commit_listeners = []
+        self._writer = threading.Thread(target=self._writer_loop, args=(self._connect(),),
+                                        name="capsule-db-writer", daemon=True)
+        self._writer.start()
+        
     def init_database(self):
-        """Initialize the database with required tables"""
+        """Initialize the database, applying any schema migrations it hasn't had yet"""
         with self.get_connection() as conn:
-            conn.execute("""
-                CREATE TABLE IF NOT EXISTS capsules (
-                    id INTEGER PRIMARY KEY,
-                    creator TEXT NOT NULL,
-                    title TEXT NOT NULL,
-                    tags TEXT NOT NULL,
-                    encrypted_story BLOB NOT NULL,
-                    decrypted_story TEXT DEFAULT '',
-                    is_revealed BOOLEAN DEFAULT 0,
-                    reveal_time INTEGER NOT NULL,
-                    shutter_identity TEXT NOT NULL,
-                    image_cid TEXT NOT NULL,
-                    block_number INTEGER,
-                    transaction_hash TEXT,
-                    created_at INTEGER DEFAULT (strftime('%s', 'now')),
-                    updated_at INTEGER DEFAULT (strftime('%s', 'now'))
-                )
-            """)
-            
-            conn.execute("""
-                CREATE TABLE IF NOT EXISTS sync_status (
-                    id INTEGER PRIMARY KEY CHECK (id = 1),
-                    last_synced_block INTEGER DEFAULT 0,
-                    last_sync_time INTEGER DEFAULT (strftime('%s', 'now')),
-                    total_capsules INTEGER DEFAULT 0,
-                    sync_errors TEXT DEFAULT ''
-                )
-            """)
-            
-            # Insert initial sync status if not exists
-            conn.execute("""
-                INSERT OR IGNORE INTO sync_status (id, last_synced_block, total_capsules) 
-                VALUES (1, 0, 0)
-            """)
-            
-            conn.commit()
-            logger.info("Database initialized successfully")
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            for target, description, statements in MIGRATIONS:
+                if target <= version:
+                    continue
+                logger.info(f"Migrating database to schema v{target}: {description}")
+                try:
+                    conn.execute("BEGIN IMMEDIATE")
+                    for statement in statements:
+                        if callable(statement):
+                            statement(conn)
+                        else:
+                            conn.execute(statement)
+                    conn.execute(f"PRAGMA user_version = {target}")
+                    conn.commit()
+                except Exception as e:
+                    conn.rollback()
+                    logger.error(f"Database migration to schema v{target} failed: {e}")
+                    raise
+                version = target
+            logger.info(f"Database initialized successfully (schema v{version})")
+    
+    def _connect(self) -> sqlite3.Connection:
+        """Open a tuned connection: WAL journaling so readers don't wait on the sync writer"""
+        # check_same_thread is off because pooled connections move between request threads;
+        # a connection is only ever used by one thread at a time.
+        conn = sqlite3.connect(self.db_path, timeout=self.busy_timeout, factory=InstrumentedConnection,
+                               check_same_thread=False, cached_statements=256)
+        conn.metrics = self.metrics
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode = WAL")
+        # NORMAL: commits survive an app crash; fsyncs happen at checkpoints, not per commit
+        conn.execute(f"PRAGMA synchronous = {self.synchronous}")
+        conn.execute(f"PRAGMA busy_timeout = {int(self.busy_timeout * 1000)}")
+        conn.execute(f"PRAGMA cache_size = {-int(self.cache_size_kb)}")
+        conn.execute(f"PRAGMA mmap_size = {int(self.mmap_size)}")
+        conn.execute("PRAGMA temp_store = MEMORY")
+        # A REPLACE conflict resolution must fire the delete triggers that keep counters, FTS and tags in step
+        conn.execute("PRAGMA recursive_triggers = ON")
+        return conn
     
     @contextmanager
     def get_connection(self):
-        """Context manager for database connections"""
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
+        """
+        Context manager lending a pooled database connection
+        
+        Connections stay open between calls so the page cache and the prepared
+        statement cache survive; cursors left open are closed and anything left
+        uncommitted is rolled back before the connection goes back to the pool.
+        """
+        try:
+            conn = self._pool.get_nowait()
+        except queue.Empty:
+            conn = self._connect()
         try:
             yield conn
+        finally:
+            try:
+                conn.finish_cursors()
+                if conn.in_transaction:
+                    conn.rollback()
+                if self._closed:
+                    conn.close()
+                else:
+                    self._pool.put_nowait(conn)
+            except (queue.Full, sqlite3.Error):
+                conn.close()
+    
+    def _submit_write(self, operation, wait: bool = True):
+        """
+        Queue ``operation(conn)`` for the writer thread
+        
+        Returns the operation's result once its batch is committed, or with
+        ``wait=False`` a Future that resolves at that point.
+        """
+        future = Future()
+        with self._submit_lock:
+            if self._closed:
+                raise RuntimeError("Database is closed")
+            self._write_queue.put((operation, future))
+        return future.result() if wait else future
+    
+    def _writer_loop(self, conn: sqlite3.Connection):
+        """Writer thread: take queued writes and commit them in groups"""
+        try:
+            stopping = False
+            while not stopping:
+                item = self._write_queue.get()
+                if item is None:
+                    break
+                batch = [item]
+                deadline = time.monotonic() + self.commit_window
+                while len(batch) < self.commit_batch_size:
+                    try:
+                        item = self._write_queue.get(timeout=max(0, deadline - time.monotonic()))
+                    except queue.Empty:
+                        break
+                    if item is None:
+                        stopping = True
+                        break
+                    batch.append(item)
+                self._commit_batch(conn, batch)
         finally:
             conn.close()
     
-    def insert_capsule(self, capsule_data: Dict[str, Any]) -> bool:
+    def _commit_batch(self, conn: sqlite3.Connection, batch: List[tuple]):
+        """
+        Run a batch of write operations in one transaction
+        
+        Each operation gets a savepoint, so one that fails is undone on its own
+        and reported to its caller while the rest of the batch still commits.
+        """
+        outcomes = []
+        start = time.perf_counter()
+        data_changed = False
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for operation, future in batch:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                # Slow statements are attributed to the method that queued them
+                method = operation.__qualname__.split(".<locals>")[0].rsplit(".", 1)[-1]
+                self.metrics.current_method = method
+                changes_before = conn.total_changes
+                conn.execute("SAVEPOINT write_operation")
+                try:
+                    result = operation(conn)
+                    conn.finish_cursors()
+                    outcomes.append((future, result, None))
+                    conn.execute("RELEASE write_operation")
+                    if method not in BOOKKEEPING_WRITES and conn.total_changes != changes_before:
+                        data_changed = True
+                except Exception as e:
+                    conn.finish_cursors()
+                    conn.execute("ROLLBACK TO write_operation")
+                    conn.execute("RELEASE write_operation")
+                    outcomes.append((future, None, e))
+            self.metrics.current_method = "writer_commit"
+            conn.commit()
+            if data_changed:
+                self.data_generation += 1
+            self.metrics.record("writer_commit", (time.perf_counter() - start) * 1000, len(batch))
+        except Exception as e:
+            self.metrics.record("writer_commit", (time.perf_counter() - start) * 1000, failed=True)
+            logger.error(f"Error committing {len(batch)} queued writes: {e}")
+            if conn.in_transaction:
+                conn.rollback()
+            self._write_stats["failed"] += len(batch)
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        
+        self._write_stats["writes"] += len(batch)
+        self._write_stats["batches"] += 1
+        if data_changed:
+            for listener in self._commit_listeners:
+                try:
+                    listener()
+                except Exception as e:
+                    logger.error(f"Error in commit listener {listener}: {e}")
+        # Results are only released once the batch is committed (and, under
+        # synchronous=FULL, fsynced)
+        for future, result, error in outcomes:
+            if error is not None:
+                self._write_stats["failed"] += 1
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+    
+    def flush(self):
+        """Wait until every write queued so far is committed"""
+        self._submit_write(lambda conn: None)
+    
+    def get_metrics(self) -> Dict[str, Any]:
+        """Per-method latency histograms, slow-query log and writer queue statistics"""
+        return {**self.metrics.snapshot(), "writer": self.get_writer_stats()}
+    
+    def add_commit_listener(self, listener: Callable[[], None]):
+        """
+        Call ``listener()`` on the writer thread after every commit that changed capsule data
+        
+        Listeners run before the committed writes' callers are released, so keep them short.
+        """
+        self._commit_listeners.append(listener)
+    
+    def get_writer_stats(self) -> Dict[str, int]:
+        """Writes committed, commits they took, failed writes and the current queue length"""
+        return {**self._write_stats, "queued": self._write_queue.qsize()}
+    
+    @timed
+    def insert_capsule(self, capsule_data: Dict[str, Any], wait: bool = True) -> bool:
         """Insert or update a capsule in the database"""
+        def write(conn):
+            conn.execute(UPSERT_CAPSULE_SQL, _capsule_row(capsule_data))
+            _write_capsule_tags(conn, [capsule_data])
+            return True
+        
         try:
-            with self.get_connection() as conn:
-                conn.execute("""
-                    INSERT OR REPLACE INTO capsules (
-                        id, creator, title, tags, encrypted_story, decrypted_story,
-                        is_revealed, reveal_time, shutter_identity, image_cid,
-                        block_number, transaction_hash, updated_at
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, strftime('%s', 'now'))
-                """, (
-                    capsule_data['id'],
-                    capsule_data['creator'],
-                    capsule_data['title'], 
-                    capsule_data['tags'],
-                    capsule_data['encrypted_story'],
-                    capsule_data['decrypted_story'],
-                    capsule_data['is_revealed'],
-                    capsule_data['reveal_time'],
-                    capsule_data['shutter_identity'],
-                    capsule_data['image_cid'],
-                    capsule_data.get('block_number'),
-                    capsule_data.get('transaction_hash')
-                ))
-                conn.commit()
-                return True
+            return self._submit_write(write, wait)
         except Exception as e:
             logger.error(f"Error inserting capsule {capsule_data.get('id')}: {e}")
             return False
     
+    @timed
+    def upsert_capsules(self, capsules: List[Dict[str, Any]], wait: bool = True) -> Dict[str, int]:
+        """
+        Insert or update a batch of capsules in a single transaction
+        
+        Existing rows are only rewritten when their on-chain content differs,
+        so re-syncing unchanged capsules costs no writes.
+        
+        Returns:
+            Dictionary with the number of "new" and "updated" capsules
+        """
+        # Last occurrence wins if the batch repeats an id
+        capsules = list({capsule['id']: capsule for capsule in capsules}.values())
+        if not capsules:
+            return {"new": 0, "updated": 0}
+        
+        def write(conn):
+            placeholders = ",".join("?" * len(capsules))
+            cursor = conn.execute(f"SELECT COUNT(*) FROM capsules WHERE id IN ({placeholders})",
+                                  [capsule['id'] for capsule in capsules])
+            existing_count = cursor.fetchone()[0]
+            
+            # rowcount sums the rows each statement wrote, without the FTS trigger writes
+            cursor = conn.executemany(UPSERT_CAPSULE_SQL, [_capsule_row(capsule) for capsule in capsules])
+            
+            written = cursor.rowcount
+            _write_capsule_tags(conn, capsules)
+            
+            new_count = len(capsules) - existing_count
+            return {"new": new_count, "updated": written - new_count}
+        
+        try:
+            return self._submit_write(write, wait)
+        except Exception as e:
+            logger.error(f"Error upserting {len(capsules)} capsules: {e}")
+            raise
+    
+    @timed
+    def set_capsule_provenance(self, entries: List[tuple], wait: bool = True) -> bool:
+        """
+        Record where capsules were minted
+        
+        Args:
+            entries: (capsule_id, block_number, transaction_hash) tuples from CapsuleCreated logs
+        """
+        def write(conn):
+            conn.executemany("""
+                UPDATE capsules SET block_number = ?2, transaction_hash = ?3
+                WHERE id = ?1 AND (block_number IS NOT ?2 OR transaction_hash IS NOT ?3)
+            """, entries)
+            return True
+        
+        try:
+            return self._submit_write(write, wait)
+        except Exception as e:
+            logger.error(f"Error recording capsule provenance: {e}")
+            return False
+    
+    @timed
+    def mark_capsule_revealed(self, capsule_id: int, decrypted_story: str, wait: bool = True) -> bool:
+        """Apply a reveal to a stored capsule; returns True if the row changed"""
+        def write(conn):
+            cursor = conn.execute("""
+                UPDATE capsules SET
+                    is_revealed = 1,
+                    decrypted_story = ?,
+                    updated_at = strftime('%s', 'now')
+                WHERE id = ? AND (is_revealed = 0 OR decrypted_story != ?)
+            """, (decrypted_story, capsule_id, decrypted_story))
+            return cursor.rowcount > 0
+        
+        try:
+            return self._submit_write(write, wait)
+        except Exception as e:
+            logger.error(f"Error marking capsule {capsule_id} revealed: {e}")
+            return False
+    
+    @timed
     def get_capsule(self, capsule_id: int) -> Optional[Dict[str, Any]]:
         """Get a single capsule by ID"""
         try:
@@ -112,48 +763,255 @@ class CapsuleDatabase:
             logger.error(f"Error fetching capsule {capsule_id}: {e}")
             return None
     
-    def get_capsules(self, offset: int = 0, limit: int = 10, revealed_only: bool = False) -> List[Dict[str, Any]]:
-        """Get multiple capsules with pagination"""
+    @timed
+    def get_capsules_by_ids(self, capsule_ids: List[int], summary: bool = False) -> List[Dict[str, Any]]:
+        """
+        Get several capsules by ID in one query
+        
+        Capsules come back in the order of ``capsule_ids`` (duplicates once);
+        ids with no capsule are simply absent.
+        """
+        capsule_ids = list(dict.fromkeys(capsule_ids))
+        if not capsule_ids:
+            return []
+        try:
+            with self.get_connection() as conn:
+                placeholders = ",".join("?" * len(capsule_ids))
+                cursor = conn.execute(f"""
+                    SELECT {SUMMARY_COLUMNS if summary else "*"} FROM capsules WHERE id IN ({placeholders})
+                """, capsule_ids)
+                rows = {row["id"]: dict(row) for row in cursor.fetchall()}
+                return [rows[capsule_id] for capsule_id in capsule_ids if capsule_id in rows]
+        except Exception as e:
+            logger.error(f"Error fetching capsules {capsule_ids[:10]}: {e}")
+            return []
+    
+    @timed
+    def get_capsule_ciphertext(self, capsule_id: int, as_hex: bool = False) -> Optional[Any]:
+        """
+        Get only the encrypted story of a capsule, for clients that listed it in summary mode
+        
+        Returns the stored bytes, or with ``as_hex`` the precomputed hex string the API serves.
+        """
+        column = "encrypted_story_hex" if as_hex else "encrypted_story"
+        try:
+            with self.get_connection() as conn:
+                row = conn.execute(f"SELECT {column} FROM capsules WHERE id = ?", (capsule_id,)).fetchone()
+                return row[column] if row else None
+        except Exception as e:
+            logger.error(f"Error fetching ciphertext of capsule {capsule_id}: {e}")
+            return None
+    
+    @timed
+    def is_capsule_confirmed(self, capsule_id: int) -> bool:
+        """
+        Whether a capsule was minted at or below the confirmed sync checkpoint and
+        has no journaled change above it, so a reorg can no longer alter the row
+        
+        Rows applied from pushed tip logs, or without a known creation block, are
+        not confirmed.
+        """
+        try:
+            with self.get_connection() as conn:
+                row = conn.execute("""
+                    SELECT c.block_number <= s.last_synced_block AND NOT EXISTS (
+                        SELECT 1 FROM sync_journal j
+                        WHERE j.block_number > s.last_synced_block AND j.capsule_id = c.id
+                    )
+                    FROM capsules c, sync_status s
+                    WHERE c.id = ? AND s.id = 1
+                """, (capsule_id,)).fetchone()
+                return bool(row and row[0])
+        except Exception as e:
+            logger.error(f"Error checking confirmation of capsule {capsule_id}: {e}")
+            return False
+    
+    def _capsule_filters(self, revealed_only: bool = False, from_block: Optional[int] = None,
+                         to_block: Optional[int] = None) -> tuple:
+        """Build the WHERE clause and parameters shared by the list and count queries"""
+        conditions = []
+        params = []
+        if revealed_only:
+            conditions.append("is_revealed = 1")
+        if from_block is not None:
+            conditions.append("block_number >= ?")
+            params.append(from_block)
+        if to_block is not None:
+            conditions.append("block_number <= ?")
+            params.append(to_block)
+        where_clause = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        return where_clause, params
+    
+    @timed
+    def get_capsules(self, offset: int = 0, limit: int = 10, revealed_only: bool = False,
+                     from_block: Optional[int] = None, to_block: Optional[int] = None,
+                     before_id: Optional[int] = None, summary: bool = False) -> List[Dict[str, Any]]:
+        """
+        Get multiple capsules, newest first, optionally limited to a creation block range
+        
+        With ``before_id`` the page starts after that capsule (keyset paging, an index
+        seek however deep the page); otherwise ``offset`` rows are skipped. ``summary``
+        leaves out the ciphertext (see SUMMARY_COLUMNS).
+        """
         try:
             with self.get_connection() as conn:
-                where_clause = "WHERE is_revealed = 1" if revealed_only else ""
+                where_clause, params = self._capsule_filters(revealed_only, from_block, to_block)
+                if before_id is not None:
+                    where_clause += " AND id < ?" if where_clause else "WHERE id < ?"
+                    params.append(before_id)
+                    offset = 0
+                columns = SUMMARY_COLUMNS if summary else "*"
                 cursor = conn.execute(f"""
-                    SELECT * FROM capsules {where_clause}
+                    SELECT {columns} FROM capsules {where_clause}
                     ORDER BY id DESC LIMIT ? OFFSET ?
-                """, (limit, offset))
+                """, (*params, limit, offset))
                 return [dict(row) for row in cursor.fetchall()]
         except Exception as e:
             logger.error(f"Error fetching capsules: {e}")
             return []
     
-    def get_capsule_count(self) -> int:
-        """Get total number of capsules"""
+    @timed
+    def get_unrevealed_capsules(self) -> List[Dict[str, Any]]:
+        """Get id and reveal_time of every locked capsule, soonest reveal first"""
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.execute("""
+                    SELECT id, reveal_time FROM capsules
+                    WHERE is_revealed = 0
+                    ORDER BY reveal_time
+                """)
+                return [dict(row) for row in cursor.fetchall()]
+        except Exception as e:
+            logger.error(f"Error fetching unrevealed capsules: {e}")
+            return []
+    
+    @timed
+    def get_capsule_count(self, revealed_only: bool = False, from_block: Optional[int] = None,
+                          to_block: Optional[int] = None) -> int:
+        """Get number of capsules, optionally with the same filters as get_capsules"""
         try:
             with self.get_connection() as conn:
-                cursor = conn.execute("SELECT COUNT(*) as count FROM capsules")
+                if from_block is None and to_block is None:
+                    # Served from the trigger-maintained counters
+                    column = "revealed_capsules" if revealed_only else "total_capsules"
+                    return conn.execute(f"SELECT {column} FROM capsule_stats WHERE id = 1").fetchone()[0]
+                where_clause, params = self._capsule_filters(revealed_only, from_block, to_block)
+                cursor = conn.execute(f"SELECT COUNT(*) as count FROM capsules {where_clause}", params)
                 return cursor.fetchone()['count']
         except Exception as e:
             logger.error(f"Error getting capsule count: {e}")
             return 0
     
-    def update_sync_status(self, last_block: int, total_capsules: int, errors: str = '') -> bool:
-        """Update synchronization status"""
+    @timed
+    def get_capsule_stats(self, recent_hours: int = 24) -> Dict[str, int]:
+        """
+        Exact capsule statistics in one query
+        
+        Totals come from the counters the capsules triggers maintain; the recent
+        count is a range count on the created_at index, so neither reads capsule rows.
+        """
+        try:
+            cutoff_time = int(time.time()) - (recent_hours * 3600)
+            with self.get_connection() as conn:
+                row = conn.execute("""
+                    SELECT total_capsules, revealed_capsules,
+                           (SELECT COUNT(*) FROM capsules WHERE created_at > ?) AS recent_capsules
+                    FROM capsule_stats WHERE id = 1
+                """, (cutoff_time,)).fetchone()
+                return {
+                    "total_capsules": row['total_capsules'],
+                    "revealed_capsules": row['revealed_capsules'],
+                    "unrevealed_capsules": row['total_capsules'] - row['revealed_capsules'],
+                    "recent_capsules": row['recent_capsules']
+                }
+        except Exception as e:
+            logger.error(f"Error getting capsule stats: {e}")
+            return {"total_capsules": 0, "revealed_capsules": 0, "unrevealed_capsules": 0, "recent_capsules": 0}
+    
+    @timed
+    def update_provenance_block(self, block_number: int, wait: bool = True) -> bool:
+        """Record the last block whose creation logs were scanned for missing provenance"""
+        def write(conn):
+            conn.execute("UPDATE sync_status SET provenance_synced_block = ? WHERE id = 1", (block_number,))
+            return True
+        
+        try:
+            return self._submit_write(write, wait)
+        except Exception as e:
+            logger.error(f"Error updating provenance scan block: {e}")
+            return False
+    
+    @timed
+    def has_capsules_without_provenance(self) -> bool:
+        """Whether any capsule is missing its creation block and transaction (a partial-index probe)"""
         try:
             with self.get_connection() as conn:
-                conn.execute("""
-                    UPDATE sync_status SET 
-                        last_synced_block = ?,
-                        last_sync_time = strftime('%s', 'now'),
-                        total_capsules = ?,
-                        sync_errors = ?
-                    WHERE id = 1
-                """, (last_block, total_capsules, errors))
-                conn.commit()
-                return True
+                return conn.execute(
+                    "SELECT EXISTS (SELECT 1 FROM capsules WHERE transaction_hash IS NULL)"
+                ).fetchone()[0] == 1
+        except Exception as e:
+            logger.error(f"Error checking capsule provenance: {e}")
+            return False
+    
+    @timed
+    def update_sync_status(self, last_block: int, total_capsules: int, errors: str = '', wait: bool = True) -> bool:
+        """Update synchronization status"""
+        def write(conn):
+            conn.execute("""
+                UPDATE sync_status SET 
+                    last_synced_block = ?,
+                    last_sync_time = strftime('%s', 'now'),
+                    total_capsules = ?,
+                    sync_errors = ?
+                WHERE id = 1
+            """, (last_block, total_capsules, errors))
+            return True
+        
+        try:
+            return self._submit_write(write, wait)
         except Exception as e:
             logger.error(f"Error updating sync status: {e}")
             return False
     
+    @timed
+    def get_capsule_events(self, after_seq: int, limit: int = 500) -> List[Dict[str, Any]]:
+        """Capsule events (seq, event, capsule_id, created_at) with a sequence number above ``after_seq``, oldest first"""
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.execute("""
+                    SELECT seq, event, capsule_id, created_at FROM capsule_events
+                    WHERE seq > ? ORDER BY seq LIMIT ?
+                """, (after_seq, limit))
+                return [dict(row) for row in cursor.fetchall()]
+        except Exception as e:
+            logger.error(f"Error fetching capsule events after {after_seq}: {e}")
+            return []
+    
+    @timed
+    def get_last_event_seq(self) -> int:
+        """Sequence number of the newest capsule event (0 before the first one), even once it is pruned"""
+        try:
+            with self.get_connection() as conn:
+                row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'capsule_events'").fetchone()
+                return row[0] if row else 0
+        except Exception as e:
+            logger.error(f"Error fetching last capsule event: {e}")
+            return 0
+    
+    @timed
+    def prune_capsule_events(self, older_than: int, wait: bool = True) -> bool:
+        """Forget capsule events created before the unix time ``older_than``"""
+        def write(conn):
+            conn.execute("DELETE FROM capsule_events WHERE created_at < ?", (older_than,))
+            return True
+        
+        try:
+            return self._submit_write(write, wait)
+        except Exception as e:
+            logger.error(f"Error pruning capsule events: {e}")
+            return False
+    
+    @timed
     def get_sync_status(self) -> Dict[str, Any]:
         """Get current synchronization status"""
         try:
@@ -167,33 +1025,333 @@ class CapsuleDatabase:
             logger.error(f"Error getting sync status: {e}")
             return {}
     
-    def search_capsules(self, query: str, limit: int = 10) -> List[Dict[str, Any]]:
-        """Search capsules by title, tags, or creator"""
+    @timed
+    def plan_backfill_chunks(self, total_capsules: int, chunk_size: int, wait: bool = True) -> bool:
+        """
+        Record the id-range chunks needed to backfill ``total_capsules`` capsules
+        
+        Chunks that are already done keep their status, except the last one if
+        the contract has grown past its end since it was completed.
+        """
+        chunks = [
+            (start, min(start + chunk_size, total_capsules) - 1)
+            for start in range(0, total_capsules, chunk_size)
+        ]
+        
+        def write(conn):
+            conn.executemany("""
+                INSERT INTO backfill_chunks (chunk_start, chunk_end) VALUES (?, ?)
+                ON CONFLICT(chunk_start) DO UPDATE SET
+                    chunk_end = excluded.chunk_end,
+                    status = 'pending',
+                    updated_at = strftime('%s', 'now')
+                WHERE chunk_end < excluded.chunk_end
+            """, chunks)
+            return True
+        
+        try:
+            return self._submit_write(write, wait)
+        except Exception as e:
+            logger.error(f"Error planning backfill chunks: {e}")
+            return False
+    
+    @timed
+    def get_backfill_chunks(self, pending_only: bool = False) -> List[Dict[str, Any]]:
+        """Get backfill chunks ordered by their first capsule id"""
+        try:
+            with self.get_connection() as conn:
+                where_clause = "WHERE status != 'done'" if pending_only else ""
+                cursor = conn.execute(f"""
+                    SELECT * FROM backfill_chunks {where_clause}
+                    ORDER BY chunk_start
+                """)
+                return [dict(row) for row in cursor.fetchall()]
+        except Exception as e:
+            logger.error(f"Error fetching backfill chunks: {e}")
+            return []
+    
+    @timed
+    def mark_backfill_chunk_done(self, chunk_start: int, capsules_synced: int, wait: bool = True) -> bool:
+        """Checkpoint a completed backfill chunk"""
+        def write(conn):
+            conn.execute("""
+                UPDATE backfill_chunks SET
+                    status = 'done',
+                    capsules_synced = ?,
+                    updated_at = strftime('%s', 'now')
+                WHERE chunk_start = ?
+            """, (capsules_synced, chunk_start))
+            return True
+        
+        try:
+            return self._submit_write(write, wait)
+        except Exception as e:
+            logger.error(f"Error checkpointing backfill chunk {chunk_start}: {e}")
+            return False
+    
+    @timed
+    def clear_backfill_chunks(self, wait: bool = True) -> bool:
+        """Forget backfill progress once the sync checkpoint covers it"""
+        def write(conn):
+            conn.execute("DELETE FROM backfill_chunks")
+            return True
+        
+        try:
+            return self._submit_write(write, wait)
+        except Exception as e:
+            logger.error(f"Error clearing backfill chunks: {e}")
+            return False
+    
+    @timed
+    def journal_blocks(self, entries: List[tuple], wait: bool = True) -> bool:
+        """
+        Record applied blocks in the sync journal
+        
+        Args:
+            entries: (block_number, block_hash, capsule_id, action) tuples, where action is
+                'checkpoint' (capsule_id None), 'created' or 'revealed'
+        """
+        def write(conn):
+            conn.executemany("""
+                INSERT INTO sync_journal (block_number, block_hash, capsule_id, action)
+                SELECT ?1, ?2, ?3, ?4
+                WHERE ?4 != 'checkpoint' OR NOT EXISTS (
+                    SELECT 1 FROM sync_journal
+                    WHERE block_number = ?1 AND block_hash = ?2 AND action = 'checkpoint'
+                )
+            """, entries)
+            return True
+        
+        try:
+            return self._submit_write(write, wait)
+        except Exception as e:
+            logger.error(f"Error writing sync journal: {e}")
+            return False
+    
+    @timed
+    def get_journal_blocks(self, limit: int = 64) -> List[Dict[str, Any]]:
+        """Get the most recent distinct (block_number, block_hash) pairs in the journal"""
         try:
             with self.get_connection() as conn:
                 cursor = conn.execute("""
-                    SELECT * FROM capsules 
-                    WHERE title LIKE ? OR tags LIKE ? OR creator LIKE ?
-                    ORDER BY id DESC LIMIT ?
-                """, (f"%{query}%", f"%{query}%", f"%{query}%", limit))
+                    SELECT DISTINCT block_number, block_hash FROM sync_journal
+                    ORDER BY block_number DESC LIMIT ?
+                """, (limit,))
+                return [dict(row) for row in cursor.fetchall()]
+        except Exception as e:
+            logger.error(f"Error reading sync journal: {e}")
+            return []
+    
+    @timed
+    def rollback_journal_after(self, block_number: int, wait: bool = True) -> List[int]:
+        """
+        Undo every journaled capsule change from blocks after ``block_number``
+        
+        Created capsules are deleted and reveals are reverted, newest first, in one
+        transaction; the sync checkpoint is moved back to ``block_number``.
+        
+        Returns:
+            IDs of the capsules that were rolled back
+        """
+        def write(conn):
+            cursor = conn.execute("""
+                SELECT capsule_id, action FROM sync_journal
+                WHERE block_number > ? AND capsule_id IS NOT NULL
+                ORDER BY id DESC
+            """, (block_number,))
+            changes = cursor.fetchall()
+            
+            for change in changes:
+                if change['action'] == 'created':
+                    conn.execute("DELETE FROM capsules WHERE id = ?", (change['capsule_id'],))
+                elif change['action'] == 'revealed':
+                    conn.execute("""
+                        UPDATE capsules SET
+                            is_revealed = 0,
+                            decrypted_story = '',
+                            updated_at = strftime('%s', 'now')
+                        WHERE id = ?
+                    """, (change['capsule_id'],))
+            
+            conn.execute("DELETE FROM sync_journal WHERE block_number > ?", (block_number,))
+            conn.execute("""
+                UPDATE sync_status SET
+                    last_synced_block = MIN(last_synced_block, ?1),
+                    provenance_synced_block = MIN(provenance_synced_block, ?1)
+                WHERE id = 1
+            """, (block_number,))
+            return sorted({change['capsule_id'] for change in changes})
+        
+        try:
+            return self._submit_write(write, wait)
+        except Exception as e:
+            logger.error(f"Error rolling back sync journal after block {block_number}: {e}")
+            raise
+    
+    @timed
+    def prune_journal(self, before_block: int, wait: bool = True) -> bool:
+        """Forget journal entries older than ``before_block``"""
+        def write(conn):
+            conn.execute("DELETE FROM sync_journal WHERE block_number < ?", (before_block,))
+            return True
+        
+        try:
+            return self._submit_write(write, wait)
+        except Exception as e:
+            logger.error(f"Error pruning sync journal: {e}")
+            return False
+    
+    @staticmethod
+    def _fts_query(query: str) -> Optional[str]:
+        """
+        Turn free text into an FTS5 MATCH expression: every word must match,
+        the last one as a prefix so results show up while the user is typing
+        """
+        words = re.findall(r"\w+", query)
+        if not words:
+            return None
+        terms = [f'"{word}"' for word in words]
+        terms[-1] += "*"
+        return " ".join(terms)
+    
+    @staticmethod
+    def _is_address_query(query: str) -> bool:
+        return re.fullmatch(r"0x[0-9a-fA-F]{1,40}", query) is not None
+    
+    @timed
+    def search_capsules(self, query: str, limit: int = 10, offset: int = 0,
+                        summary: bool = False) -> List[Dict[str, Any]]:
+        """
+        Search capsules, best matches first
+        
+        Text is matched against title, tags and revealed story through the FTS5
+        index and ranked by BM25; a query that looks like an address is matched
+        as a creator prefix instead, newest first. ``summary`` leaves out the ciphertext.
+        """
+        columns = SUMMARY_COLUMNS if summary else "capsules.*"
+        try:
+            with self.get_connection() as conn:
+                if self._is_address_query(query):
+                    cursor = conn.execute(f"""
+                        SELECT {columns} FROM capsules WHERE creator_lower >= ? AND creator_lower < ?
+                        ORDER BY id DESC LIMIT ? OFFSET ?
+                    """, (*_prefix_range(normalize_address(query)), limit, offset))
+                    return [dict(row) for row in cursor.fetchall()]
+                
+                match = self._fts_query(query)
+                if match is None:
+                    return []
+                cursor = conn.execute(f"""
+                    SELECT {columns} FROM capsules_fts
+                    JOIN capsules ON capsules.id = capsules_fts.rowid
+                    WHERE capsules_fts MATCH ?
+                    ORDER BY bm25(capsules_fts, ?, ?, ?), capsules.id DESC
+                    LIMIT ? OFFSET ?
+                """, (match, *SEARCH_WEIGHTS, limit, offset))
                 return [dict(row) for row in cursor.fetchall()]
         except Exception as e:
             logger.error(f"Error searching capsules: {e}")
             return []
     
-    def get_capsules_by_creator(self, creator_address: str, limit: int = 10) -> List[Dict[str, Any]]:
-        """Get capsules created by a specific address"""
+    @timed
+    def count_search_results(self, query: str) -> int:
+        """Total number of capsules search_capsules would match for ``query``"""
         try:
             with self.get_connection() as conn:
-                cursor = conn.execute("""
-                    SELECT * FROM capsules WHERE creator = ?
+                if self._is_address_query(query):
+                    cursor = conn.execute("SELECT COUNT(*) FROM capsules WHERE creator_lower >= ? AND creator_lower < ?",
+                                          _prefix_range(normalize_address(query)))
+                    return cursor.fetchone()[0]
+                
+                match = self._fts_query(query)
+                if match is None:
+                    return 0
+                cursor = conn.execute("SELECT COUNT(*) FROM capsules_fts WHERE capsules_fts MATCH ?", (match,))
+                return cursor.fetchone()[0]
+        except Exception as e:
+            logger.error(f"Error counting search results: {e}")
+            return 0
+    
+    @timed
+    def get_capsules_by_tag(self, tag: str, limit: int = 10, before_id: Optional[int] = None,
+                            summary: bool = False) -> List[Dict[str, Any]]:
+        """Capsules carrying exactly ``tag`` (normalized like split_tags), newest first, keyset-paged"""
+        normalized = split_tags(tag)
+        if not normalized:
+            return []
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.execute(f"""
+                    SELECT {SUMMARY_COLUMNS if summary else "capsules.*"} FROM capsule_tags
+                    JOIN capsules ON capsules.id = capsule_tags.capsule_id
+                    WHERE capsule_tags.tag = ? AND capsule_tags.capsule_id < ?
+                    ORDER BY capsule_tags.capsule_id DESC LIMIT ?
+                """, (normalized[0], before_id if before_id is not None else 2 ** 63 - 1, limit))
+                return [dict(row) for row in cursor.fetchall()]
+        except Exception as e:
+            logger.error(f"Error fetching capsules tagged {tag!r}: {e}")
+            return []
+    
+    @timed
+    def get_tag_counts(self, limit: int = 20, tags: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """
+        Tag facets: the ``limit`` most used tags with their capsule counts,
+        or the counts of the given ``tags``
+        """
+        try:
+            with self.get_connection() as conn:
+                if tags is not None:
+                    normalized = [tag for value in tags for tag in split_tags(value)]
+                    placeholders = ",".join("?" * len(normalized))
+                    cursor = conn.execute(f"""
+                        SELECT tag, capsule_count FROM tag_counts WHERE tag IN ({placeholders})
+                        ORDER BY capsule_count DESC, tag
+                    """, normalized)
+                else:
+                    cursor = conn.execute("""
+                        SELECT tag, capsule_count FROM tag_counts
+                        ORDER BY capsule_count DESC, tag LIMIT ?
+                    """, (limit,))
+                return [dict(row) for row in cursor.fetchall()]
+        except Exception as e:
+            logger.error(f"Error fetching tag counts: {e}")
+            return []
+    
+    @timed
+    def get_capsules_by_creator(self, creator_address: str, limit: int = 10, summary: bool = False,
+                                before_id: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Get capsules created by an address, newest first
+        
+        The address is matched case-insensitively through the creator_lower index;
+        ``before_id`` continues after the last capsule of the previous page.
+        """
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.execute(f"""
+                    SELECT {SUMMARY_COLUMNS if summary else "*"} FROM capsules
+                    WHERE creator_lower = ? AND id < ?
                     ORDER BY id DESC LIMIT ?
-                """, (creator_address, limit))
+                """, (normalize_address(creator_address), before_id if before_id is not None else 2 ** 63 - 1, limit))
                 return [dict(row) for row in cursor.fetchall()]
         except Exception as e:
             logger.error(f"Error fetching capsules by creator: {e}")
             return []
     
+    @timed
+    def get_creator_stats(self, creator_address: str) -> Dict[str, int]:
+        """Number of capsules (and revealed capsules) an address created, from the trigger-kept counters"""
+        try:
+            with self.get_connection() as conn:
+                row = conn.execute("""
+                    SELECT capsule_count, revealed_count FROM creator_stats WHERE creator_lower = ?
+                """, (normalize_address(creator_address),)).fetchone()
+                return dict(row) if row else {"capsule_count": 0, "revealed_count": 0}
+        except Exception as e:
+            logger.error(f"Error getting creator stats: {e}")
+            return {"capsule_count": 0, "revealed_count": 0}
+    
+    @timed
     def get_recent_capsules(self, hours: int = 24, limit: int = 10) -> List[Dict[str, Any]]:
         """Get capsules created in the last N hours"""
         try:
@@ -208,7 +1366,55 @@ class CapsuleDatabase:
             logger.error(f"Error fetching recent capsules: {e}")
             return []
     
+    def iter_capsules(self, since_id: Optional[int] = None, since_block: Optional[int] = None,
+                      summary: bool = False, batch_size: int = 500) -> Iterator[Dict[str, Any]]:
+        """
+        Yield every capsule in id order, for exports
+        
+        Reads keyset batches of ``batch_size`` rows, each on a briefly borrowed
+        pooled connection, so memory stays constant and no read transaction is
+        held open (which would stall WAL checkpoints) while the caller streams.
+        Unlike the other readers this raises on errors: a silently truncated
+        export would look complete.
+        
+        Args:
+            since_id: Only capsules with a higher id (the last id already exported)
+            since_block: Only capsules created in this block or later
+        """
+        last_id = since_id if since_id is not None else -1
+        conditions = ["id > ?"]
+        params = []
+        if since_block is not None:
+            conditions.append("block_number >= ?")
+            params.append(since_block)
+        sql = f"""
+            SELECT {SUMMARY_COLUMNS if summary else "*"} FROM capsules
+            WHERE {' AND '.join(conditions)}
+            ORDER BY id LIMIT ?
+        """
+        while True:
+            try:
+                with self.get_connection() as conn:
+                    rows = [dict(row) for row in conn.execute(sql, [last_id, *params, batch_size])]
+            except Exception as e:
+                logger.error(f"Error exporting capsules after id {last_id}: {e}")
+                raise
+            yield from rows
+            if len(rows) < batch_size:
+                return
+            last_id = rows[-1]["id"]
+    
     def close(self):
-        """Close database connections (cleanup)"""
-        # Connections are automatically closed by context manager
-        pass
+        """Commit queued writes, stop the writer thread and close pooled connections (cleanup)"""
+        with self._submit_lock:
+            stopping = not self._closed
+            if stopping:
+                self._closed = True
+                self._write_queue.put(None)
+        if stopping:
+            self._writer.join()
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                break
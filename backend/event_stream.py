@@ -0,0 +1,278 @@
+# event_stream.py - Server-Sent Events fan-out of capsule_created / capsule_revealed / capsule_removed
+import json
+import time
+import asyncio
+import threading
+import logging
+from collections import deque
+from urllib.parse import parse_qs
+from typing import Dict, List, Any, Optional, Callable
+
+# Setup logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# How often the hub drops capsule events older than its retention window, in seconds
+PRUNE_INTERVAL = 3600
+
+
+def format_sse(event: Dict[str, Any]) -> str:
+    """One capsule event as an SSE message whose id is its sequence number"""
+    data = json.dumps({"seq": event["seq"], "capsuleId": event["capsule_id"], "at": event["created_at"]},
+                      separators=(",", ":"))
+    return f"id: {event['seq']}\nevent: {event['event']}\ndata: {data}\n\n"
+
+
+class EventHub:
+    """
+    Collects capsule events for Server-Sent Events subscribers
+
+    Capsule triggers append to the capsule_events table inside the sync
+    writer's transactions. After each commit that changed capsule data the
+    writer calls ``refresh``, which reads the new events once into a bounded
+    in-memory buffer and notifies the listeners; subscribers never query the
+    database unless they resume from further back than the buffer reaches.
+    Events older than ``retention`` seconds are pruned from the table.
+    """
+
+    def __init__(self, db, buffer_size: int = 1000, batch_size: int = 500, retention: int = 7 * 24 * 3600):
+        """
+        Args:
+            db: CapsuleDatabase whose commits are announced
+            buffer_size: Recent events kept in memory for subscribers
+            batch_size: Most events sent to a subscriber per wake-up
+            retention: Seconds capsule events stay resumable before they are pruned
+        """
+        self.db = db
+        self.batch_size = batch_size
+        self.retention = retention
+        self._events = deque(maxlen=buffer_size)
+        self._lock = threading.Lock()
+        self._listeners: List[Callable[[], None]] = []
+        self._next_prune = 0.0
+        self.last_seq = db.get_last_event_seq()
+        db.add_commit_listener(self.refresh)
+
+    def add_listener(self, listener: Callable[[], None]):
+        """Call ``listener()`` (on the writer thread) whenever new events are buffered"""
+        self._listeners.append(listener)
+
+    def remove_listener(self, listener: Callable[[], None]):
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+
+    def refresh(self):
+        """Load events committed since the last refresh and notify the listeners"""
+        while True:
+            events = self.db.get_capsule_events(self.last_seq, limit=self.batch_size)
+            if not events:
+                break
+            with self._lock:
+                self._events.extend(events)
+                self.last_seq = events[-1]["seq"]
+            for listener in list(self._listeners):
+                listener()
+            if len(events) < self.batch_size:
+                break
+        # Called from the writer thread, so the prune must not wait for its own commit
+        if time.time() >= self._next_prune:
+            self._next_prune = time.time() + PRUNE_INTERVAL
+            self.db.prune_capsule_events(int(time.time()) - self.retention, wait=False)
+
+    def buffered_events_after(self, seq: int) -> Optional[List[Dict[str, Any]]]:
+        """Up to ``batch_size`` events following ``seq`` from memory, or None when the buffer doesn't reach back that far"""
+        with self._lock:
+            if seq >= self.last_seq:
+                return []
+            if self._events and seq >= self._events[0]["seq"] - 1:
+                return [event for event in self._events if event["seq"] > seq][:self.batch_size]
+        return None
+
+
+class EventServer:
+    """
+    Serves the capsule event feed (GET /api/events) from one asyncio event loop
+
+    Every open stream is a coroutine waiting on a future the hub resolves on
+    new events, not a thread, so idle browsers cost a socket each and never
+    tie up the Flask server. Resuming from before the hub's buffer reads the
+    database in the loop's thread pool. The loop runs on its own daemon thread.
+    """
+
+    def __init__(self, hub: EventHub, host: str = "127.0.0.1", port: int = 5002, heartbeat: float = 15.0,
+                 retry_ms: int = 5000, allowed_origin: str = "http://localhost:8080"):
+        """
+        Args:
+            hub: EventHub the events come from
+            host: Interface to listen on
+            port: Port to listen on (0 picks a free one, see ``port`` after start)
+            heartbeat: Seconds without events before a keepalive comment is sent,
+                so proxies keep the connection open and closed clients are noticed
+            retry_ms: Reconnect delay suggested to EventSource clients
+            allowed_origin: Origin allowed to read the stream cross-origin
+        """
+        self.hub = hub
+        self.host = host
+        self.port = port
+        self.heartbeat = heartbeat
+        self.retry_ms = retry_ms
+        self.allowed_origin = allowed_origin
+        self.subscribers = 0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._stopping: Optional[asyncio.Event] = None
+        self._new_events: Optional[asyncio.Future] = None
+        self._thread: Optional[threading.Thread] = None
+        self._started = threading.Event()
+        self._error: Optional[Exception] = None
+        self._handlers = set()
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}/api/events"
+
+    def start(self):
+        """Start serving on a background thread; raises if the port can't be bound"""
+        self._thread = threading.Thread(target=asyncio.run, args=(self._serve(),),
+                                        name="capsule-event-server", daemon=True)
+        self._thread.start()
+        self._started.wait()
+        if self._error is not None:
+            raise self._error
+
+    def stop(self):
+        """Close every stream and stop the server thread"""
+        if self._thread is None:
+            return
+        try:
+            self._loop.call_soon_threadsafe(self._stopping.set)
+        except (AttributeError, RuntimeError):
+            pass  # never started serving
+        self._thread.join()
+        self._thread = None
+
+    async def _serve(self):
+        self._loop = asyncio.get_running_loop()
+        self._stopping = asyncio.Event()
+        self._new_events = self._loop.create_future()
+        try:
+            server = await asyncio.start_server(self._handle, self.host, self.port, backlog=1024)
+        except OSError as e:
+            self._error = e
+            self._started.set()
+            return
+        self.port = server.sockets[0].getsockname()[1]
+        self.hub.add_listener(self._notify)
+        self._started.set()
+        logger.info(f"Capsule event stream on {self.url}")
+        try:
+            await self._stopping.wait()
+        finally:
+            self.hub.remove_listener(self._notify)
+            server.close()
+            # Wake every stream so it sees the stop and closes its connection
+            self._wake()
+            if self._handlers:
+                await asyncio.wait(self._handlers, timeout=5)
+
+    def _notify(self):
+        """Hub listener, called on the writer thread"""
+        try:
+            self._loop.call_soon_threadsafe(self._wake)
+        except RuntimeError:
+            pass  # loop already closed
+
+    def _wake(self):
+        waiter, self._new_events = self._new_events, self._loop.create_future()
+        waiter.set_result(None)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        handler = asyncio.current_task()
+        self._handlers.add(handler)
+        try:
+            request = await asyncio.wait_for(self._read_request(reader), 10)
+            if request is None:
+                return
+            method, path, query, headers = request
+            if method == "OPTIONS":
+                await self._respond(writer, "204 No Content")
+                return
+            if path != "/api/events":
+                await self._respond(writer, "404 Not Found", {"error": "Not found"})
+                return
+            if method != "GET":
+                await self._respond(writer, "405 Method Not Allowed", {"error": "Method not allowed"})
+                return
+            last_event_id = headers.get("last-event-id") or parse_qs(query).get("last_event_id", [None])[0]
+            try:
+                after_seq = int(last_event_id) if last_event_id else self.hub.last_seq
+            except ValueError:
+                await self._respond(writer, "400 Bad Request", {"error": "Invalid Last-Event-ID"})
+                return
+            await self._stream(writer, min(after_seq, self.hub.last_seq))
+        except (asyncio.TimeoutError, ConnectionError):
+            pass  # client gave up or went away
+        except Exception as e:
+            logger.error(f"Error in capsule event stream: {e}")
+        finally:
+            writer.close()
+            self._handlers.discard(handler)
+
+    async def _read_request(self, reader: asyncio.StreamReader):
+        """Request line and headers of one HTTP request, or None if the client sent nothing usable"""
+        request_line = (await reader.readline()).decode("latin-1").split()
+        if len(request_line) != 3:
+            return None
+        headers = {}
+        while len(headers) < 100:
+            line = (await reader.readline()).decode("latin-1").strip()
+            if not line:
+                break
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+        path, _, query = request_line[1].partition("?")
+        return request_line[0].upper(), path, query, headers
+
+    def _head(self, status: str, content_type: Optional[str] = None) -> bytes:
+        lines = [f"HTTP/1.1 {status}",
+                 f"Access-Control-Allow-Origin: {self.allowed_origin}",
+                 "Access-Control-Allow-Methods: GET, OPTIONS",
+                 "Access-Control-Allow-Headers: Last-Event-ID, Cache-Control",
+                 "Connection: close"]
+        if content_type:
+            lines.append(f"Content-Type: {content_type}")
+        return ("\r\n".join(lines) + "\r\n").encode("latin-1")
+
+    async def _respond(self, writer: asyncio.StreamWriter, status: str, payload: Optional[Dict[str, Any]] = None):
+        body = json.dumps(payload).encode("utf-8") if payload is not None else b""
+        writer.write(self._head(status, "application/json" if payload is not None else None)
+                     + f"Content-Length: {len(body)}\r\n\r\n".encode("latin-1") + body)
+        await writer.drain()
+
+    async def _stream(self, writer: asyncio.StreamWriter, after_seq: int):
+        """SSE body for one subscriber, starting after event ``after_seq``, until the client disconnects"""
+        self.subscribers += 1
+        try:
+            writer.write(self._head("200 OK", "text/event-stream")
+                         + b"Cache-Control: no-cache\r\nX-Accel-Buffering: no\r\n\r\n"
+                         + f"retry: {self.retry_ms}\n\n".encode("utf-8"))
+            await writer.drain()
+            seq = after_seq
+            while not self._stopping.is_set():
+                # Taken before looking for events, so a refresh in between still wakes us
+                waiter = self._new_events
+                events = self.hub.buffered_events_after(seq)
+                if events is None:
+                    events = await self._loop.run_in_executor(
+                        None, self.hub.db.get_capsule_events, seq, self.hub.batch_size)
+                if events:
+                    writer.write("".join(format_sse(event) for event in events).encode("utf-8"))
+                    seq = events[-1]["seq"]
+                else:
+                    try:
+                        await asyncio.wait_for(asyncio.shield(waiter), self.heartbeat)
+                        continue
+                    except asyncio.TimeoutError:
+                        writer.write(b": keepalive\n\n")
+                await writer.drain()
+        finally:
+            self.subscribers -= 1
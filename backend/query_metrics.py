@@ -0,0 +1,280 @@
+# query_metrics.py - Low-overhead timing and slow-query capture for CapsuleDatabase
+import time
+import weakref
+import sqlite3
+import bisect
+import threading
+import functools
+import logging
+from collections import deque
+from typing import Dict, List, Optional, Any
+
+# Setup logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Upper bounds of the latency histogram buckets, in milliseconds (the last bucket is open-ended)
+LATENCY_BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+
+class MethodStats:
+    """Call count, latency histogram and row count of one database method"""
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.rows = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+
+    def record(self, duration_ms: float, rows: Optional[int], failed: bool):
+        self.calls += 1
+        self.total_ms += duration_ms
+        self.max_ms = max(self.max_ms, duration_ms)
+        self.buckets[bisect.bisect_left(LATENCY_BUCKETS_MS, duration_ms)] += 1
+        if failed:
+            self.errors += 1
+        if rows:
+            self.rows += rows
+
+    def percentile(self, fraction: float) -> Optional[float]:
+        """Upper bucket bound below which ``fraction`` of the calls fell"""
+        if not self.calls:
+            return None
+        threshold = fraction * self.calls
+        seen = 0
+        for bound, count in zip(LATENCY_BUCKETS_MS, self.buckets):
+            seen += count
+            if seen >= threshold:
+                return bound
+        return self.max_ms
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "rows": self.rows,
+            "avg_ms": round(self.total_ms / self.calls, 3) if self.calls else None,
+            "p50_ms": self.percentile(0.5),
+            "p95_ms": self.percentile(0.95),
+            "p99_ms": self.percentile(0.99),
+            "max_ms": round(self.max_ms, 3),
+            "histogram": {
+                **{f"le_{bound}ms": count for bound, count in zip(LATENCY_BUCKETS_MS, self.buckets)},
+                "inf": self.buckets[-1]
+            }
+        }
+
+
+class QueryMetrics:
+    """
+    Per-method latency histograms plus a log of slow SQL statements
+
+    Methods are timed by the ``timed`` decorator; statements are timed by
+    ``InstrumentedConnection`` through their last fetch and, above
+    ``slow_query_ms``, kept with their EXPLAIN QUERY PLAN in a bounded
+    slow-query log.
+    """
+
+    def __init__(self, slow_query_ms: float = 100, slow_log_size: int = 100):
+        self.slow_query_ms = slow_query_ms
+        self._methods: Dict[str, MethodStats] = {}
+        self._slow_queries = deque(maxlen=slow_log_size)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @property
+    def current_method(self) -> Optional[str]:
+        return getattr(self._local, "method", None)
+
+    @current_method.setter
+    def current_method(self, method: Optional[str]):
+        self._local.method = method
+
+    def record(self, method: str, duration_ms: float, rows: Optional[int] = None, failed: bool = False):
+        with self._lock:
+            stats = self._methods.get(method)
+            if stats is None:
+                stats = self._methods[method] = MethodStats()
+            stats.record(duration_ms, rows, failed)
+
+    def record_slow_query(self, sql: str, params, duration_ms: float, plan: List[str],
+                          method: Optional[str] = None):
+        entry = {
+            "method": method or self.current_method,
+            "sql": " ".join(sql.split()),
+            "params": repr(params)[:200],
+            "duration_ms": round(duration_ms, 3),
+            "query_plan": plan,
+            "at": int(time.time())
+        }
+        logger.warning(f"Slow query in {entry['method']} ({entry['duration_ms']} ms): {entry['sql'][:200]}")
+        with self._lock:
+            self._slow_queries.append(entry)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Everything recorded so far, slowest statements last"""
+        with self._lock:
+            return {
+                "slow_query_ms": self.slow_query_ms,
+                "methods": {method: stats.to_dict() for method, stats in sorted(self._methods.items())},
+                "slow_queries": list(self._slow_queries)
+            }
+
+    def reset(self):
+        with self._lock:
+            self._methods.clear()
+            self._slow_queries.clear()
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """
+    Cursor that times a statement from execute() until its rows run out
+
+    SQLite does most of a scan's work while rows are stepped, so time spent in
+    fetchone/fetchmany/fetchall and iteration counts toward the statement. The
+    total is checked against the slow-query threshold once the statement is
+    exhausted, re-executed or closed. Cursors still open when the connection
+    is handed back are closed by ``finish_cursors``, so the EXPLAIN for a slow
+    one runs while the connection is still held. One collected before that is
+    logged without a plan: ``__del__`` never executes a statement.
+    """
+
+    _sql = None
+
+    def execute(self, sql, parameters=()):
+        self._finish()
+        self._sql, self._parameters, self._elapsed_ms = sql, parameters, 0.0
+        self._method = self.connection.metrics.current_method if self.connection.metrics else None
+        self._timed(super().execute, sql, parameters)
+        if self.description is None:
+            self._finish()  # no result rows to step through
+        else:
+            self.connection._open_cursors.add(self)
+        return self
+
+    def fetchone(self):
+        row = self._timed(super().fetchone)
+        if row is None:
+            self._finish()
+        return row
+
+    def fetchmany(self, size=None):
+        size = self.arraysize if size is None else size
+        rows = self._timed(super().fetchmany, size)
+        if len(rows) < size:
+            self._finish()
+        return rows
+
+    def fetchall(self):
+        rows = self._timed(super().fetchall)
+        self._finish()
+        return rows
+
+    def __next__(self):
+        try:
+            return self._timed(super().__next__)
+        except StopIteration:
+            self._finish()
+            raise
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        try:
+            sql = self._sql
+            if sql is not None:
+                self._sql = None
+                self.connection._check_slow(sql, self._parameters, self._elapsed_ms, self._method, explain=False)
+        except Exception:
+            pass
+
+    def _timed(self, step, *args):
+        start = time.perf_counter()
+        try:
+            return step(*args)
+        finally:
+            if self._sql is not None:
+                self._elapsed_ms += (time.perf_counter() - start) * 1000
+
+    def _finish(self):
+        sql = self._sql
+        if sql is None:
+            return
+        self._sql = None
+        self.connection._open_cursors.discard(self)
+        self.connection._check_slow(sql, self._parameters, self._elapsed_ms, self._method)
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """sqlite3 connection that reports statements slower than the metrics threshold"""
+
+    metrics: Optional[QueryMetrics] = None
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._open_cursors = weakref.WeakSet()  # instrumented cursors whose rows haven't run out
+
+    def finish_cursors(self):
+        """Close the cursors still open on this connection, checking each against the slow-query threshold"""
+        for cursor in list(self._open_cursors):
+            cursor.close()
+
+    def execute(self, sql, parameters=()):
+        return self.cursor(InstrumentedCursor).execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        seq_of_parameters = list(seq_of_parameters)
+        start = time.perf_counter()
+        cursor = super().executemany(sql, seq_of_parameters)
+        self._check_slow(sql, seq_of_parameters[0] if seq_of_parameters else (),
+                         (time.perf_counter() - start) * 1000)
+        return cursor
+
+    def _check_slow(self, sql: str, parameters, duration_ms: float, method: Optional[str] = None,
+                    explain: bool = True):
+        metrics = self.metrics
+        if metrics is None or duration_ms < metrics.slow_query_ms:
+            return
+        plan = []
+        if explain:
+            try:
+                plan = [row[3] for row in super().execute(f"EXPLAIN QUERY PLAN {sql}", parameters)]
+            except sqlite3.Error:
+                pass  # PRAGMA, BEGIN and the like have no query plan
+        metrics.record_slow_query(sql, parameters, duration_ms, plan, method)
+
+
+def result_rows(result) -> Optional[int]:
+    """Rows a database method returned: list length, 1 for a found row, None when not applicable"""
+    if isinstance(result, list):
+        return len(result)
+    if isinstance(result, dict):
+        return 1
+    return None
+
+
+def timed(method):
+    """Record the latency and returned rows of a CapsuleDatabase method in ``self.metrics``"""
+    name = method.__name__
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        metrics = self.metrics
+        outer_method = metrics.current_method
+        metrics.current_method = name
+        start = time.perf_counter()
+        try:
+            result = method(self, *args, **kwargs)
+        except Exception:
+            metrics.record(name, (time.perf_counter() - start) * 1000, failed=True)
+            raise
+        finally:
+            metrics.current_method = outer_method
+        metrics.record(name, (time.perf_counter() - start) * 1000, result_rows(result))
+        return result
+
+    return wrapper
@@ -0,0 +1,242 @@
+# rpc_pool.py - Multi-endpoint JSON-RPC provider with latency-aware routing
+import time
+import threading
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Optional, Dict, Any, List
+from web3 import Web3
+from web3.providers.base import JSONBaseProvider
+
+# Setup logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Read-only methods that are safe to send to two endpoints at once
+HEDGEABLE_METHODS = {
+    "eth_blockNumber",
+    "eth_call",
+    "eth_chainId",
+    "eth_getBlockByNumber",
+    "eth_getLogs",
+    "web3_clientVersion",
+}
+
+# JSON-RPC error codes public endpoints use for rate limiting
+RATE_LIMIT_ERROR_CODES = {-32005, -32029, 429}
+
+
+class RPCErrorResponse(Exception):
+    """A JSON-RPC error answer, raised so a hedged request keeps waiting for the other endpoint"""
+
+    def __init__(self, response: Dict[str, Any]):
+        super().__init__(f"error response: {response['error']}")
+        self.response = response
+
+
+class EndpointStats:
+    """Rolling latency and error statistics for one RPC endpoint"""
+
+    def __init__(self, url: str, window: int = 50, latency_alpha: float = 0.3, min_samples: int = 5):
+        self.url = url
+        self.latency = None  # exponentially weighted moving average, seconds
+        self.requests = 0
+        self.errors = 0
+        self.consecutive_errors = 0
+        self.cooldown_until = 0.0
+        self.last_outcome_at = 0.0
+        self.min_samples = min_samples
+        self._latency_alpha = latency_alpha
+        self._outcomes = deque(maxlen=window)  # True for success, False for error
+
+    @property
+    def error_rate(self) -> float:
+        if not self._outcomes:
+            return 0.0
+        return self._outcomes.count(False) / len(self._outcomes)
+
+    def is_healthy(self, now: float) -> bool:
+        # A couple of early errors don't condemn an endpoint; a full enough window can
+        return now >= self.cooldown_until and (len(self._outcomes) < self.min_samples or self.error_rate < 0.5)
+
+    def expire_penalty(self, now: float, cooldown: float):
+        """
+        Forget the outcomes that made the endpoint unhealthy once it has sat out
+        ``cooldown`` seconds. Unhealthy endpoints rank last and get no new
+        outcomes, so without this they could never recover.
+        """
+        if self.cooldown_until and now >= self.cooldown_until:
+            self.cooldown_until = 0.0
+            self.consecutive_errors = 0
+            self._outcomes.clear()
+        elif not self.is_healthy(now) and now - self.last_outcome_at >= cooldown:
+            self._outcomes.clear()
+
+    def record_success(self, latency: float):
+        self.requests += 1
+        self.consecutive_errors = 0
+        self.last_outcome_at = time.time()
+        self._outcomes.append(True)
+        if self.latency is None:
+            self.latency = latency
+        else:
+            self.latency = self._latency_alpha * latency + (1 - self._latency_alpha) * self.latency
+
+    def record_error(self, cooldown: float):
+        self.requests += 1
+        self.errors += 1
+        self.consecutive_errors += 1
+        self.last_outcome_at = time.time()
+        self._outcomes.append(False)
+        if self.consecutive_errors >= 3:
+            self.cooldown_until = time.time() + cooldown
+
+    def to_dict(self, now: float) -> Dict[str, Any]:
+        return {
+            "url": self.url,
+            "healthy": self.is_healthy(now),
+            "latency_ms": round(self.latency * 1000, 1) if self.latency is not None else None,
+            "error_rate": round(self.error_rate, 3),
+            "requests": self.requests,
+            "errors": self.errors,
+            "cooldown_remaining": max(0, round(self.cooldown_until - now, 1))
+        }
+
+
+class PooledHTTPProvider(JSONBaseProvider):
+    """
+    web3 provider that spreads requests over several HTTP RPC endpoints
+
+    Requests go to the healthy endpoint with the lowest rolling latency
+    (endpoints never measured are tried first), failing over to the next one
+    on transport errors or rate limiting. With ``hedge_after`` set, a read that
+    hasn't answered within that many seconds is also sent to the second-best
+    endpoint and whichever answers first wins.
+    """
+
+    def __init__(self, endpoint_uris: List[str], request_kwargs: Optional[Dict[str, Any]] = None,
+                 hedge_after: Optional[float] = None, error_cooldown: float = 30):
+        """
+        Args:
+            endpoint_uris: RPC endpoint URLs, in order of preference
+            request_kwargs: Extra arguments for every HTTP request (e.g. timeout)
+            hedge_after: Seconds to wait before hedging a slow read (None disables hedging)
+            error_cooldown: Seconds an endpoint is skipped after 3 consecutive errors (or
+                after an error rate of 50%) before it gets traffic again
+        """
+        super().__init__()
+        if not endpoint_uris:
+            raise ValueError("At least one RPC endpoint is required")
+
+        self.endpoint_uris = list(endpoint_uris)
+        self.hedge_after = hedge_after
+        self.error_cooldown = error_cooldown
+        self._providers = [
+            Web3.HTTPProvider(uri, request_kwargs=request_kwargs or {"timeout": 10})
+            for uri in self.endpoint_uris
+        ]
+        self._stats = [EndpointStats(uri) for uri in self.endpoint_uris]
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=2 * len(self._providers) + 2) if hedge_after else None
+
+    def __str__(self):
+        return f"RPC pool {self.endpoint_uris}"
+
+    def _ranked_endpoints(self) -> List[int]:
+        """Endpoint indexes, healthy and fastest first"""
+        now = time.time()
+        with self._lock:
+            for stats in self._stats:
+                stats.expire_penalty(now, self.error_cooldown)
+            return sorted(
+                range(len(self._providers)),
+                key=lambda i: (
+                    not self._stats[i].is_healthy(now),
+                    self._stats[i].latency if self._stats[i].latency is not None else 0,
+                    i
+                )
+            )
+
+    def _request(self, index: int, method, params, reject_errors: bool = False) -> Dict[str, Any]:
+        """
+        Send a request to one endpoint, recording its latency or error
+
+        Rate limiting always counts as an error; with ``reject_errors`` any
+        JSON-RPC error answer does, raised as RPCErrorResponse.
+        """
+        start = time.time()
+        try:
+            response = self._providers[index].make_request(method, params)
+            error = response.get("error") if isinstance(response, dict) else None
+            if isinstance(error, dict) and error.get("code") in RATE_LIMIT_ERROR_CODES:
+                raise Exception(f"rate limited: {error.get('message')}")
+            if error is not None and reject_errors:
+                raise RPCErrorResponse(response)
+        except Exception:
+            with self._lock:
+                self._stats[index].record_error(self.error_cooldown)
+            raise
+        with self._lock:
+            self._stats[index].record_success(time.time() - start)
+        return response
+
+    def make_request(self, method, params) -> Dict[str, Any]:
+        ranked = self._ranked_endpoints()
+        if self._executor is not None and method in HEDGEABLE_METHODS and len(ranked) > 1:
+            return self._hedged_request(ranked, method, params)
+
+        last_error = None
+        for index in ranked:
+            try:
+                return self._request(index, method, params)
+            except Exception as e:
+                logger.warning(f"RPC {method} failed on {self.endpoint_uris[index]}: {e}")
+                last_error = e
+        raise last_error
+
+    def _hedged_request(self, ranked: List[int], method, params) -> Dict[str, Any]:
+        """
+        Send to the best endpoint, adding the next one if it is slow or fails
+
+        An error answer from one endpoint doesn't win the race; it is only
+        returned when no endpoint gave a result.
+        """
+        pending = {self._executor.submit(self._request, ranked[0], method, params, True): ranked[0]}
+        remaining = list(ranked[1:])
+        last_error = None
+        error_response = None
+
+        timeout = self.hedge_after
+        while pending:
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                # Slow answer: hedge on the next endpoint, then wait for whichever is first
+                if remaining:
+                    index = remaining.pop(0)
+                    pending[self._executor.submit(self._request, index, method, params, True)] = index
+                timeout = None if not remaining else self.hedge_after
+                continue
+
+            for future in done:
+                index = pending.pop(future)
+                try:
+                    return future.result()
+                except RPCErrorResponse as e:
+                    logger.warning(f"RPC {method} returned an error on {self.endpoint_uris[index]}: {e}")
+                    error_response = e.response
+                except Exception as e:
+                    logger.warning(f"RPC {method} failed on {self.endpoint_uris[index]}: {e}")
+                    last_error = e
+            if not pending and remaining:
+                index = remaining.pop(0)
+                pending[self._executor.submit(self._request, index, method, params, True)] = index
+
+        if error_response is not None:
+            return error_response  # no endpoint had a result: let web3 raise the error it got
+        raise last_error
+
+    def stats(self) -> List[Dict[str, Any]]:
+        """Per-endpoint routing statistics"""
+        now = time.time()
+        with self._lock:
+            return [stats.to_dict(now) for stats in self._stats]
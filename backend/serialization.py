@@ -0,0 +1,51 @@
+# serialization.py - Capsule rows to API JSON, with orjson when it is installed
+import json
+from typing import Dict, Any, Optional
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def story_hex(encrypted_story) -> Optional[str]:
+    """Hex form of an encrypted story as served by the API (stories stored as text pass through)"""
+    if isinstance(encrypted_story, (bytes, bytearray, memoryview)):
+        return bytes(encrypted_story).hex()
+    return encrypted_story
+
+
+def format_capsule(capsule, summary: bool = False) -> Dict[str, Any]:
+    """
+    API representation of a capsule row
+
+    Full rows carry ``encryptedStory`` from the precomputed encrypted_story_hex
+    column; summary rows (see database.SUMMARY_COLUMNS) carry
+    ``encryptedStorySize`` instead.
+    """
+    formatted = {
+        "id": capsule["id"],
+        "creator": capsule["creator"],
+        "title": capsule["title"],
+        "tags": capsule["tags"],
+        "decryptedStory": capsule["decrypted_story"],
+        "isRevealed": bool(capsule["is_revealed"]),
+        "revealTime": capsule["reveal_time"],
+        "shutterIdentity": capsule["shutter_identity"],
+        "imageCID": capsule["image_cid"],
+        "blockNumber": capsule["block_number"],
+        "transactionHash": capsule["transaction_hash"]
+    }
+    if summary:
+        formatted["encryptedStorySize"] = capsule["encrypted_story_size"]
+    else:
+        encrypted_hex = capsule.get("encrypted_story_hex")
+        formatted["encryptedStory"] = encrypted_hex if encrypted_hex is not None else story_hex(capsule["encrypted_story"])
+    return formatted
+
+
+def dumps(payload) -> bytes:
+    """Encode a response payload as compact UTF-8 JSON"""
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(payload, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
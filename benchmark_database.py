@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Benchmark CapsuleDatabase read latency
+Compares the pooled, WAL-mode connections against opening a fresh connection
+per query (the previous behaviour) for get_capsule and get_capsules.
+"""
+
+import os
+import sys
+import time
+import sqlite3
+import tempfile
+from contextlib import contextmanager
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+
+from database import CapsuleDatabase
+
+CAPSULES = 2000
+ITERATIONS = 5000
+
+
+class PerQueryConnectionDatabase(CapsuleDatabase):
+    """Opens and closes a new connection for every query"""
+
+    @contextmanager
+    def get_connection(self):
+        conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+
+def make_capsule(capsule_id):
+    return {
+        "id": capsule_id,
+        "creator": "0x00000000000000000000000000000000000000A1",
+        "title": f"Capsule {capsule_id}",
+        "tags": "benchmark",
+        "encrypted_story": os.urandom(256),
+        "decrypted_story": "",
+        "is_revealed": capsule_id % 3 == 0,
+        "reveal_time": 2000000000,
+        "shutter_identity": f"identity-{capsule_id}",
+        "image_cid": f"cid-{capsule_id}",
+        "block_number": capsule_id,
+        "transaction_hash": None,
+    }
+
+
+def time_per_call(fn):
+    start = time.perf_counter()
+    for i in range(ITERATIONS):
+        fn(i)
+    return (time.perf_counter() - start) / ITERATIONS * 1e6
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "capsules.db")
+        pooled = CapsuleDatabase(db_path)
+        pooled.upsert_capsules([make_capsule(i) for i in range(CAPSULES)])
+        per_query = PerQueryConnectionDatabase(db_path)
+
+        print(f"{CAPSULES} capsules, {ITERATIONS} calls each (microseconds per call)")
+        print(f"{'query':<28}{'per-query conn':>16}{'pooled':>10}{'speedup':>10}")
+        cases = [
+            ("get_capsule", lambda db: lambda i: db.get_capsule(i % CAPSULES)),
+            ("get_capsules(limit=20)", lambda db: lambda i: db.get_capsules(offset=i % 100, limit=20)),
+        ]
+        for name, make_call in cases:
+            before = time_per_call(make_call(per_query))
+            after = time_per_call(make_call(pooled))
+            print(f"{name:<28}{before:>16.1f}{after:>10.1f}{before / after:>9.1f}x")
+        pooled.close()
+
+
+if __name__ == "__main__":
+    main()
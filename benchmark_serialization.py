@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Benchmark capsule list serialization
+Compares the per-route formatting loop (hex-encoding every ciphertext, then
+jsonify) against serialization.format_capsule with the stored hex column and
+serialization.dumps (orjson when installed), per 1,000 capsules.
+"""
+
+import os
+import sys
+import time
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+
+from flask import Flask, jsonify
+from database import CapsuleDatabase
+import serialization
+from serialization import format_capsule, dumps
+
+CAPSULES = 1000
+ITERATIONS = 50
+
+
+def make_capsule(capsule_id):
+    return {
+        "id": capsule_id,
+        "creator": "0x00000000000000000000000000000000000000A1",
+        "title": f"Capsule {capsule_id}",
+        "tags": "benchmark",
+        "encrypted_story": os.urandom(512),
+        "decrypted_story": "",
+        "is_revealed": capsule_id % 3 == 0,
+        "reveal_time": 2000000000,
+        "shutter_identity": f"identity-{capsule_id}",
+        "image_cid": f"cid-{capsule_id}",
+        "block_number": capsule_id,
+        "transaction_hash": None,
+    }
+
+
+def format_capsules_inline(capsules):
+    """The loop every list route used to carry"""
+    formatted_capsules = []
+    for capsule in capsules:
+        formatted_capsules.append({
+            "id": capsule["id"],
+            "creator": capsule["creator"],
+            "title": capsule["title"],
+            "tags": capsule["tags"],
+            "encryptedStory": capsule["encrypted_story"].hex() if isinstance(capsule["encrypted_story"], bytes) else capsule["encrypted_story"],
+            "decryptedStory": capsule["decrypted_story"],
+            "isRevealed": bool(capsule["is_revealed"]),
+            "revealTime": capsule["reveal_time"],
+            "shutterIdentity": capsule["shutter_identity"],
+            "imageCID": capsule["image_cid"],
+            "blockNumber": capsule["block_number"],
+            "transactionHash": capsule["transaction_hash"]
+        })
+    return formatted_capsules
+
+
+def time_per_call(fn):
+    start = time.perf_counter()
+    for _ in range(ITERATIONS):
+        fn()
+    return (time.perf_counter() - start) / ITERATIONS * 1000
+
+
+def main():
+    app = Flask(__name__)
+    with tempfile.TemporaryDirectory() as tmp:
+        db = CapsuleDatabase(os.path.join(tmp, "capsules.db"))
+        db.upsert_capsules([make_capsule(i) for i in range(CAPSULES)])
+        capsules = db.get_capsules(limit=CAPSULES)
+        db.close()
+
+    with app.app_context():
+        cases = [
+            ("inline loop + jsonify", lambda: jsonify({"capsules": format_capsules_inline(capsules)}).get_data()),
+            ("format_capsule + dumps", lambda: dumps({"capsules": [format_capsule(c) for c in capsules]})),
+        ]
+        encoder = "orjson" if serialization.orjson is not None else "json (orjson not installed)"
+        print(f"{len(capsules)} capsules, {ITERATIONS} runs each, encoder: {encoder}")
+        print(f"{'serializer':<28}{'ms per 1,000':>14}")
+        timings = []
+        for name, fn in cases:
+            timings.append(time_per_call(fn) * 1000 / len(capsules))
+            print(f"{name:<28}{timings[-1]:>14.2f}")
+        print(f"speedup: {timings[0] / timings[1]:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
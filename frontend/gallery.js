@@ -14,13 +14,18 @@ let contractAddr, contractAbi, shutterApi, registryAddr;
 let walletConnected = false;
 
 // Gallery state
-let currentOffset = 0;
+let nextCursor = null; // keyset cursor from the last /api/capsules page
 let currentFilter = 'all'; // 'all', 'revealed', 'locked'
 let currentSearch = '';
 const batchSize = 12;
 let isLoading = false;
 let hasMore = true;
 
+// Capsule detail loads waiting for the next /api/capsules/batch request
+const pendingCapsuleLoads = new Map(); // id -> [{ resolve, reject }]
+let capsuleBatchTimer = null;
+const maxBatchIds = 100; // server-side MAX_BATCH_IDS
+
 // =============  HELPER FUNCTIONS  =============
 // Helper: get all possible IPFS URLs for a CID
 function getIPFSUrls(cid) {
@@ -48,6 +53,47 @@ function getIPFSUrls(cid) {
   return urls;
 }
 
+// Helper: load a full capsule (with its ciphertext); loads requested within
+// a few milliseconds of each other share one /api/capsules/batch request
+function loadCapsuleDetails(id) {
+  return new Promise((resolve, reject) => {
+    if (!pendingCapsuleLoads.has(id)) {
+      pendingCapsuleLoads.set(id, []);
+    }
+    pendingCapsuleLoads.get(id).push({ resolve, reject });
+    if (!capsuleBatchTimer) {
+      capsuleBatchTimer = setTimeout(flushCapsuleLoads, 10);
+    }
+  });
+}
+
+async function flushCapsuleLoads() {
+  const pending = new Map(pendingCapsuleLoads);
+  pendingCapsuleLoads.clear();
+  capsuleBatchTimer = null;
+  
+  const ids = [...pending.keys()];
+  for (let i = 0; i < ids.length; i += maxBatchIds) {
+    const chunk = ids.slice(i, i + maxBatchIds);
+    try {
+      const response = await axios.get('http://localhost:5000/api/capsules/batch', {
+        params: { ids: chunk.join(',') }
+      });
+      if (!response.data.success) {
+        throw new Error(response.data.error || "Failed to fetch capsules");
+      }
+      for (const capsule of response.data.capsules) {
+        pending.get(capsule.id).forEach(({ resolve }) => resolve(capsule));
+      }
+      for (const id of response.data.missing) {
+        pending.get(id).forEach(({ reject }) => reject(new Error(`Capsule #${id} not found`)));
+      }
+    } catch (error) {
+      chunk.forEach(id => pending.get(id).forEach(({ reject }) => reject(error)));
+    }
+  }
+}
+
 // Helper: fetch from redundant URLs with fallbacks
 async function fetchWithFallback(urls, options = {}) {
   if (!urls || urls.length === 0) {
@@ -134,6 +180,9 @@ window.addEventListener("DOMContentLoaded", async () => {
     // Load initial capsules
     loadCapsules();
     
+    // Show new and revealed capsules as the backend syncs them
+    subscribeToCapsuleEvents();
+    
   } catch (e) {
     console.error("Initialization failed:", e);
     document.getElementById('load-status').textContent = 'Failed to initialize gallery';
@@ -223,7 +272,7 @@ function setupEventListeners() {
 // =============  FILTER AND SEARCH  =============
 function setFilter(filter) {
   currentFilter = filter;
-  currentOffset = 0;
+  nextCursor = null;
   hasMore = true;
   
   // Update button states
@@ -241,7 +290,7 @@ function setFilter(filter) {
 function performSearch() {
   const searchInput = document.getElementById('search-input');
   currentSearch = searchInput.value.trim();
-  currentOffset = 0;
+  nextCursor = null;
   hasMore = true;
   
   // Clear grid and reload
@@ -268,16 +317,15 @@ async function loadCapsules() {
       url = 'http://localhost:5000/api/capsules/search';
       params = {
         q: currentSearch,
-        limit: batchSize
+        limit: batchSize,
+        fields: 'summary'  // cards don't need the ciphertext
       };
     } else {
       // Normal load mode
       url = 'http://localhost:5000/api/capsules';
-      params = {
-        offset: currentOffset,
-        limit: batchSize,
-        revealed_only: currentFilter === 'revealed'
-      };
+      params = nextCursor
+        ? { cursor: nextCursor, limit: batchSize, fields: 'summary' }  // cursor carries the filter
+        : { limit: batchSize, revealed_only: currentFilter === 'revealed', fields: 'summary' };
     }
     
     console.log(`📦 Loading capsules: ${JSON.stringify(params)}`);
@@ -307,8 +355,8 @@ async function loadCapsules() {
     
     // Update pagination
     if (!currentSearch) {
-      currentOffset += batchSize;
-      hasMore = currentOffset < totalCount;
+      nextCursor = response.data.next_cursor;
+      hasMore = Boolean(nextCursor);
     } else {
       hasMore = false; // Search shows all results at once
     }
@@ -421,6 +469,60 @@ function createCapsuleCard(capsule) {
   return card;
 }
 
+// =============  LIVE UPDATES  =============
+// EventSource reconnects by itself and resumes with Last-Event-ID
+function subscribeToCapsuleEvents() {
+  if (!window.EventSource) {
+    return;
+  }
+  // The backend serves the event stream on its own port (see /system_info)
+  const events = new EventSource(window.systemInfo?.events_url || 'http://localhost:5002/api/events');
+  events.addEventListener('capsule_created', (e) => {
+    const { capsuleId } = JSON.parse(e.data);
+    // Only the unfiltered newest-first listing has an obvious place for a new card
+    if (currentSearch || currentFilter === 'revealed') {
+      return;
+    }
+    refreshCapsuleCard(capsuleId, true);
+  });
+  events.addEventListener('capsule_revealed', (e) => {
+    const { capsuleId } = JSON.parse(e.data);
+    refreshCapsuleCard(capsuleId, false);
+  });
+  // A reorg dropped the capsule's creation
+  events.addEventListener('capsule_removed', (e) => {
+    const { capsuleId } = JSON.parse(e.data);
+    document.querySelector(`[data-capsule-id="${capsuleId}"]`)?.remove();
+  });
+  events.onerror = () => console.warn("Capsule event stream interrupted, reconnecting...");
+}
+
+async function refreshCapsuleCard(capsuleId, isNew) {
+  try {
+    const existing = document.querySelector(`[data-capsule-id="${capsuleId}"]`);
+    if (isNew === Boolean(existing)) {
+      return; // already shown, or revealed while not on screen
+    }
+    const response = await axios.get('http://localhost:5000/api/capsules/batch', {
+      params: { ids: capsuleId, fields: 'summary' }
+    });
+    const capsule = response.data.capsules?.[0];
+    if (!capsule) {
+      return;
+    }
+    
+    const card = createCapsuleCard(capsule);
+    if (existing) {
+      existing.replaceWith(card);
+    } else {
+      document.getElementById('capsules-grid').prepend(card);
+    }
+    console.log(`✨ Capsule #${capsuleId} ${isNew ? 'created' : 'revealed'}`);
+  } catch (error) {
+    console.error(`Failed to refresh capsule #${capsuleId}:`, error);
+  }
+}
+
 // =============  CAPSULE INTERACTIONS  =============
 async function decryptCapsule(id, shutterIdentity) {
   try {
@@ -436,12 +538,8 @@ async function decryptCapsule(id, shutterIdentity) {
       return;
     }
 
-    // Fetch capsule data from database API
-    const response = await axios.get(`http://localhost:5000/api/capsules/${id}`);
-    if (!response.data.success) {
-      throw new Error(response.data.error || "Failed to fetch capsule");
-    }
-    const cap = response.data.capsule;
+    // Fetch the ciphertext from database API (the gallery list is loaded without it)
+    const cap = await loadCapsuleDetails(id);
 
     // Handle encrypted story from database API
     let encryptedHex;
@@ -493,12 +591,8 @@ async function revealCapsule(id, shutterIdentity) {
       return;
     }
 
-    // Fetch capsule data from database API
-    const response = await axios.get(`http://localhost:5000/api/capsules/${id}`);
-    if (!response.data.success) {
-      throw new Error(response.data.error || "Failed to fetch capsule");
-    }
-    const cap = response.data.capsule;
+    // Fetch the ciphertext from database API (the gallery list is loaded without it)
+    const cap = await loadCapsuleDetails(id);
 
     // Handle encrypted story from database API
     let encryptedHex;
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Test the response cache of the backend's read endpoints
+Drives the Flask app through its test client against a throwaway database file,
+no running server or chain needed.
+"""
+
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+
+from database import CapsuleDatabase
+
+
+def make_capsule(capsule_id, **overrides):
+    capsule = {
+        "id": capsule_id,
+        "creator": "0x00000000000000000000000000000000000000A1",
+        "title": f"Capsule {capsule_id}",
+        "tags": "test",
+        "encrypted_story": bytes([1, 2, capsule_id % 256]),
+        "decrypted_story": "",
+        "is_revealed": False,
+        "reveal_time": 2000000000,
+        "shutter_identity": f"identity-{capsule_id}",
+        "image_cid": f"cid-{capsule_id}",
+        "block_number": 100,
+        "transaction_hash": None,
+    }
+    capsule.update(overrides)
+    return capsule
+
+
+def load_app(tmp):
+    """The backend module, serving from a fresh database in ``tmp`` with an empty response cache"""
+    cwd = os.getcwd()
+    os.chdir(tmp)  # keeps the import's capsules.db and config lookups out of the repo
+    try:
+        import app
+    finally:
+        os.chdir(cwd)
+    app.db = CapsuleDatabase(os.path.join(tmp, "capsules.db"))
+    app.response_cache.clear()
+    app.response_cache_bytes = 0
+    return app
+
+
+def test_read_endpoints_revalidate_with_etags():
+    with tempfile.TemporaryDirectory() as tmp:
+        backend = load_app(tmp)
+        backend.db.upsert_capsules([make_capsule(i) for i in range(3)])
+        client = backend.app.test_client()
+
+        first = client.get("/api/capsules?limit=2")
+        etag = first.headers["ETag"]
+        assert first.status_code == 200 and first.headers["Cache-Control"] == "no-cache"
+        assert "app;dur=" in first.headers["Server-Timing"]
+        assert len(backend.response_cache) == 1
+
+        # Served from the cache: same ETag, and If-None-Match gets an empty 304
+        assert client.get("/api/capsules?limit=2").headers["ETag"] == etag
+        revalidated = client.get("/api/capsules?limit=2", headers={"If-None-Match": etag})
+        assert revalidated.status_code == 304 and revalidated.data == b""
+
+        # Args the view doesn't read don't make new entries
+        client.get("/api/capsules?limit=2&_=123")
+        assert len(backend.response_cache) == 1
+
+        # A commit that changes capsules moves data_generation, so the old ETag no longer matches
+        generation = backend.db.data_generation
+        backend.db.upsert_capsules([make_capsule(1, title="Renamed")])
+        assert backend.db.data_generation == generation + 1
+        changed = client.get("/api/capsules?limit=2", headers={"If-None-Match": etag})
+        assert changed.status_code == 200 and changed.headers["ETag"] != etag
+        assert changed.get_json()["capsules"][1]["title"] == "Renamed"
+
+        tags = client.get("/api/tags")
+        assert tags.get_json()["tags"] == [{"tag": "test", "count": 3}] and "ETag" in tags.headers
+
+        # Bookkeeping writes leave the cache alone
+        backend.db.update_sync_status(200, 3)
+        assert client.get("/api/capsules?limit=2", headers={"If-None-Match": changed.headers["ETag"]}).status_code == 304
+
+
+def test_search_is_cached_with_live_timing():
+    with tempfile.TemporaryDirectory() as tmp:
+        backend = load_app(tmp)
+        backend.db.upsert_capsules([make_capsule(i, title=f"Harbour {i}") for i in range(3)])
+        client = backend.app.test_client()
+
+        first = client.get("/api/capsules/search?q=harbour&limit=2")
+        body = first.get_json()
+        assert body["total_count"] == 3 and body["count"] == 2 and "took_ms" not in body
+        assert client.get("/api/capsules/search?q=harbour&limit=2",
+                          headers={"If-None-Match": first.headers["ETag"]}).status_code == 304
+        assert client.get("/api/capsules/search?q=harbour&limit=3").headers["ETag"] != first.headers["ETag"]
+        assert len(backend.response_cache) == 2
+
+        # Limits are capped
+        assert client.get("/api/capsules?limit=100000").get_json()["limit"] == 100
+
+
+def test_only_confirmed_capsules_are_marked_immutable():
+    with tempfile.TemporaryDirectory() as tmp:
+        backend = load_app(tmp)
+        db = backend.db
+        db.upsert_capsules([make_capsule(0, block_number=90, is_revealed=True, decrypted_story="old"),
+                            make_capsule(1, block_number=120, is_revealed=True, decrypted_story="tip"),
+                            make_capsule(2, block_number=80, is_revealed=True, decrypted_story="pushed"),
+                            make_capsule(3, block_number=None)])
+        db.update_sync_status(100, 4)
+        # Capsule 2 was revealed by a pushed log above the checkpoint
+        db.journal_blocks([(105, "0x" + "ab" * 32, 2, "revealed")])
+        client = backend.app.test_client()
+
+        assert client.get("/api/capsules/0").headers["Cache-Control"] == backend.IMMUTABLE_CACHE_CONTROL
+        assert client.get("/api/capsules/0/ciphertext").headers["Cache-Control"] == backend.IMMUTABLE_CACHE_CONTROL
+        for capsule_id in (1, 2, 3):
+            assert client.get(f"/api/capsules/{capsule_id}").headers["Cache-Control"] == "no-cache", capsule_id
+            assert client.get(f"/api/capsules/{capsule_id}/ciphertext").headers["Cache-Control"] == "no-cache"
+
+
+if __name__ == "__main__":
+    test_read_endpoints_revalidate_with_etags()
+    test_search_is_cached_with_live_timing()
+    test_only_confirmed_capsules_are_marked_immutable()
+    print("All API cache tests passed")
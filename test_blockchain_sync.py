@@ -0,0 +1,811 @@
+#!/usr/bin/env python3
+"""
+Test the blockchain sync service against a local JSON-RPC stand-in node
+No real chain or network access is needed: the stand-in answers the handful of
+RPC methods the sync service uses from an in-memory list of capsules and logs.
+"""
+
+import os
+import sys
+import copy
+import json
+import time
+import socket
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+
+from eth_abi import encode, decode
+from web3 import Web3
+from websockets.sync.server import serve as ws_serve
+
+from database import CapsuleDatabase
+from blockchain_sync import BlockchainSyncService
+from rpc_pool import PooledHTTPProvider
+
+CONTRACT_ADDRESS = "0x941FB4Aff0F776B253A15AEC446D879Fcdd77EAa"
+MULTICALL_ADDRESS = "0xcA11bde05977b3631167028862bE2a173976CA11"
+CREATOR = Web3.to_checksum_address("0x00000000000000000000000000000000000000a1")
+CAPSULE_TYPES = ["(address,string,string,bytes,string,bool,uint256,string,string)"]
+
+with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "frontend", "contract_abi.json")) as f:
+    CONTRACT_ABI = json.load(f)
+
+
+def selector(signature):
+    return Web3.keccak(text=signature)[:4].hex()
+
+
+def topic(signature):
+    return Web3.keccak(text=signature).hex()
+
+
+class StandInNode:
+    """In-memory chain state served over JSON-RPC"""
+
+    def __init__(self, multicall=True):
+        self.multicall = multicall
+        self.delay = 0
+        self.fail_ids = set()
+        self.fail_methods = set()
+        self.error_code = -32000  # JSON-RPC code of failed requests (-32005 looks like rate limiting)
+        self.block_number = 1
+        self.deploy_block = 1  # first block with contract code
+        self.capsules = []
+        self.logs = []
+        self.requests = []
+        self.call_blocks = []
+        self.subscribers = []
+        self.fork_points = []
+        self.ws_url = None
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.url = f"http://127.0.0.1:{self._server.server_address[1]}"
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        if self.ws_url:
+            self._ws_server.shutdown()
+
+    def start_websocket(self):
+        """Also serve eth_subscribe over WebSocket, pushing every new log to subscribers"""
+        self._ws_server = ws_serve(self._ws_handler, "127.0.0.1", 0)
+        self.ws_url = f"ws://127.0.0.1:{self._ws_server.socket.getsockname()[1]}"
+        threading.Thread(target=self._ws_server.serve_forever, daemon=True).start()
+
+    def drop_subscribers(self):
+        """Simulate the node going away: close every WebSocket connection"""
+        subscribers, self.subscribers = self.subscribers, []
+        for connection in subscribers:
+            connection.close()
+
+    def _ws_handler(self, connection):
+        for message in connection:
+            item = json.loads(message)
+            self.requests.append(item["method"])
+            if item["method"] == "eth_subscribe":
+                connection.send(json.dumps({"jsonrpc": "2.0", "id": item["id"], "result": "0x1"}))
+                self.subscribers.append(connection)
+
+    def _push(self, log):
+        for connection in list(self.subscribers):
+            result = self._format_log(len(self.logs) - 1, log)
+            connection.send(json.dumps({"jsonrpc": "2.0", "method": "eth_subscription",
+                                        "params": {"subscription": "0x1", "result": result}}))
+
+    # ---------- chain mutations ----------
+    def mine(self):
+        self.block_number += 1
+        return self.block_number
+
+    def snapshot(self):
+        return self.block_number, copy.deepcopy(self.capsules), copy.deepcopy(self.logs)
+
+    def reorg_to(self, snapshot):
+        """Replace every block after the snapshot with a new, empty fork of the same height"""
+        block_number, self.capsules, self.logs = copy.deepcopy(snapshot)
+        self.fork_points.append(block_number)
+
+    def block_hash(self, number):
+        fork = sum(1 for point in self.fork_points if point < number)
+        return "0x" + Web3.keccak(text=f"block-{number}-{fork}").hex()[2:]
+
+    def commit_capsule(self, title, tags, reveal_time=2000000000):
+        capsule_id = len(self.capsules)
+        block = self.mine()
+        self.capsules.append([CREATOR, title, tags, b"\x01\x02" + bytes([capsule_id]), "", False,
+                              reveal_time, f"identity-{capsule_id}", f"cid-{capsule_id}"])
+        self.logs.append({
+            "blockNumber": block,
+            "topics": [
+                topic("CapsuleCreated(uint256,address,string,string,uint256,string,string)"),
+                "0x" + encode(["uint256"], [capsule_id]).hex(),
+                "0x" + encode(["address"], [CREATOR]).hex(),
+            ],
+            "data": "0x" + encode(["string", "string", "uint256", "string", "string"],
+                                  [title, tags, reveal_time, f"identity-{capsule_id}", f"cid-{capsule_id}"]).hex(),
+        })
+        self._push(self.logs[-1])
+        return capsule_id
+
+    def reveal_capsule(self, capsule_id, plaintext, emit_log=True):
+        block = self.mine()
+        self.capsules[capsule_id][4] = plaintext
+        self.capsules[capsule_id][5] = True
+        if not emit_log:
+            return
+        self.logs.append({
+            "blockNumber": block,
+            "topics": [
+                topic("CapsuleRevealed(uint256,address,string)"),
+                "0x" + encode(["uint256"], [capsule_id]).hex(),
+                "0x" + encode(["address"], [CREATOR]).hex(),
+            ],
+            "data": "0x" + encode(["string"], [plaintext]).hex(),
+        })
+        self._push(self.logs[-1])
+
+    # ---------- JSON-RPC ----------
+    def handle(self, method, params):
+        if method in self.fail_methods:
+            raise ValueError("rate limited")
+        if method == "web3_clientVersion":
+            return "stand-in/1.0"
+        if method == "eth_chainId":
+            return "0x64"
+        if method == "eth_blockNumber":
+            return hex(self.block_number)
+        if method == "eth_getBlockByNumber":
+            number = int(params[0], 16)
+            if number > self.block_number:
+                return None
+            return {"number": hex(number), "hash": self.block_hash(number),
+                    "parentHash": self.block_hash(number - 1), "timestamp": hex(1700000000 + number)}
+        if method == "eth_call":
+            self.call_blocks.append(params[1])
+            if params[0]["to"].lower() == MULTICALL_ADDRESS.lower():
+                return self._aggregate3(bytes.fromhex(params[0]["data"][2:]))
+            return self._call(bytes.fromhex(params[0]["data"][2:]))
+        if method == "eth_getLogs":
+            return self._get_logs(params[0])
+        if method == "eth_getCode":
+            block = int(params[1], 16) if params[1].startswith("0x") else self.block_number
+            return "0x6080" if self.deploy_block <= block <= self.block_number else "0x"
+        raise ValueError(f"unsupported method {method}")
+
+    def _call(self, data):
+        if data[:4].hex() == selector("capsuleCount()")[2:]:
+            return "0x" + encode(["uint256"], [len(self.capsules)]).hex()
+        if data[:4].hex() == selector("getCapsule(uint256)")[2:]:
+            (capsule_id,) = decode(["uint256"], data[4:])
+            if capsule_id in self.fail_ids:
+                raise ValueError("execution reverted")
+            capsule = self.capsules[capsule_id]
+            return "0x" + encode(CAPSULE_TYPES, [tuple(capsule)]).hex()
+        raise ValueError("unknown selector")
+
+    def _aggregate3(self, data):
+        if not self.multicall:
+            return "0x"  # no code at the address
+        (calls,) = decode(["(address,bool,bytes)[]"], data[4:])
+        results = []
+        for _target, _allow_failure, call_data in calls:
+            try:
+                results.append((True, bytes.fromhex(self._call(call_data)[2:])))
+            except Exception:
+                results.append((False, b""))
+        return "0x" + encode(["(bool,bytes)[]"], [results]).hex()
+
+    def _get_logs(self, log_filter):
+        from_block = int(log_filter["fromBlock"], 16)
+        to_block = int(log_filter["toBlock"], 16)
+        wanted_topics = log_filter.get("topics", [[]])[0]
+        result = []
+        for index, log in enumerate(self.logs):
+            if not from_block <= log["blockNumber"] <= to_block:
+                continue
+            if wanted_topics and log["topics"][0] not in wanted_topics:
+                continue
+            result.append(self._format_log(index, log))
+        return result
+
+    def _format_log(self, index, log):
+        return {
+            "address": CONTRACT_ADDRESS,
+            "blockHash": self.block_hash(log["blockNumber"]),
+            "blockNumber": hex(log["blockNumber"]),
+            "data": log["data"],
+            "logIndex": "0x0",
+            "removed": False,
+            "topics": log["topics"],
+            "transactionHash": "0x" + Web3.keccak(text=f"tx-{index}").hex()[2:],
+            "transactionIndex": "0x0",
+        }
+
+    def _handler(self):
+        node = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                time.sleep(node.delay)
+                batch = isinstance(payload, list)
+                responses = [self._respond(item) for item in (payload if batch else [payload])]
+                body = json.dumps(responses if batch else responses[0]).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _respond(self, item):
+                node.requests.append(item["method"])
+                try:
+                    return {"jsonrpc": "2.0", "id": item["id"], "result": node.handle(item["method"], item["params"])}
+                except Exception as e:
+                    return {"jsonrpc": "2.0", "id": item["id"], "error": {"code": node.error_code, "message": str(e)}}
+
+        return Handler
+
+
+def make_service(node, db_path, **kwargs):
+    db = CapsuleDatabase(db_path)
+    service = BlockchainSyncService(node.url, CONTRACT_ADDRESS, CONTRACT_ABI, db, **kwargs)
+    return db, service
+
+
+def test_incremental_sync_applies_only_log_deltas():
+    node = StandInNode()
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            node.commit_capsule("First", "alpha")
+            node.commit_capsule("Second", "beta")
+            db, service = make_service(node, os.path.join(tmp, "capsules.db"))
+
+            # First sync has no checkpoint and reads every capsule
+            result = service.sync_capsules()
+            assert result["success"], result
+            assert result["new_capsules"] == 2
+            assert db.get_sync_status()["last_synced_block"] == node.block_number
+
+            # An empty block: one log query, no capsule reads
+            node.mine()
+            node.requests.clear()
+            result = service.sync_capsules()
+            assert result["new_capsules"] == 0 and result["updated_capsules"] == 0
+            assert node.requests.count("eth_getLogs") == 1
+            assert node.requests.count("eth_call") == 1  # capsuleCount only
+
+            # One new capsule and one reveal are applied from the logs
+            node.commit_capsule("Third", "gamma")
+            node.reveal_capsule(0, "hello from the past")
+            result = service.sync_capsules()
+            assert result["new_capsules"] == 1
+            assert result["updated_capsules"] == 1
+            assert db.get_capsule(2)["title"] == "Third"
+            revealed = db.get_capsule(0)
+            assert revealed["is_revealed"] == 1
+            assert revealed["decrypted_story"] == "hello from the past"
+            assert db.get_sync_status()["last_synced_block"] == node.block_number
+    finally:
+        node.stop()
+
+
+def test_cold_sync_batches_capsule_reads():
+    node = StandInNode()
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            for i in range(25):
+                node.commit_capsule(f"Capsule {i}", "batch")
+            db, service = make_service(node, os.path.join(tmp, "capsules.db"), batch_size=10)
+
+            node.requests.clear()
+            result = service.sync_capsules()
+            assert result["success"] and result["new_capsules"] == 25, result
+            # capsuleCount + three aggregate3 batches instead of 25 getCapsule calls
+            assert node.requests.count("eth_call") == 4
+            # The head is read once and every call is pinned to it
+            assert node.requests.count("eth_blockNumber") == 1
+            assert set(node.call_blocks) == {hex(node.block_number)}
+            # No deployment block configured: it is looked up and creation blocks are filled in from the logs
+            assert [db.get_capsule(i)["block_number"] for i in range(25)] == list(range(2, 27))
+            capsule = db.get_capsule(24)
+            assert capsule["title"] == "Capsule 24"
+            assert capsule["creator"] == CREATOR
+            assert capsule["encrypted_story"] == b"\x01\x02\x18"
+    finally:
+        node.stop()
+
+
+def test_capsules_record_creation_block_and_transaction():
+    node = StandInNode()
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            for i in range(3):
+                node.commit_capsule(f"Capsule {i}", "provenance")
+            db, service = make_service(node, os.path.join(tmp, "capsules.db"), start_block=1)
+
+            # Backfilled capsules get their mint location from the creation logs
+            assert service.sync_capsules()["success"]
+            node.commit_capsule("Capsule 3", "provenance")
+            assert service.sync_capsules()["success"]
+
+            for i in range(4):
+                capsule = db.get_capsule(i)
+                assert capsule["block_number"] == i + 2
+                assert capsule["transaction_hash"] == "0x" + Web3.keccak(text=f"tx-{i}").hex()[2:]
+
+            # A later re-read of the capsule keeps its provenance
+            node.reveal_capsule(1, "opened")
+            assert service.sync_capsules()["updated_capsules"] == 1
+            assert db.get_capsule(1)["block_number"] == 3
+
+            assert [c["id"] for c in db.get_capsules(from_block=3, to_block=4)] == [2, 1]
+            assert db.get_capsule_count(from_block=4) == 2
+    finally:
+        node.stop()
+
+
+def test_provenance_is_filled_in_for_rows_synced_without_it():
+    node = StandInNode()
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            for _ in range(5):
+                node.mine()
+            node.deploy_block = node.block_number
+            for i in range(3):
+                node.commit_capsule(f"Capsule {i}", "provenance")
+            db_path = os.path.join(tmp, "capsules.db")
+
+            # Without start_block the deployment block is looked up; failing that is reported, not skipped
+            node.fail_methods = {"eth_getCode"}
+            db, service = make_service(node, db_path)
+            result = service.sync_capsules()
+            assert any("deployment block" in error for error in result["errors"]), result
+            assert db.has_capsules_without_provenance()
+            db.close()
+
+            # An existing checkpoint doesn't stop the creation-log scan once the deployment block is known
+            node.fail_methods = set()
+            node.mine()
+            db, service = make_service(node, db_path)
+            assert service.sync_capsules()["success"]
+            assert service.start_block == 6
+            assert [db.get_capsule(i)["block_number"] for i in range(3)] == [7, 8, 9]
+            assert not db.has_capsules_without_provenance()
+            assert db.get_sync_status()["provenance_synced_block"] == node.block_number
+
+            # Nothing missing: no extra log scans or code lookups
+            node.mine()
+            node.requests.clear()
+            service.sync_capsules()
+            assert node.requests.count("eth_getLogs") == 1 and "eth_getCode" not in node.requests
+    finally:
+        node.stop()
+
+
+def test_batch_fetch_falls_back_without_multicall():
+    node = StandInNode(multicall=False)
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            for i in range(3):
+                node.commit_capsule(f"Capsule {i}", "fallback")
+            db, service = make_service(node, os.path.join(tmp, "capsules.db"))
+
+            capsules = service.fetch_capsules_batch(range(3))
+            assert [capsules[i]["title"] for i in range(3)] == ["Capsule 0", "Capsule 1", "Capsule 2"]
+    finally:
+        node.stop()
+
+
+def test_interrupted_backfill_resumes_from_checkpoint():
+    node = StandInNode()
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            for i in range(30):
+                node.commit_capsule(f"Capsule {i}", "resume")
+            db, service = make_service(node, os.path.join(tmp, "capsules.db"), batch_size=10, backfill_workers=3)
+
+            # One capsule in the middle chunk fails: the other chunks are checkpointed
+            node.fail_ids = {15}
+            result = service.sync_capsules()
+            assert result["backfill"]["chunks_failed"] == 1
+            assert not result["backfill"]["complete"]
+            assert db.get_sync_status()["last_synced_block"] == 0
+            assert [c["status"] for c in db.get_backfill_chunks()] == ["done", "pending", "done"]
+
+            # The retry only fetches the unfinished chunk
+            node.fail_ids = set()
+            node.requests.clear()
+            result = service.sync_capsules()
+            assert result["backfill"]["chunks_resumed"] == 2
+            assert result["backfill"]["capsules_fetched"] == 10
+            assert result["backfill"]["capsules_per_second"] > 0
+            assert node.requests.count("eth_call") == 2  # capsuleCount + one aggregate3
+            assert db.get_capsule_count() == 30
+            assert db.get_sync_status()["last_synced_block"] == node.block_number
+            assert db.get_backfill_chunks() == []
+    finally:
+        node.stop()
+
+
+def test_only_due_locked_capsules_are_rechecked():
+    node = StandInNode()
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            now = int(time.time())
+            node.commit_capsule("Due", "past", reveal_time=now - 60)
+            node.commit_capsule("Locked", "future", reveal_time=now + 365 * 24 * 3600)
+            db, service = make_service(node, os.path.join(tmp, "capsules.db"))
+            service.reveal_scheduler.min_interval = 0  # don't wait between checks
+            service.sync_capsules()
+
+            # A reveal whose log we never see is still picked up, because it is due
+            node.reveal_capsule(0, "missed event", emit_log=False)
+
+            # ...even when the first re-check fails, since the capsule stays scheduled
+            store_capsules = service._store_capsules
+            def failing_store(capsules, sync_result):
+                raise RuntimeError("database is locked")
+            service._store_capsules = failing_store
+            assert service.sync_capsules()["errors"]
+            service._store_capsules = store_capsules
+            assert len(service.reveal_scheduler) == 2 and db.get_capsule(0)["decrypted_story"] == ""
+
+            node.requests.clear()
+            result = service.sync_capsules()
+            assert result["rechecked_capsules"] == 1
+            assert db.get_capsule(0)["decrypted_story"] == "missed event"
+            assert len(service.reveal_scheduler) == 1  # only the future capsule is tracked
+
+            # Revealed and future capsules are not fetched again
+            node.mine()
+            node.requests.clear()
+            result = service.sync_capsules()
+            assert result["rechecked_capsules"] == 0
+            assert node.requests.count("eth_call") == 1  # capsuleCount only
+    finally:
+        node.stop()
+
+
+def test_reorg_rolls_back_orphaned_rows():
+    node = StandInNode()
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            node.commit_capsule("Stable", "reorg")
+            node.commit_capsule("Also stable", "reorg")
+            db, service = make_service(node, os.path.join(tmp, "capsules.db"))
+            service.sync_capsules()
+            fork_base = node.snapshot()
+
+            # These two changes end up on an orphaned fork
+            node.commit_capsule("Orphan", "reorg")
+            node.reveal_capsule(0, "orphaned reveal")
+            result = service.sync_capsules()
+            assert db.get_capsule(2)["title"] == "Orphan"
+            assert db.get_capsule(0)["is_revealed"] == 1
+
+            node.reorg_to(fork_base)
+            node.mine()
+            node.commit_capsule("Canonical", "reorg")
+            result = service.sync_capsules()
+            assert result["reorg"]["ancestor_block"] == fork_base[0]
+            assert result["reorg"]["rolled_back_capsules"] == [0, 2]
+            assert db.get_capsule(2)["title"] == "Canonical"
+            assert db.get_capsule(0)["is_revealed"] == 0
+            assert db.get_capsule(0)["decrypted_story"] == ""
+
+            # No reorg: a single block hash comparison and nothing rolled back
+            node.mine()
+            node.requests.clear()
+            result = service.sync_capsules()
+            assert result["reorg"] is None
+            assert node.requests.count("eth_getBlockByNumber") == 2  # reorg check + new checkpoint
+    finally:
+        node.stop()
+
+
+def test_rpc_errors_during_reorg_check_roll_nothing_back():
+    node = StandInNode()
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            node.commit_capsule("Backfilled", "rpc")
+            db, service = make_service(node, os.path.join(tmp, "capsules.db"))
+            service.sync_capsules()
+            node.commit_capsule("From the logs", "rpc")
+            node.mine()
+            service.sync_capsules()
+            checkpoint = db.get_sync_status()["last_synced_block"]
+            events = db.get_capsule_events(0)
+
+            # A failing eth_getBlockByNumber aborts the pass instead of looking like a reorg
+            node.commit_capsule("Later", "rpc")
+            node.fail_methods = {"eth_getBlockByNumber"}
+            result = service.sync_capsules()
+            assert not result["success"] and result["reorg"] is None
+            assert "rate limited" in db.get_sync_status()["sync_errors"]
+            assert db.get_sync_status()["last_synced_block"] == checkpoint
+            assert db.get_capsule_count() == 2 and db.get_capsule_events(0) == events
+            assert len(db.get_journal_blocks()) == 3
+
+            # The retry carries on from the same checkpoint
+            node.fail_methods = set()
+            result = service.sync_capsules()
+            assert result["success"] and result["reorg"] is None and result["new_capsules"] == 1
+            assert [event["capsule_id"] for event in db.get_capsule_events(0)] == [0, 1, 2]
+    finally:
+        node.stop()
+
+
+def test_confirmation_depth_holds_back_recent_blocks():
+    node = StandInNode()
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            node.commit_capsule("Old", "confirm")
+            for _ in range(3):
+                node.mine()
+            db, service = make_service(node, os.path.join(tmp, "capsules.db"), confirmations=3)
+            service.sync_capsules()
+            assert db.get_sync_status()["last_synced_block"] == node.block_number - 3
+
+            node.commit_capsule("Fresh", "confirm")
+            service.sync_capsules()
+            assert db.get_capsule(1) is None
+
+            for _ in range(3):
+                node.mine()
+            service.sync_capsules()
+            assert db.get_capsule(1)["title"] == "Fresh"
+    finally:
+        node.stop()
+
+
+def unused_url():
+    """URL of a local port nothing listens on"""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return f"http://127.0.0.1:{sock.getsockname()[1]}"
+
+
+def test_rpc_pool_fails_over_to_healthy_endpoint():
+    node = StandInNode()
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            node.commit_capsule("Pooled", "pool")
+            dead_url = unused_url()
+            db = CapsuleDatabase(os.path.join(tmp, "capsules.db"))
+            service = BlockchainSyncService([dead_url, node.url], CONTRACT_ADDRESS, CONTRACT_ABI, db)
+
+            result = service.sync_capsules()
+            assert result["success"] and result["new_capsules"] == 1
+
+            endpoints = {e["url"]: e for e in service.get_sync_health()["rpc_endpoints"]}
+            assert endpoints[dead_url]["errors"] >= 1
+            assert endpoints[node.url]["errors"] == 0
+            assert endpoints[node.url]["latency_ms"] is not None
+    finally:
+        node.stop()
+
+
+def test_rpc_pool_hedges_slow_reads():
+    slow, fast = StandInNode(), StandInNode()
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            db = CapsuleDatabase(os.path.join(tmp, "capsules.db"))
+            service = BlockchainSyncService([slow.url, fast.url], CONTRACT_ADDRESS, CONTRACT_ABI, db,
+                                            hedge_after=0.1)
+            # Measure both endpoints so that the soon-to-be-slow one ranks first
+            fast.delay = 0.05
+            service.w3.eth.block_number
+            assert [e["url"] for e in service.get_sync_health()["rpc_endpoints"] if e["latency_ms"]] == [slow.url, fast.url]
+            slow.delay, fast.delay = 1.0, 0
+            fast.requests.clear()
+
+            start = time.time()
+            assert service.w3.eth.block_number == fast.block_number
+            assert time.time() - start < 0.8
+            assert "eth_blockNumber" in fast.requests
+    finally:
+        slow.stop()
+        fast.stop()
+
+
+def test_rpc_pool_sends_traffic_to_a_recovered_endpoint():
+    flaky, steady = StandInNode(), StandInNode()
+    try:
+        provider = PooledHTTPProvider([flaky.url, steady.url], error_cooldown=0.3)
+        flaky.error_code = -32005
+        flaky.fail_methods = {"eth_blockNumber"}
+        steady.delay = 0.02  # so the recovered endpoint is the faster one
+
+        def flaky_stats():
+            return provider.stats()[0]
+
+        # One error is not enough samples to rule an endpoint out
+        assert "result" in provider.make_request("eth_blockNumber", [])
+        assert flaky_stats()["errors"] == 1 and flaky_stats()["healthy"]
+        for _ in range(5):
+            provider.make_request("eth_blockNumber", [])
+        assert not flaky_stats()["healthy"] and flaky_stats()["errors"] == 3
+
+        # Once the cooldown is over the recovered endpoint gets requests again and stays in rotation
+        flaky.fail_methods = set()
+        time.sleep(0.35)
+        flaky.requests.clear()
+        for _ in range(20):
+            provider.make_request("eth_blockNumber", [])
+        assert len(flaky.requests) >= 10, len(flaky.requests)
+        assert flaky_stats()["healthy"]
+    finally:
+        flaky.stop()
+        steady.stop()
+
+
+def test_rpc_pool_hedge_does_not_return_an_early_error():
+    broken, healthy = StandInNode(), StandInNode()
+    try:
+        provider = PooledHTTPProvider([broken.url, healthy.url], hedge_after=0.1)
+        broken.fail_methods = {"eth_blockNumber"}
+        healthy.delay = 0.2
+
+        # The broken endpoint answers first, with an error; the slower healthy answer wins
+        response = provider.make_request("eth_blockNumber", [])
+        assert response["result"] == hex(healthy.block_number)
+        assert provider.stats()[0]["errors"] == 1 and provider.stats()[1]["errors"] == 0
+
+        # With no endpoint able to answer, the error itself comes back for web3 to raise
+        healthy.fail_methods = {"eth_blockNumber"}
+        assert "error" in provider.make_request("eth_blockNumber", [])
+    finally:
+        broken.stop()
+        healthy.stop()
+
+
+def wait_for(condition, timeout=10):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def test_subscription_mode_applies_pushed_logs_and_gap_fills():
+    node = StandInNode()
+    node.start_websocket()
+    service = None
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            node.commit_capsule("Before start", "push")
+            db, service = make_service(node, os.path.join(tmp, "capsules.db"), ws_url=node.ws_url, journal_depth=2)
+            service._sync_interval = 0.2
+            # Never synced yet, so not healthy
+            assert service.get_sync_health()["is_healthy"] is False
+            service.start_sync()
+
+            # Subscribed and gap-filled from the chain
+            assert wait_for(lambda: service.subscription_connected and db.get_capsule(0) is not None)
+            assert service.get_sync_health()["sync_mode"] == "subscription"
+
+            # The checkpoint keeps moving and the journal is pruned while subscribed
+            for _ in range(5):
+                node.mine()
+            assert wait_for(lambda: db.get_sync_status()["last_synced_block"] == node.block_number)
+            # The journal is pruned right after the checkpoint is written
+            assert wait_for(lambda: min(block["block_number"] for block in db.get_journal_blocks()) >= node.block_number - 2)
+            assert service.get_sync_health()["seconds_since_sync"] < 5
+
+            # Pushed events are applied without polling the logs (once the pending
+            # confirmed pass has run, the next one is a long way off)
+            service._sync_interval = 30
+            time.sleep(0.4)
+            polls = node.requests.count("eth_getLogs")
+            node.commit_capsule("Pushed", "push")
+            node.reveal_capsule(0, "pushed reveal")
+            assert wait_for(lambda: db.get_capsule(1) is not None and db.get_capsule(0)["is_revealed"] == 1)
+            assert node.requests.count("eth_getLogs") == polls
+
+            # Events emitted while disconnected are recovered by the gap-fill
+            service._sync_interval = 0.2
+            node.drop_subscribers()
+            assert wait_for(lambda: not service.subscription_connected)
+            node.commit_capsule("Missed while offline", "push")
+            assert wait_for(lambda: db.get_capsule(2) is not None)
+            assert wait_for(lambda: service.subscription_connected)
+    finally:
+        if service:
+            service.stop_sync()
+        node.stop()
+
+
+def test_pushed_logs_the_http_endpoints_cannot_read_yet_are_retried():
+    node = StandInNode()
+    node.start_websocket()
+    service = None
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            node.commit_capsule("Before start", "push")
+            db, service = make_service(node, os.path.join(tmp, "capsules.db"), ws_url=node.ws_url)
+            service._sync_interval = 30  # only pushed logs and their retries apply changes
+            service._pending_retry_interval = 0.1
+            service.start_sync()
+            assert wait_for(lambda: service.subscription_connected and db.get_capsule(0) is not None)
+
+            # The WebSocket node is ahead: the created capsule can't be read over HTTP yet
+            node.fail_ids = {1}
+            node.commit_capsule("Ahead of the pool", "push")
+            node.reveal_capsule(0, "pushed after it")
+            time.sleep(0.5)
+            assert db.get_capsule(1) is None
+            # Later logs wait behind it rather than being applied out of order
+            assert db.get_capsule(0)["is_revealed"] == 0
+            assert service.subscription_connected and len(node.subscribers) == 1
+
+            # Once the pool catches up both are applied, on the same subscription
+            node.fail_ids = set()
+            assert wait_for(lambda: db.get_capsule(1) is not None and db.get_capsule(0)["is_revealed"] == 1)
+            assert service._pending_logs == [] and len(node.subscribers) == 1
+
+            # Wake the idle receive so stopping doesn't wait out the long sync interval
+            service._sync_interval = 0.2
+            node.drop_subscribers()
+    finally:
+        if service:
+            service.stop_sync()
+        node.stop()
+
+
+def test_subscription_mode_keeps_running_the_confirmed_sync():
+    node = StandInNode()
+    node.start_websocket()
+    service = None
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            node.commit_capsule("Checkpointed", "confirmed")
+            while node.block_number < 8:
+                node.mine()
+            db, service = make_service(node, os.path.join(tmp, "capsules.db"), ws_url=node.ws_url, confirmations=3)
+            service.sync_capsules()
+            assert db.get_sync_status()["last_synced_block"] == 5
+
+            # Emitted before we subscribe and within the confirmation depth: neither
+            # pushed nor covered by the gap-fill
+            node.commit_capsule("Just before subscribing", "confirmed")
+            service._sync_interval = 0.2
+            service.start_sync()
+            assert wait_for(lambda: service.subscription_connected)
+            for _ in range(10):
+                node.mine()
+            assert wait_for(lambda: db.get_capsule(1) is not None)
+            assert wait_for(lambda: db.get_sync_status()["last_synced_block"] == node.block_number - 3)
+    finally:
+        if service:
+            service.stop_sync()
+        node.stop()
+
+
+if __name__ == "__main__":
+    test_incremental_sync_applies_only_log_deltas()
+    test_cold_sync_batches_capsule_reads()
+    test_capsules_record_creation_block_and_transaction()
+    test_provenance_is_filled_in_for_rows_synced_without_it()
+    test_batch_fetch_falls_back_without_multicall()
+    test_interrupted_backfill_resumes_from_checkpoint()
+    test_only_due_locked_capsules_are_rechecked()
+    test_reorg_rolls_back_orphaned_rows()
+    test_rpc_errors_during_reorg_check_roll_nothing_back()
+    test_confirmation_depth_holds_back_recent_blocks()
+    test_rpc_pool_fails_over_to_healthy_endpoint()
+    test_rpc_pool_hedges_slow_reads()
+    test_rpc_pool_sends_traffic_to_a_recovered_endpoint()
+    test_rpc_pool_hedge_does_not_return_an_early_error()
+    test_subscription_mode_applies_pushed_logs_and_gap_fills()
+    test_pushed_logs_the_http_endpoints_cannot_read_yet_are_retried()
+    test_subscription_mode_keeps_running_the_confirmed_sync()
+    print("✅ Blockchain sync tests passed")
@@ -0,0 +1,698 @@
+#!/usr/bin/env python3
+"""
+Test the SQLite capsule database layer
+Runs against a throwaway database file, no backend server needed.
+"""
+
+import os
+import sys
+import sqlite3
+import socket
+import tempfile
+import time
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+
+from database import CapsuleDatabase, MIGRATIONS, split_tags
+from serialization import format_capsule
+from event_stream import EventHub, EventServer, format_sse
+
+
+def make_capsule(capsule_id, **overrides):
+    capsule = {
+        "id": capsule_id,
+        "creator": "0x00000000000000000000000000000000000000A1",
+        "title": f"Capsule {capsule_id}",
+        "tags": "test",
+        "encrypted_story": bytes([1, 2, capsule_id % 256]),
+        "decrypted_story": "",
+        "is_revealed": False,
+        "reveal_time": 2000000000,
+        "shutter_identity": f"identity-{capsule_id}",
+        "image_cid": f"cid-{capsule_id}",
+        "block_number": 100,
+        "transaction_hash": None,
+    }
+    capsule.update(overrides)
+    return capsule
+
+
+def make_db(tmp):
+    return CapsuleDatabase(os.path.join(tmp, "capsules.db"))
+
+
+def query_plan(db, sql, params=()):
+    with db.get_connection() as conn:
+        return " | ".join(row["detail"] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params))
+
+
+def test_upsert_capsules_counts_new_and_changed_rows():
+    with tempfile.TemporaryDirectory() as tmp:
+        db = make_db(tmp)
+
+        counts = db.upsert_capsules([make_capsule(i) for i in range(5)])
+        assert counts == {"new": 5, "updated": 0}
+
+        # Same content at a later snapshot block is not a change
+        counts = db.upsert_capsules([make_capsule(i, block_number=200) for i in range(5)])
+        assert counts == {"new": 0, "updated": 0}
+
+        batch = [make_capsule(i) for i in range(6)]
+        batch[2] = make_capsule(2, is_revealed=True, decrypted_story="revealed")
+        counts = db.upsert_capsules(batch)
+        assert counts == {"new": 1, "updated": 1}
+        assert db.get_capsule(2)["decrypted_story"] == "revealed"
+        assert db.get_capsule_count() == 6
+
+
+def test_pooled_connections_use_wal_and_are_reused():
+    with tempfile.TemporaryDirectory() as tmp:
+        db = make_db(tmp)
+        db.upsert_capsules([make_capsule(i) for i in range(3)])
+
+        with db.get_connection() as conn:
+            first = conn
+            assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        with db.get_connection() as conn:
+            assert conn is first
+
+        # A reader sees the last committed state while the sync writer holds a transaction open
+        with db.get_connection() as writer:
+            writer.execute("BEGIN IMMEDIATE")
+            writer.execute("DELETE FROM capsules WHERE id = 0")
+            assert db.get_capsule(0)["title"] == "Capsule 0"
+            assert db.get_capsule_count() == 3
+        # Leaving the block without commit rolls the pooled connection back
+        assert db.get_capsule_count() == 3
+        db.close()
+
+
+def test_migrations_upgrade_legacy_database_in_place():
+    with tempfile.TemporaryDirectory() as tmp:
+        # A capsules.db written before schema versioning: two tables, no indexes
+        conn = sqlite3.connect(os.path.join(tmp, "capsules.db"))
+        conn.execute("""
+            CREATE TABLE capsules (
+                id INTEGER PRIMARY KEY, creator TEXT NOT NULL, title TEXT NOT NULL, tags TEXT NOT NULL,
+                encrypted_story BLOB NOT NULL, decrypted_story TEXT DEFAULT '', is_revealed BOOLEAN DEFAULT 0,
+                reveal_time INTEGER NOT NULL, shutter_identity TEXT NOT NULL, image_cid TEXT NOT NULL,
+                block_number INTEGER, transaction_hash TEXT,
+                created_at INTEGER DEFAULT (strftime('%s', 'now')),
+                updated_at INTEGER DEFAULT (strftime('%s', 'now'))
+            )
+        """)
+        conn.execute("""
+            CREATE TABLE sync_status (
+                id INTEGER PRIMARY KEY CHECK (id = 1), last_synced_block INTEGER DEFAULT 0,
+                last_sync_time INTEGER DEFAULT (strftime('%s', 'now')), total_capsules INTEGER DEFAULT 0,
+                sync_errors TEXT DEFAULT ''
+            )
+        """)
+        conn.execute("INSERT INTO sync_status (id, last_synced_block, total_capsules) VALUES (1, 1234, 1)")
+        conn.execute("""
+            INSERT INTO capsules (id, creator, title, tags, encrypted_story, reveal_time, shutter_identity, image_cid,
+                                  block_number)
+            VALUES (7, '0xabc', 'Old capsule', 'legacy', x'0102', 2000000000, 'identity-7', 'cid-7', 987654)
+        """)
+        conn.commit()
+        conn.close()
+
+        db = make_db(tmp)
+        with db.get_connection() as conn:
+            assert conn.execute("PRAGMA user_version").fetchone()[0] == MIGRATIONS[-1][0]
+            indexes = {row["name"] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+        assert {"idx_capsules_creator_lower", "idx_capsules_created_at", "idx_capsules_revealed_id",
+                "idx_capsules_reveal_time"} <= indexes
+        assert db.get_capsule(7)["title"] == "Old capsule"
+        assert db.get_capsule(7)["creator_lower"] == "0xabc"
+        assert db.get_capsule(7)["encrypted_story_hex"] == "0102"
+        # The old block_number was the chain head at fetch time, not the creation block
+        assert db.get_capsule(7)["block_number"] is None
+        assert db.has_capsules_without_provenance()
+        assert db.get_sync_status()["provenance_synced_block"] == 0
+        assert db.get_sync_status()["last_synced_block"] == 1234
+        assert db.get_sync_status()["last_sync_time"] is not None
+
+        # A new database has no sync time until it first syncs
+        fresh = CapsuleDatabase(os.path.join(tmp, "fresh.db"))
+        assert fresh.get_sync_status()["last_sync_time"] is None
+        fresh.update_sync_status(10, 0)
+        assert fresh.get_sync_status()["last_sync_time"] >= int(time.time()) - 5
+        fresh.close()
+
+        # Reopening is a no-op
+        db.close()
+        assert make_db(tmp).get_capsule_count() == 1
+
+
+def test_hot_queries_use_indexes():
+    with tempfile.TemporaryDirectory() as tmp:
+        db = make_db(tmp)
+
+        plan = query_plan(db, "SELECT * FROM capsules WHERE creator_lower = ? AND id < ? ORDER BY id DESC LIMIT 10",
+                          ("0xabc", 100))
+        assert "USING INDEX idx_capsules_creator_lower (creator_lower=? AND id<?)" in plan, plan
+        assert "TEMP B-TREE" not in plan, plan
+
+        plan = query_plan(db, "SELECT * FROM capsules WHERE created_at > ? ORDER BY created_at DESC LIMIT 10", (0,))
+        assert "USING INDEX idx_capsules_created_at" in plan, plan
+        assert "TEMP B-TREE" not in plan, plan
+
+        plan = query_plan(db, "SELECT * FROM capsules WHERE is_revealed = 1 ORDER BY id DESC LIMIT 10 OFFSET 0")
+        assert "USING INDEX idx_capsules_revealed_id" in plan, plan
+        assert "TEMP B-TREE" not in plan, plan
+
+        plan = query_plan(db, "SELECT id, reveal_time FROM capsules WHERE is_revealed = 0 ORDER BY reveal_time")
+        assert "USING COVERING INDEX idx_capsules_reveal_due" in plan, plan
+
+        plan = query_plan(db, "SELECT * FROM capsules WHERE reveal_time BETWEEN ? AND ?", (0, 1))
+        assert "USING INDEX idx_capsules_reveal_time" in plan, plan
+
+
+def test_search_ranks_full_text_matches_and_tracks_changes():
+    with tempfile.TemporaryDirectory() as tmp:
+        db = make_db(tmp)
+        db.upsert_capsules([
+            make_capsule(1, title="Letter to my future self", tags="family"),
+            make_capsule(2, title="Holiday photos", tags="travel,future"),
+            make_capsule(3, title="Recipes", tags="cooking"),
+        ])
+
+        # Title hits rank above tag hits; the last word matches as a prefix
+        assert [c["id"] for c in db.search_capsules("futu")] == [1, 2]
+        assert db.count_search_results("futu") == 2
+        assert [c["id"] for c in db.search_capsules("letter fut")] == [1]
+        assert db.search_capsules("(*\"") == [] and db.count_search_results("\"") == 0
+
+        # Reveals, re-syncs and rollbacks keep the index current
+        db.mark_capsule_revealed(3, "grandma's secret lasagne")
+        assert [c["id"] for c in db.search_capsules("lasagne")] == [3]
+        db.upsert_capsules([make_capsule(2, title="Beach photos", tags="travel")])
+        assert [c["id"] for c in db.search_capsules("future")] == [1]
+        with db.get_connection() as conn:
+            conn.execute("DELETE FROM capsules WHERE id = 1")
+            conn.commit()
+        assert db.search_capsules("future") == []
+
+        # Address-looking queries match the creator
+        assert len(db.search_capsules("0x0000000000")) == 2
+
+        plan = query_plan(db, "SELECT rowid FROM capsules_fts WHERE capsules_fts MATCH ?", ('"future"*',))
+        assert "VIRTUAL TABLE INDEX" in plan, plan
+
+
+def test_keyset_pages_are_stable_while_capsules_arrive():
+    with tempfile.TemporaryDirectory() as tmp:
+        db = make_db(tmp)
+        db.upsert_capsules([make_capsule(i, is_revealed=i % 2 == 0) for i in range(10)])
+
+        first = db.get_capsules(limit=4)
+        assert [c["id"] for c in first] == [9, 8, 7, 6]
+        # A new capsule shifts offset pages but not keyset pages
+        db.upsert_capsules([make_capsule(10)])
+        assert [c["id"] for c in db.get_capsules(offset=4, limit=4)] == [6, 5, 4, 3]
+        assert [c["id"] for c in db.get_capsules(limit=4, before_id=first[-1]["id"])] == [5, 4, 3, 2]
+        assert [c["id"] for c in db.get_capsules(limit=4, revealed_only=True, before_id=6)] == [4, 2, 0]
+
+        plan = query_plan(db, "SELECT * FROM capsules WHERE is_revealed = 1 AND id < ? ORDER BY id DESC LIMIT 4", (6,))
+        assert "USING INDEX idx_capsules_revealed_id (is_revealed=? AND id<?)" in plan, plan
+        plan = query_plan(db, "SELECT * FROM capsules WHERE id < ? ORDER BY id DESC LIMIT 4", (6,))
+        assert "USING INTEGER PRIMARY KEY (rowid<?)" in plan, plan
+
+
+def test_counters_stay_exact_through_sync_reveal_and_rollback():
+    with tempfile.TemporaryDirectory() as tmp:
+        db = make_db(tmp)
+        db.upsert_capsules([make_capsule(i, is_revealed=i < 3) for i in range(10)])
+        assert db.get_capsule_stats() == {
+            "total_capsules": 10, "revealed_capsules": 3, "unrevealed_capsules": 7, "recent_capsules": 10
+        }
+
+        db.mark_capsule_revealed(5, "opened")
+        db.mark_capsule_revealed(5, "opened")  # re-applying a reveal changes nothing
+        db.upsert_capsules([make_capsule(i, is_revealed=i < 3) for i in range(10, 12)])
+        db.journal_blocks([(200, "0xabc", 11, "created"), (200, "0xabc", 5, "revealed")])
+        db.rollback_journal_after(199)
+
+        stats = db.get_capsule_stats()
+        assert stats["total_capsules"] == db.get_capsule_count() == 11
+        assert stats["revealed_capsules"] == db.get_capsule_count(revealed_only=True) == 3
+        with db.get_connection() as conn:
+            assert conn.execute("SELECT COUNT(*) FROM capsules WHERE is_revealed = 1").fetchone()[0] == 3
+
+        with db.get_connection() as conn:
+            conn.execute("UPDATE capsules SET created_at = created_at - 2 * 86400 WHERE id < 4")
+            conn.commit()
+        assert db.get_capsule_stats(recent_hours=24)["recent_capsules"] == 7
+
+
+def test_tag_index_and_facet_counts():
+    with tempfile.TemporaryDirectory() as tmp:
+        db = make_db(tmp)
+        assert split_tags(" Travel, #family ,travel,, ") == ["travel", "family"]
+
+        db.upsert_capsules([make_capsule(i, tags="travel, family" if i % 2 else "Travel") for i in range(6)])
+        assert db.get_tag_counts() == [{"tag": "travel", "capsule_count": 6}, {"tag": "family", "capsule_count": 3}]
+        assert [c["id"] for c in db.get_capsules_by_tag("FAMILY")] == [5, 3, 1]
+        assert [c["id"] for c in db.get_capsules_by_tag("travel", limit=2, before_id=4)] == [3, 2]
+
+        # Retagging, rollbacks and single-capsule writes keep the index and the counts exact
+        db.upsert_capsules([make_capsule(5, tags="beach")])
+        with db.get_connection() as conn:
+            conn.execute("DELETE FROM capsules WHERE id = 4")
+            conn.commit()
+        db.insert_capsule(make_capsule(3, tags="family"))
+        assert db.get_tag_counts() == [
+            {"tag": "travel", "capsule_count": 3}, {"tag": "family", "capsule_count": 2},
+            {"tag": "beach", "capsule_count": 1}
+        ]
+        assert db.get_tag_counts(tags=["Beach", "nothing"]) == [{"tag": "beach", "capsule_count": 1}]
+        assert db.get_capsule_count() == 5
+
+        # insert_capsule updates in place: no second creation event and created_at is kept
+        with db.get_connection() as conn:
+            conn.execute("UPDATE capsules SET created_at = 1000 WHERE id = 3")
+            conn.commit()
+        seq = db.get_last_event_seq()
+        assert db.insert_capsule(make_capsule(3, tags="family", title="Retitled"))
+        assert db.get_capsule_events(seq) == []
+        capsule = db.get_capsule(3)
+        assert capsule["title"] == "Retitled" and capsule["created_at"] == 1000
+
+        plan = query_plan(db, "SELECT capsule_id FROM capsule_tags WHERE tag = ? AND capsule_id < ? "
+                              "ORDER BY capsule_id DESC LIMIT 10", ("travel", 100))
+        assert "USING PRIMARY KEY (tag=? AND capsule_id<?)" in plan, plan
+        plan = query_plan(db, "SELECT tag, capsule_count FROM tag_counts ORDER BY capsule_count DESC, tag LIMIT 20")
+        assert "USING COVERING INDEX idx_tag_counts_count" in plan and "TEMP B-TREE" not in plan, plan
+
+
+def test_summary_queries_leave_out_ciphertext():
+    with tempfile.TemporaryDirectory() as tmp:
+        db = make_db(tmp)
+        db.upsert_capsules([make_capsule(i, encrypted_story=bytes(1000 + i), tags="summary") for i in range(3)])
+
+        listings = [
+            db.get_capsules(summary=True),
+            db.search_capsules("capsule", summary=True),
+            db.search_capsules("0x00000000", summary=True),
+            db.get_capsules_by_tag("summary", summary=True),
+            db.get_capsules_by_creator("0x00000000000000000000000000000000000000A1", summary=True),
+        ]
+        for capsules in listings:
+            assert len(capsules) == 3
+            assert all("encrypted_story" not in capsule for capsule in capsules)
+            assert sorted(capsule["encrypted_story_size"] for capsule in capsules) == [1000, 1001, 1002]
+        assert db.get_capsules(summary=False)[0]["encrypted_story"] == bytes(1002)
+
+        assert db.get_capsule_ciphertext(1) == bytes(1001)
+        assert db.get_capsule_ciphertext(1, as_hex=True) == bytes(1001).hex()
+        assert db.get_capsule_ciphertext(99) is None
+
+
+def test_creator_lookup_is_case_insensitive_and_counted():
+    with tempfile.TemporaryDirectory() as tmp:
+        db = make_db(tmp)
+        alice = "0xAbCdEf0000000000000000000000000000000001"
+        bob = "0x00000000000000000000000000000000000000B2"
+        db.upsert_capsules([make_capsule(i, creator=alice if i % 3 else bob, is_revealed=i < 2) for i in range(9)])
+
+        for address in (alice, alice.lower(), "abcdef0000000000000000000000000000000001"):
+            assert [c["id"] for c in db.get_capsules_by_creator(address, limit=3)] == [8, 7, 5]
+        assert [c["id"] for c in db.get_capsules_by_creator(alice, limit=3, before_id=5)] == [4, 2, 1]
+        assert db.get_creator_stats(alice.upper().replace("0X", "0x")) == {"capsule_count": 6, "revealed_count": 1}
+        assert db.get_creator_stats(bob) == {"capsule_count": 3, "revealed_count": 1}
+
+        # Reveals, ownership changes and rollbacks move the counters
+        db.mark_capsule_revealed(4, "opened")
+        db.upsert_capsules([make_capsule(3, creator=alice)])
+        with db.get_connection() as conn:
+            conn.execute("DELETE FROM capsules WHERE id = 0")
+            conn.commit()
+        assert db.get_creator_stats(alice) == {"capsule_count": 7, "revealed_count": 2}
+        assert db.get_creator_stats(bob) == {"capsule_count": 1, "revealed_count": 0}
+        assert len(db.search_capsules("0xABCDEF")) == 7
+
+
+def test_writes_from_many_threads_share_commits():
+    with tempfile.TemporaryDirectory() as tmp:
+        db = CapsuleDatabase(os.path.join(tmp, "capsules.db"), commit_window=0.02)
+
+        def writer(first_id):
+            for capsule_id in range(first_id, first_id + 25):
+                assert db.upsert_capsules([make_capsule(capsule_id)]) == {"new": 1, "updated": 0}
+
+        threads = [threading.Thread(target=writer, args=(i * 25,)) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        stats = db.get_writer_stats()
+        assert db.get_capsule_count() == 200 and stats["writes"] == 200
+        assert stats["batches"] < 100, stats
+
+        # A failing write is undone on its own; the rest of its batch commits
+        futures = [db.mark_capsule_revealed(3, "opened", wait=False),
+                   db.upsert_capsules([{"id": 500}], wait=False),
+                   db.upsert_capsules([make_capsule(501)], wait=False)]
+        assert futures[0].result() is True
+        try:
+            futures[1].result()
+            assert False, "expected the malformed capsule to fail"
+        except KeyError:
+            pass
+        assert futures[2].result() == {"new": 1, "updated": 0}
+        assert db.get_capsule(3)["is_revealed"] == 1 and db.get_capsule(501) is not None
+
+        # Fire-and-forget writes are committed by flush() and by close()
+        db.prune_journal(10, wait=False)
+        db.update_sync_status(77, 201, wait=False)
+        db.flush()
+        assert db.get_sync_status()["last_synced_block"] == 77
+        db.update_sync_status(78, 201, wait=False)
+        db.close()
+        assert make_db(tmp).get_sync_status()["last_synced_block"] == 78
+
+
+def test_close_never_strands_a_queued_write():
+    with tempfile.TemporaryDirectory() as tmp:
+        db = CapsuleDatabase(os.path.join(tmp, "capsules.db"), synchronous="full")
+        with db.get_connection() as conn:
+            assert conn.execute("PRAGMA synchronous").fetchone()[0] == 2  # FULL
+
+        # Hold a write between its closed check and its enqueue while close() runs
+        enqueueing = threading.Event()
+        queue_put = db._write_queue.put
+
+        def slow_put(item):
+            if item is not None:
+                enqueueing.set()
+                time.sleep(0.2)
+            queue_put(item)
+
+        db._write_queue.put = slow_put
+        writer = threading.Thread(target=db.update_sync_status, args=(42, 1), daemon=True)
+        writer.start()
+        enqueueing.wait(5)
+        db.close()
+        writer.join(timeout=5)
+        assert not writer.is_alive(), "a write queued during close() was never committed"
+        assert make_db(tmp).get_sync_status()["last_synced_block"] == 42
+        try:
+            db.flush()
+            assert False, "expected writes after close() to be refused"
+        except RuntimeError:
+            pass
+
+
+def test_methods_are_timed_and_slow_statements_logged():
+    with tempfile.TemporaryDirectory() as tmp:
+        db = CapsuleDatabase(os.path.join(tmp, "capsules.db"), slow_query_ms=1000)
+        db.upsert_capsules([make_capsule(i) for i in range(30)])
+        for capsule_id in range(5):
+            db.get_capsule(capsule_id)
+        db.get_capsules(limit=20)
+        db.get_capsule(999)
+
+        metrics = db.get_metrics()
+        assert metrics["methods"]["get_capsule"]["calls"] == 6
+        assert metrics["methods"]["get_capsule"]["rows"] == 5
+        assert metrics["methods"]["get_capsules"]["rows"] == 20
+        assert sum(metrics["methods"]["get_capsule"]["histogram"].values()) == 6
+        assert metrics["methods"]["writer_commit"]["calls"] >= 1
+        assert metrics["slow_queries"] == []
+
+        # Every statement is "slow" at a 0 ms threshold and is logged with its plan
+        db.metrics.slow_query_ms = 0
+        db.get_capsules(limit=5, revealed_only=True)
+        db.mark_capsule_revealed(1, "opened")
+        slow = db.get_metrics()["slow_queries"]
+        listing = next(entry for entry in slow if entry["method"] == "get_capsules")
+        assert "idx_capsules_revealed_id" in " ".join(listing["query_plan"]), listing
+        assert any(entry["method"] == "mark_capsule_revealed" for entry in slow)
+
+
+def test_slow_scans_are_timed_through_their_fetch():
+    with tempfile.TemporaryDirectory() as tmp:
+        db = CapsuleDatabase(os.path.join(tmp, "capsules.db"), slow_query_ms=20)
+        # execute() only steps to the first row; the scan itself happens while fetching
+        scan = """
+            WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < 300000)
+            SELECT i FROM n
+        """
+        with db.get_connection() as conn:
+            cursor = conn.execute(scan)
+            assert db.get_metrics()["slow_queries"] == []
+            assert len(cursor.fetchall()) == 300000
+            assert sum(1 for _ in conn.execute(scan)) == 300000
+            # A cursor abandoned part way still reports the rows it stepped through once closed
+            cursor = conn.execute(scan)
+            assert len(cursor.fetchmany(250000)) == 250000
+            cursor.close()
+            conn.execute("SELECT 1").fetchone()
+            # One dropped unfinished is logged without running EXPLAIN from __del__
+            assert len(conn.execute(scan).fetchmany(250000)) == 250000
+            assert db.get_metrics()["slow_queries"][-1]["query_plan"] == []
+            # One still referenced is finished when the connection is handed back
+            left_open = conn.execute(scan)
+            assert len(left_open.fetchmany(250000)) == 250000
+            assert len(db.get_metrics()["slow_queries"]) == 4
+        assert not conn._open_cursors
+
+        slow = db.get_metrics()["slow_queries"]
+        assert len(slow) == 5, slow
+        assert all(entry["duration_ms"] >= 20 and "WITH RECURSIVE" in entry["sql"] for entry in slow), slow
+        assert slow[-1]["query_plan"], slow[-1]
+
+
+def test_serialized_capsules_use_the_stored_hex_story():
+    with tempfile.TemporaryDirectory() as tmp:
+        db = make_db(tmp)
+        db.upsert_capsules([make_capsule(1, encrypted_story=b"\xde\xad"), make_capsule(2)])
+        db.upsert_capsules([make_capsule(1, encrypted_story=b"\xbe\xef")])
+
+        capsule = db.get_capsule(1)
+        assert capsule["encrypted_story_hex"] == "beef"
+        assert format_capsule(capsule)["encryptedStory"] == "beef"
+        # Every list query serves the same hex, creator lookups included
+        for capsules in (db.get_capsules(), db.get_capsules_by_creator(make_capsule(1)["creator"]),
+                         db.get_capsules_by_tag("test"), db.search_capsules("capsule")):
+            formatted = {row["id"]: format_capsule(row) for row in capsules}
+            assert formatted[1]["encryptedStory"] == "beef" and formatted[2]["encryptedStory"] == "010202"
+        summary = format_capsule(db.get_capsules(summary=True)[0], summary=True)
+        assert summary["encryptedStorySize"] == 3 and "encryptedStory" not in summary
+
+
+def test_batch_lookup_keeps_request_order():
+    with tempfile.TemporaryDirectory() as tmp:
+        db = make_db(tmp)
+        db.upsert_capsules([make_capsule(i) for i in range(10)])
+
+        capsules = db.get_capsules_by_ids([7, 2, 42, 7, 0])
+        assert [capsule["id"] for capsule in capsules] == [7, 2, 0]
+        assert capsules[0]["encrypted_story_hex"] == "010207"
+        summary = db.get_capsules_by_ids([3, 4], summary=True)
+        assert [capsule["encrypted_story_size"] for capsule in summary] == [3, 3]
+        assert db.get_capsules_by_ids([]) == [] and db.get_capsules_by_ids([99]) == []
+        # One primary-key probe per id, not a table scan
+        assert "SCAN" not in query_plan(db, "SELECT * FROM capsules WHERE id IN (?, ?, ?)", (7, 2, 0))
+
+
+def test_export_iterates_everything_in_batches():
+    with tempfile.TemporaryDirectory() as tmp:
+        db = make_db(tmp)
+        db.upsert_capsules([make_capsule(i, block_number=100 + i // 10) for i in range(25)])
+
+        assert [capsule["id"] for capsule in db.iter_capsules(batch_size=7)] == list(range(25))
+        assert [capsule["id"] for capsule in db.iter_capsules(since_id=19, batch_size=5)] == [20, 21, 22, 23, 24]
+        assert [capsule["id"] for capsule in db.iter_capsules(since_block=102)] == [20, 21, 22, 23, 24]
+        assert list(db.iter_capsules(since_id=24)) == []
+        assert all("encrypted_story" not in capsule for capsule in db.iter_capsules(summary=True))
+
+        # Capsules arriving mid-export are picked up by the later batches
+        export = db.iter_capsules(batch_size=10)
+        first = [next(export) for _ in range(10)]
+        db.upsert_capsules([make_capsule(25)])
+        assert [capsule["id"] for capsule in first + list(export)] == list(range(26))
+
+
+def test_data_generation_moves_only_when_capsules_change():
+    with tempfile.TemporaryDirectory() as tmp:
+        db = make_db(tmp)
+        generation = db.data_generation
+
+        db.upsert_capsules([make_capsule(i) for i in range(3)])
+        assert db.data_generation == generation + 1
+
+        # Unchanged capsules and sync bookkeeping leave cached responses valid
+        generation = db.data_generation
+        db.upsert_capsules([make_capsule(i, block_number=200) for i in range(3)])
+        db.update_sync_status(300, 3)
+        db.journal_blocks([(300, "0xabc", None, "checkpoint")])
+        db.mark_capsule_revealed(99, "no such capsule")
+        assert db.data_generation == generation
+
+        db.mark_capsule_revealed(1, "opened")
+        assert db.data_generation == generation + 1
+
+
+def test_capsule_events_are_sequenced_and_pushed_on_commit():
+    with tempfile.TemporaryDirectory() as tmp:
+        db = make_db(tmp)
+        db.upsert_capsules([make_capsule(i) for i in range(3)])
+        hub = EventHub(db, buffer_size=2)
+        assert hub.last_seq == 3
+
+        # Re-syncing unchanged capsules or a revealed one again adds nothing
+        db.mark_capsule_revealed(1, "opened")
+        db.upsert_capsules([make_capsule(i) for i in range(3)] + [make_capsule(1, is_revealed=True, decrypted_story="opened")])
+        db.mark_capsule_revealed(1, "opened")
+        events = db.get_capsule_events(0)
+        assert [(event["seq"], event["event"], event["capsule_id"]) for event in events] == [
+            (1, "capsule_created", 0), (2, "capsule_created", 1), (3, "capsule_created", 2), (4, "capsule_revealed", 1)]
+        assert hub.last_seq == 4
+
+        # The writer's commit refreshes the hub, which tells its listeners
+        notified = threading.Event()
+        hub.add_listener(lambda: notified.set())
+        threading.Timer(0.1, lambda: db.upsert_capsules([make_capsule(3)])).start()
+        assert notified.wait(5) and hub.last_seq == 5
+        events = hub.buffered_events_after(4)
+        assert format_sse(events[0]) == (
+            f"id: 5\nevent: capsule_created\ndata: "
+            f"{{\"seq\":5,\"capsuleId\":3,\"at\":{db.get_capsule_events(4)[0]['created_at']}}}\n\n")
+
+        # Resuming from before the in-memory buffer has to read the table
+        assert [event["seq"] for event in hub.buffered_events_after(3)] == [4, 5]
+        assert hub.buffered_events_after(1) is None
+        assert hub.buffered_events_after(5) == []
+
+        # A capsule rolled back by a reorg is announced as removed
+        db.journal_blocks([(300, "0x" + "ab" * 32, 3, "created")])
+        assert db.rollback_journal_after(299) == [3]
+        assert [(event["event"], event["capsule_id"]) for event in hub.buffered_events_after(5)] == [
+            ("capsule_removed", 3)]
+
+
+def open_event_stream(port, target="/api/events", headers=""):
+    sock = socket.create_connection(("127.0.0.1", port), timeout=5)
+    sock.sendall(f"GET {target} HTTP/1.1\r\nHost: localhost\r\n{headers}\r\n".encode())
+    return sock
+
+
+def read_until(sock, marker):
+    data = b""
+    while marker not in data:
+        chunk = sock.recv(65536)
+        if not chunk:
+            break
+        data += chunk
+    return data
+
+
+def test_event_server_streams_without_a_thread_per_subscriber():
+    with tempfile.TemporaryDirectory() as tmp:
+        db = make_db(tmp)
+        db.upsert_capsules([make_capsule(i) for i in range(3)])
+        hub = EventHub(db, buffer_size=2)
+        server = EventServer(hub, port=0, heartbeat=0.2, allowed_origin="https://capsules.example.org")
+        server.start()
+        try:
+            threads_before = threading.active_count()
+            idle = [open_event_stream(server.port) for _ in range(200)]
+            for sock in idle:
+                head = read_until(sock, b"retry: 5000\n\n")
+                assert head.startswith(b"HTTP/1.1 200 OK") and b"text/event-stream" in head
+            assert server.subscribers == 200
+            assert threading.active_count() <= threads_before + 1
+
+            # A commit reaches every open stream
+            db.upsert_capsules([make_capsule(3)])
+            for sock in idle:
+                assert b"id: 4\nevent: capsule_created\n" in read_until(sock, b"\n\n")
+
+            # Resuming from before the in-memory buffer reads the missed events from the table
+            resumed = open_event_stream(server.port, headers="Last-Event-ID: 1\r\n")
+            assert read_until(resumed, b"id: 4\n").count(b"event: capsule_created") == 3
+            resumed = open_event_stream(server.port, "/api/events?last_event_id=3")
+            data = read_until(resumed, b": keepalive")
+            assert b"id: 4\n" in data and b"id: 3\n" not in data
+
+            assert read_until(open_event_stream(server.port, headers="Last-Event-ID: x\r\n"),
+                              b"}").startswith(b"HTTP/1.1 400")
+            assert read_until(open_event_stream(server.port, "/api/other"), b"}").startswith(b"HTTP/1.1 404")
+            preflight = socket.create_connection(("127.0.0.1", server.port), timeout=5)
+            preflight.sendall(b"OPTIONS /api/events HTTP/1.1\r\nHost: localhost\r\n\r\n")
+            head = read_until(preflight, b"\r\n\r\n")
+            assert head.startswith(b"HTTP/1.1 204") and b"Access-Control-Allow-Methods: GET, OPTIONS" in head
+            assert b"Access-Control-Allow-Origin: https://capsules.example.org" in head
+
+            # Closed clients are noticed at the next heartbeat
+            for sock in idle:
+                sock.close()
+            deadline = time.time() + 5
+            while server.subscribers > 1 and time.time() < deadline:
+                time.sleep(0.05)
+            assert server.subscribers == 1
+        finally:
+            server.stop()
+        # Stopping ends the remaining stream instead of leaving it open
+        resumed.settimeout(5)
+        read_until(resumed, b"not sent")
+        assert server.subscribers == 0
+
+
+def test_old_capsule_events_are_pruned():
+    with tempfile.TemporaryDirectory() as tmp:
+        db = make_db(tmp)
+        db.upsert_capsules([make_capsule(i) for i in range(3)])
+
+        def backdate(seq):
+            conn = sqlite3.connect(db.db_path)
+            conn.execute("UPDATE capsule_events SET created_at = created_at - 8 * 86400 WHERE seq <= ?", (seq,))
+            conn.commit()
+            conn.close()
+
+        backdate(2)
+        generation = db.data_generation
+        assert db.prune_capsule_events(int(time.time()) - 7 * 86400)
+        assert [event["seq"] for event in db.get_capsule_events(0)] == [3]
+        assert db.data_generation == generation
+
+        # The sequence carries on past pruned events
+        assert db.prune_capsule_events(int(time.time()) + 1)
+        assert db.get_capsule_events(0) == [] and db.get_last_event_seq() == 3
+        db.upsert_capsules([make_capsule(3)])
+        backdate(4)
+
+        # The hub prunes past its retention window on its first refresh, then hourly
+        hub = EventHub(db, retention=7 * 86400)
+        assert hub.last_seq == 4
+        db.upsert_capsules([make_capsule(4)])
+        db.flush()
+        assert [event["seq"] for event in db.get_capsule_events(0)] == [5]
+        assert hub._next_prune > time.time() + 3000
+
+if __name__ == "__main__":
+    test_upsert_capsules_counts_new_and_changed_rows()
+    test_pooled_connections_use_wal_and_are_reused()
+    test_migrations_upgrade_legacy_database_in_place()
+    test_hot_queries_use_indexes()
+    test_search_ranks_full_text_matches_and_tracks_changes()
+    test_keyset_pages_are_stable_while_capsules_arrive()
+    test_counters_stay_exact_through_sync_reveal_and_rollback()
+    test_tag_index_and_facet_counts()
+    test_summary_queries_leave_out_ciphertext()
+    test_creator_lookup_is_case_insensitive_and_counted()
+    test_writes_from_many_threads_share_commits()
+    test_close_never_strands_a_queued_write()
+    test_methods_are_timed_and_slow_statements_logged()
+    test_slow_scans_are_timed_through_their_fetch()
+    test_serialized_capsules_use_the_stored_hex_story()
+    test_batch_lookup_keeps_request_order()
+    test_export_iterates_everything_in_batches()
+    test_data_generation_moves_only_when_capsules_change()
+    test_capsule_events_are_sequenced_and_pushed_on_commit()
+    test_event_server_streams_without_a_thread_per_subscriber()
+    test_old_capsule_events_are_pruned()
+    print("✅ Database tests passed")